@@ -11,7 +11,10 @@
 Tests for kernel messages to find if there were any issues in them.
 """
 
+import os
 import re
+import threading
+import time
 
 lockdep_messages = [
   'possible circular locking dependency',
@@ -29,3 +32,124 @@ def check_kernel(logfile):
         if issue.match(line):
             return False
     return True
+
+kmsg_escape = re.compile(r'\\x([0-9a-f]{2})')
+test_marker = re.compile(r'(TEST-START|TEST-STOP) (\S+)')
+
+def parse_kmsg(record):
+    """Return (timestamp in usec, message) of a /dev/kmsg record"""
+    hdr, sep, text = record.partition(';')
+    fields = hdr.split(',')
+    if not sep or len(fields) < 3:
+        return None
+    # Continuation lines (device properties) start with a space
+    text = text.split('\n')[0]
+    text = kmsg_escape.sub(lambda m: chr(int(m.group(1), 16)), text)
+    return int(fields[2]), text
+
+class KmsgWatcher(object):
+    """Reads /dev/kmsg in a background thread and checks each kernel
+    message as it arrives
+
+    The messages are collected in the same format as dmesg prints them
+    until finish() is called for the test case, so this replaces running
+    dmesg -c after each test case. Issues are attributed to the test case
+    with the TEST-START/TEST-STOP markers that run-tests.py writes into the
+    kernel log: each hit is recorded as happening before, during, or after
+    the test case."""
+
+    def __init__(self):
+        self.fd = os.open('/dev/kmsg', os.O_RDONLY)
+        # Only messages from now on are of interest
+        os.lseek(self.fd, 0, os.SEEK_END)
+        self.cond = threading.Condition()
+        self.lines = []
+        self.hits = []
+        self.test = None
+        self.phase = 'before'
+        self.sync_seen = set()
+        self.sync_id = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="kmsg")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                record = os.read(self.fd, 8192)
+            except BrokenPipeError:
+                # Messages were overwritten before they could be read
+                with self.cond:
+                    self.lines.append('kmsg: messages lost\n')
+                continue
+            except OSError:
+                break
+            msg = parse_kmsg(record.decode(errors='replace'))
+            if msg:
+                self._process(*msg)
+
+    def _process(self, ts, text):
+        with self.cond:
+            if text.startswith('KMSG-SYNC '):
+                self.sync_seen.add(text.split(' ')[1])
+                self.cond.notify_all()
+                return
+            line = '[%5d.%06d] %s\n' % (ts // 1000000, ts % 1000000, text)
+            self.lines.append(line)
+            m = test_marker.match(text)
+            if m:
+                self.test = m.group(2)
+                self.phase = 'during' if m.group(1) == 'TEST-START' else 'after'
+            elif issue.match(line):
+                self.hits.append((self.test, self.phase, line.strip()))
+
+    def sync(self, timeout=2):
+        """Wait until all the messages logged before this call have been
+        processed"""
+        with self.cond:
+            self.sync_id += 1
+            token = '%d-%d' % (os.getpid(), self.sync_id)
+        with open('/dev/kmsg', 'w') as f:
+            f.write('KMSG-SYNC %s\n' % token)
+        end = time.time() + timeout
+        with self.cond:
+            while token not in self.sync_seen:
+                remaining = end - time.time()
+                if remaining <= 0 or not self.thread.is_alive():
+                    return False
+                self.cond.wait(remaining)
+            self.sync_seen.discard(token)
+        return True
+
+    def finish(self, testname, output=None):
+        """Complete the kernel log of a test case and return the issues
+        found in it as a list of (phase, line) tuples; the phase is relative
+        to the TEST-START/TEST-STOP markers of the test case"""
+        self.sync()
+        with self.cond:
+            lines = self.lines
+            hits = self.hits
+            self.lines = []
+            self.hits = []
+            self.phase = 'before'
+        if output:
+            with open(output, 'w') as f:
+                f.writelines(lines)
+        res = []
+        for test, phase, line in hits:
+            if test != testname:
+                phase = 'before'
+            res.append((phase, line))
+        return res
+
+    def close(self):
+        self.stopped = True
+        try:
+            # Wake up the reader thread
+            with open('/dev/kmsg', 'w') as f:
+                f.write('KMSG-SYNC close\n')
+        except OSError:
+            pass
+        self.thread.join(1)
+        os.close(self.fd)
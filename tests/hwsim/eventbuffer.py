@@ -0,0 +1,156 @@
+# Indexed buffer for control interface monitor events
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import collections
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger()
+
+# Event name following the optional IFNAME= prefix and the <level> marker,
+# e.g., CTRL-EVENT-CONNECTED, AP-STA-CONNECTED, or P2P-GROUP-STARTED
+event_name_re = re.compile(r'(?:IFNAME=\S+ )?(?:<\d+>)?([A-Z0-9][A-Z0-9-]*)')
+event_prefix_re = re.compile(r'[A-Z0-9]+(?:-[A-Z0-9]*)+')
+
+Event = collections.namedtuple('Event', ['seq', 'time', 'name', 'msg'])
+
+class EventBuffer:
+    """Sequence numbered history of events received from a monitor socket
+
+    Each received event gets a sequence number and a timestamp and it is
+    indexed by its event name. Events are consumed in order by the normal
+    wait_event() path while events that were already consumed (e.g., by
+    dump_monitor()) remain available for matching with an explicit since=
+    sequence number until they are trimmed from the history."""
+
+    def __init__(self, history=1000):
+        self.history = history
+        self.events = collections.deque()
+        self.index = {}
+        self.seq = 0
+        self.consumed = 0
+
+    def add(self, msg):
+        self.seq += 1
+        m = event_name_re.match(msg)
+        name = m.group(1) if m else ''
+        ev = Event(self.seq, time.time(), name, msg)
+        self.events.append(ev)
+        if name not in self.index:
+            self.index[name] = collections.deque()
+        self.index[name].append(ev)
+        self._trim()
+        return ev
+
+    def _trim(self):
+        while len(self.events) > self.history and \
+              self.events[0].seq <= self.consumed:
+            ev = self.events.popleft()
+            idx = self.index[ev.name]
+            idx.popleft()
+            if not idx:
+                del self.index[ev.name]
+
+    def unconsumed(self):
+        return self.seq - self.consumed
+
+    def next(self):
+        if self.consumed >= self.seq:
+            return None
+        ev = self.events[self.consumed + 1 - self.events[0].seq]
+        self.consumed = ev.seq
+        self._trim()
+        return ev
+
+    def consume(self, seq):
+        if seq > self.consumed:
+            self.consumed = min(seq, self.seq)
+            self._trim()
+
+    def _candidates(self, pattern, since):
+        if event_prefix_re.fullmatch(pattern):
+            res = []
+            idx = self.index.get(pattern)
+            if idx is not None:
+                res.extend(idx)
+            else:
+                for name, idx in self.index.items():
+                    if name.startswith(pattern):
+                        res.extend(idx)
+                res.sort(key=lambda ev: ev.seq)
+        else:
+            # Not an event name prefix, so need to look at the full messages
+            res = self.events
+        return [ev for ev in res if ev.seq > since]
+
+    def find(self, events, since=0):
+        """Return the oldest buffered event newer than since that matches"""
+        found = None
+        for pattern in events:
+            for ev in self._candidates(pattern, since):
+                if found and ev.seq >= found.seq:
+                    break
+                if pattern in ev.msg:
+                    found = ev
+                    break
+        return found
+
+def monitor_events(mon):
+    buf = getattr(mon, 'event_buffer', None)
+    if buf is None:
+        buf = EventBuffer()
+        mon.event_buffer = buf
+    return buf
+
+def next_event(mon, dbg, timeout=0):
+    buf = monitor_events(mon)
+    ev = buf.next()
+    if ev is None and mon.pending(timeout=timeout):
+        msg = mon.recv()
+        logger.debug(dbg + msg)
+        buf.add(msg)
+        ev = buf.next()
+    return ev
+
+def read_pending(mon, dbg):
+    buf = monitor_events(mon)
+    while mon.pending():
+        msg = mon.recv()
+        logger.debug(dbg + msg)
+        buf.add(msg)
+    return buf.seq
+
+def dump_events(mon, dbg):
+    count = 0
+    while next_event(mon, dbg):
+        count += 1
+    return count
+
+def wait_event(mon, dbg, events, timeout, since=None):
+    if since is not None:
+        read_pending(mon, dbg)
+        buf = monitor_events(mon)
+        ev = buf.find(events, since)
+        if ev:
+            buf.consume(ev.seq)
+            return ev.msg
+    start = os.times()[4]
+    while True:
+        while True:
+            ev = next_event(mon, dbg)
+            if ev is None:
+                break
+            for event in events:
+                if event in ev.msg:
+                    return ev.msg
+        now = os.times()[4]
+        remaining = start + timeout - now
+        if remaining <= 0:
+            break
+        if not mon.pending(timeout=remaining):
+            break
+    return None
@@ -0,0 +1,147 @@
+# IEEE 802.11 frame, element, and EAPOL decoding helpers
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import struct
+
+WLAN_EID_VENDOR_SPECIFIC = 221
+WLAN_EID_EXTENSION = 255
+
+def mac_str(addr):
+    return "%02x:%02x:%02x:%02x:%02x:%02x" % tuple(addr[0:6])
+
+def parse_mgmt_header(frame, msg=None):
+    """Decode the 24-octet management frame header into msg (a dict)"""
+    if msg is None:
+        msg = {}
+    view = memoryview(frame)
+    fc, duration = struct.unpack_from('<HH', view, 0)
+    msg['fc'] = fc
+    msg['subtype'] = (fc >> 4) & 0xf
+    msg['duration'] = duration
+    msg['da'] = mac_str(view[4:10])
+    msg['sa'] = mac_str(view[10:16])
+    msg['bssid'] = mac_str(view[16:22])
+    msg['seq_ctrl'] = struct.unpack_from('<H', view, 22)[0]
+    msg['payload'] = bytes(view[24:])
+    return msg
+
+class Elements:
+    """Index of the elements in a buffer keyed by EID or (255, ext-EID)
+
+    The buffer is walked only once, on the first lookup, and the values
+    are copied out of it only when they are accessed."""
+
+    def __init__(self, buf):
+        self.view = memoryview(buf)
+        self._index = None
+        self._order = None
+        self.truncated = False
+
+    def _build(self):
+        index = {}
+        order = []
+        view = self.view
+        pos = 0
+        end = len(view)
+        while end - pos >= 2:
+            eid = view[pos]
+            elen = view[pos + 1]
+            pos += 2
+            if elen > end - pos:
+                self.truncated = True
+                break
+            key = eid
+            start = pos
+            if eid == WLAN_EID_EXTENSION and elen >= 1:
+                key = (eid, view[pos])
+            index.setdefault(key, []).append((start, pos + elen))
+            order.append((key, start, pos + elen))
+            pos += elen
+        self._index = index
+        self._order = order
+
+    def _spans(self, eid, ext=None):
+        if self._index is None:
+            self._build()
+        key = eid if ext is None else (WLAN_EID_EXTENSION, ext)
+        return self._index.get(key, [])
+
+    def __contains__(self, eid):
+        if isinstance(eid, tuple):
+            return len(self._spans(eid[0], eid[1])) > 0
+        return len(self._spans(eid)) > 0
+
+    def get(self, eid, ext=None):
+        """Return the body of the first matching element (ext-EID included
+        for extension elements) or None"""
+        spans = self._spans(eid, ext)
+        if not spans:
+            return None
+        start, end = spans[0]
+        return bytes(self.view[start:end])
+
+    def get_all(self, eid, ext=None):
+        return [bytes(self.view[start:end])
+                for start, end in self._spans(eid, ext)]
+
+    def vendor(self, oui_type):
+        """Return the bodies of vendor specific elements whose body starts
+        with oui_type (e.g., b'\\x50\\x6f\\x9a\\x09'), without that prefix"""
+        res = []
+        for start, end in self._spans(WLAN_EID_VENDOR_SPECIFIC):
+            if self.view[start:end].tobytes().startswith(oui_type):
+                res.append(bytes(self.view[start + len(oui_type):end]))
+        return res
+
+    def items(self):
+        if self._order is None:
+            self._build()
+        return [(key, bytes(self.view[start:end]))
+                for key, start, end in self._order]
+
+    def to_dict(self):
+        # Same semantics as the old parse_ie(): the last element with a
+        # given EID wins and extension elements are keyed by EID 255.
+        ret = {}
+        if self._order is None:
+            self._build()
+        for key, start, end in self._order:
+            eid = key[0] if isinstance(key, tuple) else key
+            ret[eid] = bytes(self.view[start:end])
+        return ret
+
+def parse_eapol(data):
+    view = memoryview(data)
+    (version, type, length) = struct.unpack_from('>BBH', view, 0)
+    payload = view[4:]
+    if length > len(payload):
+        raise Exception("Invalid EAPOL length")
+    if length < len(payload):
+        payload = payload[0:length]
+    eapol = {}
+    eapol['version'] = version
+    eapol['type'] = type
+    eapol['length'] = length
+    eapol['payload'] = bytes(payload)
+    if type == 3:
+        # EAPOL-Key
+        eapol['descr_type'] = payload[0]
+        payload = payload[1:]
+        if eapol['descr_type'] == 2 or eapol['descr_type'] == 254:
+            # RSN EAPOL-Key
+            (key_info, key_len) = struct.unpack_from('>HH', payload, 0)
+            eapol['rsn_key_info'] = key_info
+            eapol['rsn_key_len'] = key_len
+            eapol['rsn_replay_counter'] = bytes(payload[4:12])
+            eapol['rsn_key_nonce'] = bytes(payload[12:44])
+            eapol['rsn_key_iv'] = bytes(payload[44:60])
+            eapol['rsn_key_rsc'] = bytes(payload[60:68])
+            eapol['rsn_key_id'] = bytes(payload[68:76])
+            eapol['rsn_key_mic'] = bytes(payload[76:92])
+            payload = payload[92:]
+            (eapol['rsn_key_data_len'],) = struct.unpack_from('>H', payload, 0)
+            payload = payload[2:]
+            eapol['rsn_key_data'] = bytes(payload)
+    return eapol
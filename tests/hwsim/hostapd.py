@@ -15,6 +15,9 @@ import wpaspy
 import remotehost
 import utils
 import subprocess
+import eventbuffer
+import frames
+import instrument
 from remotectrl import RemoteCtrl
 
 logger = logging.getLogger()
@@ -25,7 +28,7 @@ def mac2tuple(mac):
     return struct.unpack('6B', binascii.unhexlify(mac.replace(':', '')))
 
 class HostapdGlobal:
-    def __init__(self, apdev=None, global_ctrl_override=None):
+    def __init__(self, apdev=None, global_ctrl_override=None, monitor=True):
         try:
             hostname = apdev['hostname']
             port = apdev['port']
@@ -41,12 +44,14 @@ class HostapdGlobal:
         self.hostname = hostname
         self.port = port
         self.remote_cli = remote_cli
+        self.mon = None
         if hostname is None:
             global_ctrl = hapd_global
             if global_ctrl_override:
                 global_ctrl = global_ctrl_override
             self.ctrl = wpaspy.Ctrl(global_ctrl)
-            self.mon = wpaspy.Ctrl(global_ctrl)
+            if monitor:
+                self.mon = wpaspy.Ctrl(global_ctrl)
             self.dbg = ""
         else:
             if remote_cli:
@@ -54,13 +59,16 @@ class HostapdGlobal:
                 if global_ctrl_override:
                     global_ctrl = global_ctrl_override
                 self.ctrl = RemoteCtrl(global_ctrl, port, hostname=hostname)
-                self.mon = RemoteCtrl(global_ctrl, port, hostname=hostname)
+                if monitor:
+                    self.mon = RemoteCtrl(global_ctrl, port, hostname=hostname)
                 self.dbg = hostname + "/global"
             else:
                 self.ctrl = wpaspy.Ctrl(hostname, port)
-                self.mon = wpaspy.Ctrl(hostname, port)
+                if monitor:
+                    self.mon = wpaspy.Ctrl(hostname, port)
                 self.dbg = hostname + "/" + str(port)
-        self.mon.attach()
+        if self.mon:
+            self.mon.attach()
 
     def cmd_execute(self, cmd_array, shell=False):
         if self.hostname is None:
@@ -80,22 +88,12 @@ class HostapdGlobal:
         logger.debug(self.dbg + ": CTRL(global): " + cmd)
         return self.ctrl.request(cmd, timeout)
 
+    def ping(self):
+        return "PONG" in self.request("PING")
+
     def wait_event(self, events, timeout):
-        start = os.times()[4]
-        while True:
-            while self.mon.pending():
-                ev = self.mon.recv()
-                logger.debug(self.dbg + "(global): " + ev)
-                for event in events:
-                    if event in ev:
-                        return ev
-            now = os.times()[4]
-            remaining = start + timeout - now
-            if remaining <= 0:
-                break
-            if not self.mon.pending(timeout=remaining):
-                break
-        return None
+        return eventbuffer.wait_event(self.mon, self.dbg + "(global): ",
+                                      events, timeout)
 
     def add(self, ifname, driver=None):
         cmd = "ADD " + ifname + " " + hapd_ctrl
@@ -153,10 +151,19 @@ class HostapdGlobal:
         words = line.split(":")
         return int(words[1])
 
+    def close(self):
+        if self.mon:
+            self.mon.close()
+            self.mon = None
+        if self.ctrl:
+            self.ctrl.close()
+            self.ctrl = None
+
     def terminate(self):
-        self.mon.detach()
-        self.mon.close()
-        self.mon = None
+        if self.mon:
+            self.mon.detach()
+            self.mon.close()
+            self.mon = None
         self.ctrl.terminate()
         self.ctrl = None
 
@@ -235,21 +242,36 @@ class Hostapd:
     def ping(self):
         return "PONG" in self.request("PING")
 
+    def pipeline(self, cmds):
+        for cmd in cmds:
+            logger.debug(self.dbg + ": CTRL: " + cmd)
+        return self.ctrl.pipeline(cmds)
+
+    def _set_failed(self, field, value):
+        if "TKIP" in value and (field == "wpa_pairwise" or \
+                                field == "rsn_pairwise"):
+            raise utils.HwsimSkip("Cipher TKIP not supported")
+        raise Exception("Failed to set hostapd parameter " + field)
+
     def set(self, field, value):
         if "OK" not in self.request("SET " + field + " " + value):
-            if "TKIP" in value and (field == "wpa_pairwise" or \
-                                    field == "rsn_pairwise"):
-                raise utils.HwsimSkip("Cipher TKIP not supported")
-            raise Exception("Failed to set hostapd parameter " + field)
+            self._set_failed(field, value)
+
+    def set_params(self, params):
+        cmds = ["SET " + field + " " + value for field, value in params]
+        for (field, value), res in zip(params, self.pipeline(cmds)):
+            if "OK" not in res:
+                self._set_failed(field, value)
 
     def set_defaults(self, set_channel=True):
-        self.set("driver", "nl80211")
+        params = [("driver", "nl80211")]
         if set_channel:
-            self.set("hw_mode", "g")
-            self.set("channel", "1")
-            self.set("ieee80211n", "1")
-        self.set("logger_stdout", "-1")
-        self.set("logger_stdout_level", "0")
+            params += [("hw_mode", "g"),
+                       ("channel", "1"),
+                       ("ieee80211n", "1")]
+        params += [("logger_stdout", "-1"),
+                   ("logger_stdout_level", "0")]
+        self.set_params(params)
 
     def set_open(self, ssid):
         self.set_defaults()
@@ -298,28 +320,22 @@ class Hostapd:
             raise Exception("Failed to remove hostapd link " + self.ifname)
 
     def dump_monitor(self):
-        while self.mon.pending():
-            ev = self.mon.recv()
-            logger.debug(self.dbg + ": " + ev)
+        eventbuffer.dump_events(self.mon, self.dbg + ": ")
 
-    def wait_event(self, events, timeout):
+    def wait_event(self, events, timeout, since=None):
         if not isinstance(events, list):
             raise Exception("Hostapd.wait_event() called with incorrect events argument type")
-        start = os.times()[4]
-        while True:
-            while self.mon.pending():
-                ev = self.mon.recv()
-                logger.debug(self.dbg + ": " + ev)
-                for event in events:
-                    if event in ev:
-                        return ev
-            now = os.times()[4]
-            remaining = start + timeout - now
-            if remaining <= 0:
-                break
-            if not self.mon.pending(timeout=remaining):
-                break
-        return None
+        if not instrument.enabled:
+            return eventbuffer.wait_event(self.mon, self.dbg + ": ", events,
+                                          timeout, since=since)
+        start = time.perf_counter()
+        ev = eventbuffer.wait_event(self.mon, self.dbg + ": ", events,
+                                    timeout, since=since)
+        instrument.wait_done(events, start, timeout, ev)
+        return ev
+
+    def mark_events(self):
+        return eventbuffer.read_pending(self.mon, self.dbg + ": ")
 
     def wait_sta(self, addr=None, timeout=2, wait_4way_hs=False):
         ev = self.wait_event(["AP-STA-CONNECT"], timeout=timeout)
@@ -411,20 +427,7 @@ class Hostapd:
         frame = binascii.unhexlify(ev.split(' ')[1])
         msg['frame'] = frame
 
-        hdr = struct.unpack('<HH6B6B6BH', frame[0:24])
-        msg['fc'] = hdr[0]
-        msg['subtype'] = (hdr[0] >> 4) & 0xf
-        hdr = hdr[1:]
-        msg['duration'] = hdr[0]
-        hdr = hdr[1:]
-        msg['da'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['sa'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['bssid'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['seq_ctrl'] = hdr[0]
-        msg['payload'] = frame[24:]
+        frames.parse_mgmt_header(frame, msg)
 
         return msg
 
@@ -697,17 +700,19 @@ def add_ap(apdev, params, wait_enabled=True, no_enable=False, timeout=30,
                   "wpa", "wpa_deny_ptk0_rekey",
                   "wpa_pairwise", "rsn_pairwise", "auth_server_addr",
                   "acct_server_addr"]
+        conf = []
         for field in fields:
             if field in params:
-                hapd.set(field, params[field])
+                conf.append((field, params[field]))
         for f, v in list(params.items()):
             if f in fields:
                 continue
             if isinstance(v, list):
                 for val in v:
-                    hapd.set(f, val)
+                    conf.append((f, val))
             else:
-                hapd.set(f, v)
+                conf.append((f, v))
+        hapd.set_params(conf)
         if no_enable:
             return hapd
         hapd.enable()
@@ -12,23 +12,40 @@ import netlink, os
 # constants
 HWSIM_CMD_CREATE_RADIO = 4
 HWSIM_CMD_DESTROY_RADIO = 5
+HWSIM_CMD_GET_RADIO = 6
 
 HWSIM_ATTR_CHANNELS = 9
 HWSIM_ATTR_RADIO_ID = 10
 HWSIM_ATTR_SUPPORT_P2P_DEVICE = 14
 HWSIM_ATTR_USE_CHANCTX = 15
+HWSIM_ATTR_RADIO_NAME = 17
 HWSIM_ATTR_MLO_SUPPORT = 25
 HWSIM_ATTR_NAN_SUPPORT = 30
 
+NL80211_CMD_GET_WIPHY = 1
+NL80211_CMD_GET_INTERFACE = 5
+
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_WIPHY_NAME = 2
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_SPLIT_WIPHY_DUMP = 174
+
+def _genl_attrs(msg):
+    return netlink.parse_attributes(msg.payload[4:])
+
+def _genl_str(attr):
+    return attr.str().split(b'\0')[0].decode()
+
 # the controller class
 class HWSimController(object):
     def __init__(self):
         self._conn = netlink.Connection(netlink.NETLINK_GENERIC)
         self._fid = netlink.genl_controller.get_family_id(b'MAC80211_HWSIM')
 
-    def create_radio(self, n_channels=None, use_chanctx=False,
-                     use_p2p_device=False, use_mlo=False,
-                     use_nan=False):
+    def _create_radio_msg(self, n_channels=None, use_chanctx=False,
+                          use_p2p_device=False, use_mlo=False,
+                          use_nan=False):
         attrs = []
         if n_channels:
             attrs.append(netlink.U32Attr(HWSIM_ATTR_CHANNELS, n_channels))
@@ -42,49 +59,148 @@ class HWSimController(object):
         if use_nan:
             attrs.append(netlink.FlagAttr(HWSIM_ATTR_NAN_SUPPORT))
 
-        msg = netlink.GenlMessage(self._fid, HWSIM_CMD_CREATE_RADIO,
-                                  flags=netlink.NLM_F_REQUEST |
-                                        netlink.NLM_F_ACK,
-                                  attrs=attrs)
+        return netlink.GenlMessage(self._fid, HWSIM_CMD_CREATE_RADIO,
+                                   flags=netlink.NLM_F_REQUEST |
+                                         netlink.NLM_F_ACK,
+                                   attrs=attrs)
+
+    def _destroy_radio_msg(self, radio_id):
+        attrs = [netlink.U32Attr(HWSIM_ATTR_RADIO_ID, radio_id)]
+        return netlink.GenlMessage(self._fid, HWSIM_CMD_DESTROY_RADIO,
+                                   flags=netlink.NLM_F_REQUEST |
+                                         netlink.NLM_F_ACK,
+                                   attrs=attrs)
+
+    def create_radio(self, n_channels=None, use_chanctx=False,
+                     use_p2p_device=False, use_mlo=False,
+                     use_nan=False):
+        msg = self._create_radio_msg(n_channels=n_channels,
+                                     use_chanctx=use_chanctx,
+                                     use_p2p_device=use_p2p_device,
+                                     use_mlo=use_mlo, use_nan=use_nan)
         return msg.send_and_recv(self._conn).ret
 
     def destroy_radio(self, radio_id):
-        attrs = [netlink.U32Attr(HWSIM_ATTR_RADIO_ID, radio_id)]
-        msg = netlink.GenlMessage(self._fid, HWSIM_CMD_DESTROY_RADIO,
-                                  flags=netlink.NLM_F_REQUEST |
-                                        netlink.NLM_F_ACK,
-                                  attrs=attrs)
+        msg = self._destroy_radio_msg(radio_id)
         msg.send_and_recv(self._conn)
 
-class HWSimRadio(object):
-    def __init__(self, n_channels=None, use_chanctx=False,
-                 use_p2p_device=False, use_mlo=False,
-                 use_nan=False):
-        self._controller = HWSimController()
-        self._n_channels = n_channels
-        self._use_chanctx = use_chanctx
-        self._use_p2p_dev = use_p2p_device
-        self._use_mlo = use_mlo
-        self._use_nan = use_nan
+    def create_radios(self, count, **kwargs):
+        """Create count radios with the create_radio() parameters in one
+        batch and return their radio IDs. If any of the radios cannot be
+        created, the ones that were created are destroyed."""
+        msgs = [self._create_radio_msg(**kwargs) for i in range(count)]
+        ids = [ack.ret for ack in self._conn.send_and_recv_acks(msgs)]
+        errors = [i for i in ids if i < 0]
+        if errors:
+            self.destroy_radios([i for i in ids if i >= 0])
+            raise Exception("Failed to create %d of %d radios (err:%d)" %
+                            (len(errors), count, errors[0]))
+        return ids
+
+    def destroy_radios(self, radio_ids):
+        """Destroy radios in one batch; return the error codes"""
+        msgs = [self._destroy_radio_msg(radio_id) for radio_id in radio_ids]
+        return [ack.ret for ack in self._conn.send_and_recv_acks(msgs)]
+
+    def get_ifnames(self, radio_ids):
+        """Return a dict mapping the radio IDs to their network interface
+        names. This uses three netlink dumps regardless of the number of
+        radios: the hwsim radio list for the wiphy names, and the nl80211
+        wiphy and interface lists."""
+        wiphy_names = {}
+        msg = netlink.GenlMessage(self._fid, HWSIM_CMD_GET_RADIO)
+        for m in self._conn.dump(msg):
+            attrs = _genl_attrs(m)
+            if HWSIM_ATTR_RADIO_ID in attrs and HWSIM_ATTR_RADIO_NAME in attrs:
+                radio_id = attrs[HWSIM_ATTR_RADIO_ID].u32()
+                wiphy_names[_genl_str(attrs[HWSIM_ATTR_RADIO_NAME])] = radio_id
+
+        nl80211 = netlink.genl_controller.get_family_id(b'nl80211')
+        wiphys = {}
+        msg = netlink.GenlMessage(nl80211, NL80211_CMD_GET_WIPHY,
+                                  attrs=[netlink.FlagAttr(NL80211_ATTR_SPLIT_WIPHY_DUMP)])
+        for m in self._conn.dump(msg):
+            attrs = _genl_attrs(m)
+            if NL80211_ATTR_WIPHY in attrs and NL80211_ATTR_WIPHY_NAME in attrs:
+                name = _genl_str(attrs[NL80211_ATTR_WIPHY_NAME])
+                if name in wiphy_names:
+                    wiphys[attrs[NL80211_ATTR_WIPHY].u32()] = wiphy_names[name]
+
+        ifnames = {}
+        msg = netlink.GenlMessage(nl80211, NL80211_CMD_GET_INTERFACE)
+        for m in self._conn.dump(msg):
+            attrs = _genl_attrs(m)
+            if NL80211_ATTR_WIPHY not in attrs or \
+               NL80211_ATTR_IFNAME not in attrs:
+                continue
+            radio_id = wiphys.get(attrs[NL80211_ATTR_WIPHY].u32())
+            if radio_id in radio_ids and radio_id not in ifnames:
+                ifnames[radio_id] = _genl_str(attrs[NL80211_ATTR_IFNAME])
+        return ifnames
+
+_controller = None
+
+def _shared_controller():
+    # One netlink socket (and family ID lookup) for all the radios created
+    # with HWSimRadios/HWSimRadio instead of one per radio
+    global _controller
+    if _controller is None:
+        _controller = HWSimController()
+    return _controller
+
+class HWSimRadios(object):
+    """Context manager for a group of radios that are created and destroyed
+    in bulk; returns a list of (radio_id, iface) tuples"""
+
+    def __init__(self, count, **kwargs):
+        self._controller = _shared_controller()
+        self._count = count
+        self._kwargs = kwargs
+        self._radio_ids = []
+
+    def _ifnames(self):
+        res = []
+        missing = []
+        for radio_id in self._radio_ids:
+            try:
+                iface = os.listdir('/sys/class/mac80211_hwsim/hwsim%d/net/' % radio_id)[0]
+            except (OSError, IndexError):
+                iface = None
+                missing.append(radio_id)
+            res.append((radio_id, iface))
+        if not missing:
+            return res
+        # No sysfs entries (e.g., sysfs of another network namespace), so
+        # find the interfaces with netlink dumps
+        ifnames = self._controller.get_ifnames(missing)
+        return [(radio_id, iface or ifnames[radio_id])
+                for radio_id, iface in res]
 
     def __enter__(self):
-        self._radio_id = self._controller.create_radio(
-              n_channels=self._n_channels,
-              use_chanctx=self._use_chanctx,
-              use_p2p_device=self._use_p2p_dev,
-              use_mlo=self._use_mlo,
-              use_nan=self._use_nan)
-        if self._radio_id < 0:
-            raise Exception("Failed to create radio (err:%d)" % self._radio_id)
+        self._radio_ids = self._controller.create_radios(self._count,
+                                                         **self._kwargs)
         try:
-            iface = os.listdir('/sys/class/mac80211_hwsim/hwsim%d/net/' % self._radio_id)[0]
+            return self._ifnames()
         except Exception as e:
-            self._controller.destroy_radio(self._radio_id)
+            self._controller.destroy_radios(self._radio_ids)
             raise e
-        return self._radio_id, iface
 
     def __exit__(self, type, value, traceback):
-        self._controller.destroy_radio(self._radio_id)
+        self._controller.destroy_radios(self._radio_ids)
+
+class HWSimRadio(HWSimRadios):
+    """Context manager for a single radio; returns (radio_id, iface)"""
+
+    def __init__(self, n_channels=None, use_chanctx=False,
+                 use_p2p_device=False, use_mlo=False,
+                 use_nan=False):
+        HWSimRadios.__init__(self, 1, n_channels=n_channels,
+                             use_chanctx=use_chanctx,
+                             use_p2p_device=use_p2p_device,
+                             use_mlo=use_mlo, use_nan=use_nan)
+
+    def __enter__(self):
+        return HWSimRadios.__enter__(self)[0]
 
 
 def create(args):
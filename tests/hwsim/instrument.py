@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+# Timing instrumentation for the test framework
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+#
+# With run-tests.py --perf, control interface requests, event waits,
+# time.sleep() calls in the main thread, and command executions through
+# remotehost.Host are timed and the statistics of each test case are
+# written to <test>.perf in the log directory. The file is little endian
+# binary:
+#
+#   header: b'HWPF', u16 version, u32 number of entries
+#   entry:  u8 kind, u8 key length, key (UTF-8), u32 count, u32 misses,
+#           f64 total time, f64 max time, f64 total timeout,
+#           u8 number of histogram buckets, (u8 bucket, u32 count) * n
+#
+# Histogram bucket i counts the durations in [2^(i-1), 2^i) microseconds.
+# For event waits, misses is the number of waits that timed out and the
+# total timeout allows the wait time to be compared to the timeouts that
+# were used.
+#
+# With run-tests.py --sleep-audit, only the time.sleep() calls are timed
+# and the fixed sleep time of each test case is reported.
+#
+# Usage: instrument.py <log directory or .perf files>
+
+import os
+import struct
+import sys
+import threading
+import time
+
+PERF_MAGIC = b'HWPF'
+PERF_VERSION = 1
+
+KIND_CTRL = 1
+KIND_WAIT = 2
+KIND_SLEEP = 3
+KIND_EXEC = 4
+
+kind_names = {KIND_CTRL: 'ctrl', KIND_WAIT: 'wait', KIND_SLEEP: 'sleep',
+              KIND_EXEC: 'exec'}
+
+NUM_BUCKETS = 24
+
+enabled = False
+_stats = {}
+_lock = threading.Lock()
+_real_sleep = time.sleep
+
+class Stat(object):
+    __slots__ = ['count', 'misses', 'total', 'max', 'timeout', 'buckets']
+
+    def __init__(self):
+        self.count = 0
+        self.misses = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeout = 0.0
+        self.buckets = {}
+
+    def add(self, duration, timeout=0, miss=False):
+        self.count += 1
+        if miss:
+            self.misses += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.timeout += timeout
+        bucket = min(int(duration * 1000000).bit_length(), NUM_BUCKETS - 1)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.misses += other.misses
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.timeout += other.timeout
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def percentile(self, p):
+        """Upper bound (in seconds) of the histogram bucket that contains
+        the p percentile"""
+        limit = self.count * p
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= limit:
+                return (1 << bucket) / 1000000.0
+        return self.max
+
+def record(kind, key, duration, timeout=0, miss=False):
+    with _lock:
+        stat = _stats.get((kind, key))
+        if stat is None:
+            stat = _stats[(kind, key)] = Stat()
+        stat.add(duration, timeout, miss)
+
+def _ctrl_request(cmd, duration):
+    if isinstance(cmd, bytes):
+        cmd = cmd.decode(errors='replace')
+    record(KIND_CTRL, cmd.split(' ', 1)[0], duration)
+
+def _sleep(secs):
+    if threading.current_thread() is not threading.main_thread():
+        # Background threads (log post-processing, kernel message and log
+        # indexing) are not part of the test case run time
+        _real_sleep(secs)
+        return
+    f = sys._getframe(1)
+    key = "%s:%s:%d" % (os.path.basename(f.f_code.co_filename),
+                        f.f_code.co_name, f.f_lineno)
+    start = time.perf_counter()
+    try:
+        _real_sleep(secs)
+    finally:
+        record(KIND_SLEEP, key, time.perf_counter() - start)
+
+def enable(sleep_only=False):
+    global enabled
+    time.sleep = _sleep
+    if sleep_only:
+        return
+    import wpaspy
+    enabled = True
+    wpaspy.request_hook = _ctrl_request
+
+def disable():
+    global enabled
+    import wpaspy
+    enabled = False
+    wpaspy.request_hook = None
+    time.sleep = _real_sleep
+
+def wait_done(events, start, timeout, ev):
+    """Record an event wait that started at start (time.perf_counter())"""
+    key = '|'.join(events)
+    if len(key) > 64:
+        key = key[:61] + '...'
+    record(KIND_WAIT, key, time.perf_counter() - start, timeout, ev is None)
+
+def exec_done(command, start):
+    key = os.path.basename(command[0]) if command else ''
+    record(KIND_EXEC, key, time.perf_counter() - start)
+
+def reset():
+    """Return the statistics collected so far and start from scratch"""
+    global _stats
+    with _lock:
+        stats = _stats
+        _stats = {}
+    return stats
+
+def write(path, stats):
+    data = [PERF_MAGIC, struct.pack('<HI', PERF_VERSION, len(stats))]
+    for (kind, key), stat in stats.items():
+        key = key.encode()[:255]
+        data.append(struct.pack('<BB', kind, len(key)))
+        data.append(key)
+        data.append(struct.pack('<IIdddB', stat.count, stat.misses,
+                                stat.total, stat.max, stat.timeout,
+                                len(stat.buckets)))
+        for bucket, count in sorted(stat.buckets.items()):
+            data.append(struct.pack('<BI', bucket, count))
+    with open(path, 'wb') as f:
+        f.write(b''.join(data))
+
+def read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[0:4] != PERF_MAGIC:
+        raise Exception("Not a perf file: " + path)
+    version, num = struct.unpack_from('<HI', data, 4)
+    if version != PERF_VERSION:
+        raise Exception("Unsupported perf file version %d: %s" % (version, path))
+    pos = 10
+    stats = {}
+    for i in range(num):
+        kind, key_len = struct.unpack_from('<BB', data, pos)
+        pos += 2
+        key = data[pos:pos + key_len].decode(errors='replace')
+        pos += key_len
+        stat = Stat()
+        (stat.count, stat.misses, stat.total, stat.max, stat.timeout,
+         num_buckets) = struct.unpack_from('<IIdddB', data, pos)
+        pos += 33
+        for j in range(num_buckets):
+            bucket, count = struct.unpack_from('<BI', data, pos)
+            pos += 5
+            stat.buckets[bucket] = count
+        stats[(kind, key)] = stat
+    return stats
+
+def merge(total, stats):
+    for k, stat in stats.items():
+        if k not in total:
+            total[k] = Stat()
+        total[k].merge(stat)
+
+def summary(stats, num=15):
+    """Return text lines listing the entries with the largest total time
+    for each kind"""
+    lines = []
+    for kind in sorted(kind_names):
+        entries = [(key, stat) for (k, key), stat in stats.items()
+                   if k == kind]
+        if not entries:
+            continue
+        entries.sort(key=lambda e: e[1].total, reverse=True)
+        total = sum([stat.total for key, stat in entries])
+        count = sum([stat.count for key, stat in entries])
+        lines.append("%s: %d calls, %.3f s total" % (kind_names[kind], count,
+                                                    total))
+        for key, stat in entries[:num]:
+            line = "  %-40s n=%-6d total=%.3f s mean=%.6f s p90<%.6f s max=%.3f s" % (key, stat.count, stat.total, stat.total / stat.count, stat.percentile(0.9), stat.max)
+            if kind == KIND_WAIT and stat.timeout > 0:
+                line += " wait/timeout=%.2f timeouts=%d" % (stat.total / stat.timeout, stat.misses)
+            lines.append(line)
+    return lines
+
+def sleep_sites(stats):
+    """Return the total fixed sleep time and the sleep call sites sorted
+    by the total time spent in them"""
+    sites = [(key, stat) for (kind, key), stat in stats.items()
+             if kind == KIND_SLEEP]
+    sites.sort(key=lambda e: e[1].total, reverse=True)
+    return sum([stat.total for key, stat in sites]), sites
+
+def sleep_report(per_test, stats, num=30):
+    """Return text lines with the test cases that spent most time in fixed
+    sleeps and the call sites responsible for it"""
+    total, sites = sleep_sites(stats)
+    lines = ["Fixed sleeps: %.3f s total in %d test case(s)" % (total, len(per_test))]
+    lines.append("Test cases:")
+    for name, t, count in sorted(per_test, key=lambda e: e[1],
+                                 reverse=True)[:num]:
+        lines.append("  %-50s %8.3f s in %d sleep(s)" % (name, t, count))
+    lines.append("Call sites:")
+    for key, stat in sites[:num]:
+        lines.append("  %-50s %8.3f s in %d sleep(s)" % (key, stat.total,
+                                                         stat.count))
+    return lines
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: instrument.py <log directory or .perf files>")
+        sys.exit(1)
+    files = []
+    for arg in sys.argv[1:]:
+        if os.path.isdir(arg):
+            files += [os.path.join(arg, f) for f in sorted(os.listdir(arg))
+                      if f.endswith('.perf')]
+        else:
+            files.append(arg)
+    total = {}
+    for f in files:
+        merge(total, read(f))
+    print("%d test case(s)" % len(files))
+    for line in summary(total):
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Sidecar index for wpa_supplicant/hostapd debug log files
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger()
+
+INDEX_VERSION = 2
+
+key_markers = [(b'PTK - hexdump', 'PTK'), (b'PMK - hexdump', 'PMK')]
+
+class LogIndex(object):
+    """Byte offsets of interesting lines in a log file that is being written
+
+    The file is read incrementally from the previous position on each
+    update(), so only the new lines are processed. The index records the
+    offsets of the PMK/PTK hexdump lines."""
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.ino = None
+        self.offset = 0
+        self.keys = []
+
+    def update(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self.ino or st.st_size < self.offset:
+            self.reset()
+            self.ino = st.st_ino
+        if st.st_size == self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        # Leave a partially written last line for the next update
+        end = data.rfind(b'\n') + 1
+        pos = 0
+        while pos < end:
+            nl = data.index(b'\n', pos)
+            line = data[pos:nl]
+            offset = self.offset + pos
+            pos = nl + 1
+            for marker, kind in key_markers:
+                if marker in line:
+                    self.keys.append((offset, kind))
+        self.offset += end
+
+    def write(self, path):
+        idx = {'version': INDEX_VERSION,
+               'size': self.offset,
+               'keys': self.keys}
+        with open(path + '.idx', 'w') as f:
+            json.dump(idx, f)
+
+def load_index(path):
+    """Return the sidecar index of a log file or None if there is no valid
+    index for it"""
+    try:
+        with open(path + '.idx', 'r') as f:
+            idx = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if idx.get('version') != INDEX_VERSION:
+        return None
+    return idx
+
+def read_lines(path, offsets):
+    """Return the lines starting at the given offsets of a file"""
+    lines = []
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            lines.append(f.readline())
+    return lines
+
+class LogIndexer(object):
+    """Keeps the indexes of the live log files in a log directory up to date
+
+    A background thread indexes the new lines of each log file
+    periodically while the test case is running. finish() is called when a
+    log file has been renamed at the end of a test case; it indexes the
+    remaining lines and writes the sidecar index next to the renamed
+    file."""
+
+    def __init__(self, logdir, basenames, interval=1):
+        self.logdir = logdir
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.indexes = {}
+        for name in basenames:
+            self.indexes[name] = LogIndex(os.path.join(logdir, name))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="logindex")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                for idx in self.indexes.values():
+                    try:
+                        idx.update()
+                    except Exception as e:
+                        logger.debug("Log indexing failed for %s: %s" % (idx.path, str(e)))
+
+    def finish(self, basename, dstname):
+        with self.lock:
+            idx = self.indexes.get(basename)
+            if idx is None:
+                return
+            try:
+                # The file was renamed, so the rest of it is read from the
+                # new name. The same inode continues the existing index.
+                idx.path = dstname
+                idx.update()
+                if idx.ino is not None:
+                    idx.write(dstname)
+            except Exception as e:
+                logger.info("Could not write log index for %s: %s" % (dstname, str(e)))
+            self.indexes[basename] = LogIndex(os.path.join(self.logdir,
+                                                           basename))
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -6,13 +6,16 @@
 # This software may be distributed under the terms of the BSD license.
 # See README for more details.
 
-import struct, socket
+import struct, socket, select
 
 # flags
 NLM_F_REQUEST = 1
 NLM_F_MULTI = 2
 NLM_F_ACK = 4
 NLM_F_ECHO = 8
+NLM_F_ROOT = 0x100
+NLM_F_MATCH = 0x200
+NLM_F_DUMP = NLM_F_ROOT | NLM_F_MATCH
 
 # types
 NLMSG_NOOP	= 1
@@ -167,17 +170,77 @@ class Connection(object):
         msg = Message(msg_type, flags, seq, contents[16:])
         msg.pid = pid
         if msg.type == NLMSG_ERROR:
-            import os
             errno = msg.ret
             if errno < 0:
-                err = OSError("Netlink error: %s (%d)" % (
-                    os.strerror(-errno), -errno))
-                err.errno = -errno
-                raise err
+                raise netlink_error(errno)
         return msg
+    def recv_msgs(self, timeout=None):
+        # Unlike recv(), this returns all the messages in the datagram and
+        # leaves the handling of error acks to the caller
+        if timeout is not None:
+            r, w, e = select.select([self.descriptor], [], [], timeout)
+            if not r:
+                raise Exception("Timeout on waiting for netlink response")
+        contents = self.descriptor.recv(65536)
+        msgs = []
+        while len(contents) >= 16:
+            msglen, msg_type, flags, seq, pid = struct.unpack("IHHII",
+                                                              contents[:16])
+            if msglen < 16:
+                break
+            msg = Message(msg_type, flags, seq, contents[16:msglen])
+            msg.pid = pid
+            msgs.append(msg)
+            contents = contents[(msglen + 3) & ~3:]
+        return msgs
+    def send_and_recv_acks(self, msgs, window=32, timeout=10):
+        """Send a batch of requests (with NLM_F_ACK) without waiting for
+        each response and return the acks in the order of the requests.
+
+        The acks are matched to the requests by sequence number. At most
+        window requests are outstanding at a time so that the acks fit in
+        the receive buffer. An exception is raised if no ack is received
+        within timeout seconds."""
+        acks = {}
+        seqs = set()
+        sent = 0
+        while len(acks) < len(msgs):
+            while sent < len(msgs) and len(seqs) - len(acks) < window:
+                msgs[sent].send(self)
+                seqs.add(msgs[sent].seq)
+                sent += 1
+            for m in self.recv_msgs(timeout):
+                if m.type == NLMSG_ERROR and m.seq in seqs:
+                    acks[m.seq] = m
+        return [acks[m.seq] for m in msgs]
+    def dump(self, msg, timeout=10):
+        """Send a dump request and return the messages of the reply"""
+        msg.flags |= NLM_F_REQUEST | NLM_F_DUMP
+        msg.send(self)
+        res = []
+        while True:
+            for m in self.recv_msgs(timeout):
+                if m.seq != msg.seq:
+                    continue
+                if m.type == NLMSG_DONE:
+                    return res
+                if m.type == NLMSG_ERROR:
+                    if m.ret < 0:
+                        raise netlink_error(m.ret)
+                    return res
+                res.append(m)
     def seq(self):
         self._seq += 1
         return self._seq
+    def add_membership(self, group):
+        # Generic netlink group IDs may not fit in the bind() bitmask
+        self.descriptor.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+def netlink_error(errno):
+    import os
+    err = OSError("Netlink error: %s (%d)" % (os.strerror(-errno), -errno))
+    err.errno = -errno
+    return err
 
 def parse_attributes(data):
     attrs = {}
@@ -205,6 +268,13 @@ CTRL_ATTR_VERSION = 3
 CTRL_ATTR_HDRSIZE = 4
 CTRL_ATTR_MAXATTR = 5
 CTRL_ATTR_OPS = 6
+CTRL_ATTR_MCAST_GROUPS = 7
+
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
 
 class GenlHdr(object):
     def __init__(self, cmd, version=0):
@@ -225,13 +295,24 @@ class GenlMessage(Message):
 class GenlController(object):
     def __init__(self, conn):
         self.conn = conn
-    def get_family_id(self, family):
+    def _get_family(self, family):
         a = NulStrAttr(CTRL_ATTR_FAMILY_NAME, family)
         m = GenlMessage(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, flags=NLM_F_REQUEST, attrs=[a])
         m.send(self.conn)
         m = self.conn.recv()
         gh = _genl_hdr_parse(m.payload[:4])
-        attrs = parse_attributes(m.payload[4:])
+        return parse_attributes(m.payload[4:])
+    def get_family_id(self, family):
+        attrs = self._get_family(family)
         return attrs[CTRL_ATTR_FAMILY_ID].u16()
+    def get_mcast_group_id(self, family, group):
+        attrs = self._get_family(family)
+        if CTRL_ATTR_MCAST_GROUPS in attrs:
+            for grp in attrs[CTRL_ATTR_MCAST_GROUPS].nested().values():
+                grp = grp.nested()
+                name = grp[CTRL_ATTR_MCAST_GRP_NAME].str().split(b'\0')[0]
+                if name == group:
+                    return grp[CTRL_ATTR_MCAST_GRP_ID].u32()
+        raise Exception("No multicast group %s in %s" % (group, family))
 
 genl_controller = GenlController(Connection(NETLINK_GENERIC))
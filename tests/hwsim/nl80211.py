@@ -5,8 +5,11 @@
 # See README for more details.
 
 import binascii
+import errno
 import struct
 
+import netlink
+
 nl80211_cmd = {
     'GET_WIPHY': 1,
     'SET_WIPHY': 2,
@@ -355,3 +358,43 @@ def parse_nl80211_attrs(msg):
         attrs[attr] = msg[0:alen]
         msg = msg[alen:]
     return attrs
+
+class ScanMonitor(object):
+    """Wakeup source for utils.wait_until() on nl80211 scan events
+
+    This subscribes to the nl80211 "scan" multicast group, so the socket
+    becomes readable whenever a scan is triggered, completes, or is aborted
+    on any interface."""
+
+    def __init__(self):
+        self.conn = netlink.Connection(netlink.NETLINK_GENERIC)
+        try:
+            group = netlink.genl_controller.get_mcast_group_id(b'nl80211',
+                                                               b'scan')
+            self.conn.add_membership(group)
+            self.conn.descriptor.setblocking(False)
+        except Exception:
+            self.close()
+            raise
+
+    def fileno(self):
+        return self.conn.descriptor.fileno()
+
+    def drain(self):
+        """Return the nl80211 commands of the received scan events"""
+        cmds = []
+        try:
+            while True:
+                for m in self.conn.recv_msgs():
+                    if len(m.payload) >= 4:
+                        cmds.append(m.payload[0])
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            # Events were lost, but this is only used for wakeups
+            if e.errno != errno.ENOBUFS:
+                raise
+        return cmds
+
+    def close(self):
+        self.conn.descriptor.close()
@@ -0,0 +1,388 @@
+# In-process pcap/pcapng capture reader with a subset of tshark filters
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import os
+import re
+import struct
+
+import frames
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+class UnsupportedFilter(Exception):
+    pass
+
+class Packet:
+    __slots__ = ('number', 'linktype', 'data', '_fields', '_elems')
+
+    def __init__(self, number, linktype, data):
+        self.number = number
+        self.linktype = linktype
+        self.data = data
+        self._fields = None
+        self._elems = None
+
+    def _decode(self):
+        fields = {'frame.number': [self.number]}
+        self._fields = fields
+        data = memoryview(self.data)
+        fcs = False
+        if self.linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+            if len(data) < 8:
+                return
+            rlen, = struct.unpack_from('<H', data, 2)
+            pos = 4
+            present, = struct.unpack_from('<I', data, pos)
+            p = present
+            while p & 0x80000000 and pos + 8 <= rlen:
+                pos += 4
+                p, = struct.unpack_from('<I', data, pos)
+            pos += 4
+            # Fields are in bit order and naturally aligned; only the ones up
+            # to Channel are needed here.
+            for bit, align, size in [(0, 8, 8), (1, 1, 1), (2, 1, 1),
+                                     (3, 2, 4)]:
+                if not present & (1 << bit):
+                    continue
+                pos = (pos + align - 1) & ~(align - 1)
+                if pos + size > rlen:
+                    break
+                if bit == 1:
+                    fcs = data[pos] & 0x10 != 0
+                elif bit == 3:
+                    fields['radiotap.channel.freq'] = [struct.unpack_from('<H', data, pos)[0]]
+                pos += size
+            data = data[rlen:]
+        elif self.linktype != LINKTYPE_IEEE802_11:
+            raise UnsupportedFilter("linktype %d" % self.linktype)
+        if fcs:
+            data = data[:-4]
+        if len(data) < 10:
+            return
+        fc, = struct.unpack_from('<H', data, 0)
+        ftype = (fc >> 2) & 0x3
+        subtype = (fc >> 4) & 0xf
+        fields['wlan.fc.type'] = [ftype]
+        fields['wlan.fc.subtype'] = [subtype]
+        fields['wlan.fc.type_subtype'] = [(ftype << 4) | subtype]
+        fields['wlan.fc.protected'] = [1 if fc & 0x4000 else 0]
+        fields['wlan.ra'] = [frames.mac_str(data[4:10])]
+        if ftype == 1:
+            if subtype not in (12, 13) and len(data) >= 16:
+                fields['wlan.ta'] = [frames.mac_str(data[10:16])]
+            return
+        if len(data) < 24:
+            return
+        a1 = frames.mac_str(data[4:10])
+        a2 = frames.mac_str(data[10:16])
+        a3 = frames.mac_str(data[16:22])
+        fields['wlan.ta'] = [a2]
+        to_ds = fc & 0x0100
+        from_ds = fc & 0x0200
+        if ftype == 0 or (not to_ds and not from_ds):
+            da, sa, bssid = a1, a2, a3
+        elif from_ds and not to_ds:
+            da, bssid, sa = a1, a2, a3
+        elif to_ds and not from_ds:
+            bssid, sa, da = a1, a2, a3
+        else:
+            bssid = None
+            da = a3
+            sa = frames.mac_str(data[24:30]) if len(data) >= 30 else None
+        fields['wlan.da'] = [da]
+        if sa:
+            fields['wlan.sa'] = [sa]
+        if bssid:
+            fields['wlan.bssid'] = [bssid]
+        if ftype != 0:
+            return
+        if fc & 0x4000:
+            # The frame body is encrypted, so neither fixed fields nor
+            # elements can be parsed from it
+            return
+        body = data[28:] if fc & 0x8000 else data[24:]
+        if subtype in (13, 14):
+            if len(body) >= 1:
+                fields['wlan.fixed.category_code'] = [body[0]]
+                if body[0] == 4 and len(body) >= 2:
+                    fields['wlan.fixed.publicact'] = [body[1]]
+            self._elems = None
+            return
+        fixed = {0: 4, 1: 6, 2: 10, 3: 6, 4: 0, 5: 12, 8: 12, 10: 2,
+                 11: 6, 12: 2}.get(subtype)
+        if subtype in (1, 3) and len(body) >= 4:
+            fields['wlan.fixed.status_code'] = [struct.unpack_from('<H', body, 2)[0]]
+        elif subtype == 11 and len(body) >= 6:
+            alg, = struct.unpack_from('<H', body, 0)
+            fields['wlan.fixed.status_code'] = [struct.unpack_from('<H', body, 4)[0]]
+            if alg not in (0, 1, 2):
+                # The body does not consist of elements (e.g., SAE)
+                fixed = None
+        if fixed is not None and len(body) >= fixed:
+            self._elems = frames.Elements(body[fixed:])
+
+    def field(self, name):
+        if self._fields is None:
+            self._decode()
+        if name in self._fields:
+            return self._fields[name]
+        if name in ('wlan.tag.number', 'wlan.tag.length',
+                    'wlan.ext_tag.number'):
+            if self._fields.get('wlan.fc.type') == [0] and \
+               self._fields.get('wlan.fc.subtype') in ([13], [14]):
+                # tshark parses elements in many Action (No Ack) frames
+                raise UnsupportedFilter(name)
+            if self._elems is None:
+                return []
+            vals = []
+            for key, body in self._elems.items():
+                eid = key[0] if isinstance(key, tuple) else key
+                if name == 'wlan.tag.number':
+                    vals.append(eid)
+                elif name == 'wlan.tag.length':
+                    vals.append(len(body))
+                elif isinstance(key, tuple):
+                    vals.append(key[1])
+            return vals
+        return []
+
+FIELDS = ['frame.number', 'radiotap.channel.freq', 'wlan.fc.type',
+          'wlan.fc.subtype', 'wlan.fc.type_subtype', 'wlan.fc.protected',
+          'wlan.ra', 'wlan.ta', 'wlan.da', 'wlan.sa', 'wlan.bssid',
+          'wlan.fixed.category_code', 'wlan.fixed.publicact',
+          'wlan.fixed.status_code', 'wlan.tag.number', 'wlan.tag.length',
+          'wlan.ext_tag.number']
+
+class Capture:
+    """Packets of a capture file that is read incrementally
+
+    The file is parsed only once; when it has grown (e.g., wlantest is still
+    writing it), only the new blocks are read on the next update()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.ino = None
+        self.offset = 0
+        self.packets = []
+        self.fmt = None
+        self.endian = '<'
+        self.linktypes = []
+        self.linktype = None
+
+    def update(self):
+        st = os.stat(self.path)
+        if st.st_ino != self.ino or st.st_size < self.offset:
+            self.reset()
+            self.ino = st.st_ino
+        if st.st_size == self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            buf = f.read(st.st_size - self.offset)
+        if self.fmt is None:
+            used = self._parse_file_header(buf)
+        else:
+            used = 0
+        if self.fmt == 'pcapng':
+            used = self._parse_pcapng(buf, used)
+        elif self.fmt == 'pcap':
+            used = self._parse_pcap(buf, used)
+        self.offset += used
+
+    def _parse_file_header(self, buf):
+        if len(buf) < 24:
+            return 0
+        magic = buf[0:4]
+        if magic == b'\x0a\x0d\x0d\x0a':
+            self.fmt = 'pcapng'
+            return 0
+        for endian in ['<', '>']:
+            m, = struct.unpack(endian + 'I', magic)
+            if m in (0xa1b2c3d4, 0xa1b23c4d):
+                self.fmt = 'pcap'
+                self.endian = endian
+                self.linktype, = struct.unpack_from(endian + 'I', buf, 20)
+                return 24
+        raise UnsupportedFilter("unknown capture file format")
+
+    def _parse_pcap(self, buf, pos):
+        e = self.endian
+        while len(buf) - pos >= 16:
+            caplen, = struct.unpack_from(e + 'I', buf, pos + 8)
+            if len(buf) - pos < 16 + caplen:
+                break
+            self.packets.append(Packet(len(self.packets) + 1, self.linktype,
+                                       buf[pos + 16:pos + 16 + caplen]))
+            pos += 16 + caplen
+        return pos
+
+    def _parse_pcapng(self, buf, pos):
+        while len(buf) - pos >= 12:
+            if buf[pos:pos + 4] == b'\x0a\x0d\x0d\x0a':
+                bom = buf[pos + 8:pos + 12]
+                self.endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+                self.linktypes = []
+            e = self.endian
+            btype, blen = struct.unpack_from(e + 'II', buf, pos)
+            if blen < 12 or len(buf) - pos < blen:
+                break
+            if btype == 1:
+                linktype, = struct.unpack_from(e + 'H', buf, pos + 8)
+                self.linktypes.append(linktype)
+            elif btype == 6:
+                iface, ts_high, ts_low, caplen = \
+                    struct.unpack_from(e + 'IIII', buf, pos + 8)
+                self.packets.append(Packet(len(self.packets) + 1,
+                                           self.linktypes[iface],
+                                           buf[pos + 28:pos + 28 + caplen]))
+            elif btype == 3:
+                origlen, = struct.unpack_from(e + 'I', buf, pos + 8)
+                caplen = min(origlen, blen - 16)
+                self.packets.append(Packet(len(self.packets) + 1,
+                                           self.linktypes[0],
+                                           buf[pos + 12:pos + 12 + caplen]))
+            pos += blen
+        return pos
+
+# Parsed captures in least recently used order. Each test case writes its
+# own capture file, so only a few of them are worth keeping.
+MAX_CAPTURES = 4
+_captures = {}
+
+def get_capture(path):
+    cap = _captures.pop(path, None)
+    for p in list(_captures.keys()):
+        if not os.path.exists(p):
+            del _captures[p]
+    if cap is None:
+        cap = Capture(path)
+    _captures[path] = cap
+    while len(_captures) > MAX_CAPTURES:
+        del _captures[next(iter(_captures))]
+    cap.update()
+    return cap
+
+_token_re = re.compile(r'\s*(\(|\)|&&|\|\||==|!=|>=|<=|>|<|!|[A-Za-z0-9_.:-]+)')
+_mac_re = re.compile(r'^[0-9a-fA-F]{2}(:[0-9a-fA-F]{2}){5}$')
+_ops = {'==': '==', 'eq': '==', '!=': '!=', 'ne': '!=', '>': '>', 'gt': '>',
+        '<': '<', 'lt': '<', '>=': '>=', 'ge': '>=', '<=': '<=', 'le': '<='}
+
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _token_re.match(expr, pos)
+        if not m:
+            raise UnsupportedFilter(expr[pos:])
+        tokens.append(m.group(1))
+        pos = m.end()
+    return tokens
+
+def _parse_value(val):
+    if _mac_re.match(val):
+        return val.lower()
+    try:
+        return int(val, 0)
+    except ValueError:
+        raise UnsupportedFilter(val)
+
+def _compare(vals, op, val):
+    if op == '==':
+        return val in vals
+    if op == '!=':
+        # Like in tshark, a comparison with an absent field is false
+        return len(vals) > 0 and val not in vals
+    for v in vals:
+        if not isinstance(v, int) or not isinstance(val, int):
+            raise UnsupportedFilter(op)
+        if (op == '>' and v > val) or (op == '<' and v < val) or \
+           (op == '>=' and v >= val) or (op == '<=' and v <= val):
+            return True
+    return False
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def next(self):
+        tok = self.peek()
+        if tok is None:
+            raise UnsupportedFilter("unexpected end of filter")
+        self.pos += 1
+        return tok
+
+    def expr(self):
+        terms = [self.term()]
+        while self.peek() in ('||', 'or'):
+            self.next()
+            terms.append(self.term())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda pkt: any(t(pkt) for t in terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.peek() in ('&&', 'and'):
+            self.next()
+            factors.append(self.factor())
+        if len(factors) == 1:
+            return factors[0]
+        return lambda pkt: all(f(pkt) for f in factors)
+
+    def factor(self):
+        tok = self.next()
+        if tok in ('!', 'not'):
+            f = self.factor()
+            return lambda pkt: not f(pkt)
+        if tok == '(':
+            e = self.expr()
+            if self.next() != ')':
+                raise UnsupportedFilter("missing )")
+            return e
+        if tok not in FIELDS:
+            raise UnsupportedFilter(tok)
+        name = tok
+        if self.peek() in _ops:
+            op = _ops[self.next()]
+            val = _parse_value(self.next())
+            return lambda pkt: _compare(pkt.field(name), op, val)
+        return lambda pkt: len(pkt.field(name)) > 0
+
+def compile_filter(expr):
+    parser = _Parser(_tokenize(expr))
+    pred = parser.expr()
+    if parser.peek() is not None:
+        raise UnsupportedFilter(parser.peek())
+    return pred
+
+def run_filter(path, filter, display):
+    """Return tshark -Tfields style output for the matching packets
+
+    UnsupportedFilter is raised if the filter or the display fields use
+    something that is not supported here."""
+    for d in display:
+        if d not in FIELDS:
+            raise UnsupportedFilter(d)
+    pred = compile_filter(filter)
+    out = ''
+    for pkt in get_capture(path).packets:
+        if not pred(pkt):
+            continue
+        vals = []
+        for d in display:
+            vals.append(','.join([str(v) for v in pkt.field(d)]))
+        out += '\t'.join(vals) + '\n'
+    return out
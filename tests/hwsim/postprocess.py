@@ -0,0 +1,175 @@
+# Background post-processing of test case log files
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import glob
+import gzip
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import logindex
+
+logger = logging.getLogger()
+
+def key_lines(path):
+    idx = logindex.load_index(path)
+    if idx is not None and idx['size'] > os.path.getsize(path):
+        logger.debug("Ignoring stale log index for " + path)
+        idx = None
+    if idx is None:
+        with open(path, 'rb') as logfile:
+            yield from logfile
+        return
+    yield from logindex.read_lines(path, [k[0] for k in idx['keys']])
+    # Lines written after the index (e.g., a partial last line at the time
+    # of indexing) are scanned normally
+    with open(path, 'rb') as logfile:
+        logfile.seek(idx['size'])
+        yield from logfile
+
+def extract_keys(logdir, testname):
+    """Collect PMKs and PTKs from the debug logs into .pmks/.ptks files
+
+    Only the indexed key lines and the lines after the indexed part are
+    read from log files that have a sidecar index. Returns True if any keys were found."""
+    found_key = False
+    pmks_name = os.path.join(logdir, f'{testname}.pmks')
+    ptks_name = os.path.join(logdir, f'{testname}.ptks')
+    with open(pmks_name, 'wb') as pmks, \
+         open(ptks_name, 'wb') as ptks:
+        logs = os.path.join(logdir, f'{testname}.*')
+        for f in glob.glob(logs):
+            if f.endswith('.pcapng') or f.endswith('.pmks') or \
+               f.endswith('.ptks') or f.endswith('.gz') or \
+               f.endswith('.idx') or f.endswith('.perf'):
+                continue
+            for line in key_lines(f):
+                if b'PTK - hexdump' in line:
+                    ptks.write(line.split(b':')[-1].replace(b' ', b''))
+                    found_key = True
+                if b'PMK - hexdump' in line:
+                    pmks.write(line.split(b':')[-1].replace(b' ', b''))
+                    found_key = True
+    return found_key
+
+def decrypt_pcap(logdir, testname):
+    pcap = os.path.join(logdir, f'{testname}.hwsim0.pcapng')
+    pmks_name = os.path.join(logdir, f'{testname}.pmks')
+    ptks_name = os.path.join(logdir, f'{testname}.ptks')
+    out_pcap = os.path.join(logdir, f'{testname}.hwsim0.dec.pcapng')
+    if os.path.isfile('../../wlantest/wlantest'):
+        wlantest_bin = '../../wlantest/wlantest'
+    else:
+        wlantest_bin = 'wlantest'
+    with open(os.path.join(logdir, f'{testname}.dec.log'), 'w') as dec_log:
+        subprocess.run([wlantest_bin, '-r', pcap, '-f', pmks_name,
+                        '-T', ptks_name, '-n', out_pcap],
+                       stdout=dec_log)
+
+def compress_logs(logdir, testname):
+    # The test case log file itself is still open at this point, so it is
+    # left uncompressed.
+    own_log = os.path.join(logdir, f'{testname}.log')
+    for f in glob.glob(os.path.join(logdir, f'{testname}.*')):
+        if f == own_log or f.endswith('.gz') or f.endswith('.idx') or \
+           not os.path.isfile(f):
+            continue
+        with open(f, 'rb') as src, gzip.open(f + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.unlink(f)
+
+def process_test_logs(logdir, testname, compress=False):
+    """Run the post-processing steps for a test case; return the names of
+    the steps that were done"""
+    steps = []
+    pcap = os.path.join(logdir, f'{testname}.hwsim0.pcapng')
+    if os.path.exists(pcap):
+        steps.append('keys')
+        if extract_keys(logdir, testname):
+            decrypt_pcap(logdir, testname)
+            steps.append('decrypt')
+    if compress:
+        compress_logs(logdir, testname)
+        steps.append('compress')
+    return steps
+
+class LogPostProcessor(object):
+    """Worker pool for the post-processing of test case log files
+
+    The test loop only queues the test case name after the log files have
+    been renamed and reported; key extraction, decryption of the capture
+    file, and optional compression are done by the worker threads. The
+    queue is bounded so that a slow post-processing step slows down the
+    test run instead of letting the backlog grow without limit. With no
+    workers the processing is done synchronously in submit()."""
+
+    def __init__(self, logdir, workers=2, compress=False, max_queue=None):
+        self.logdir = logdir
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.failed = []
+        self.count = 0
+        self.busy_time = 0
+        self.threads = []
+        if max_queue is None:
+            max_queue = 4 * workers
+        self.queue = queue.Queue(maxsize=max_queue)
+        for i in range(workers):
+            t = threading.Thread(target=self._worker,
+                                 name="postprocess-%d" % i)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _process(self, testname):
+        start = time.time()
+        try:
+            steps = process_test_logs(self.logdir, testname, self.compress)
+        except Exception as e:
+            logger.info("Log post-processing failed for %s: %s" % (testname, str(e)))
+            steps = None
+        with self.lock:
+            self.count += 1
+            self.busy_time += time.time() - start
+            if steps is None:
+                self.failed.append(testname)
+                return
+            for step in steps:
+                self.stats[step] = self.stats.get(step, 0) + 1
+
+    def _worker(self):
+        while True:
+            testname = self.queue.get()
+            try:
+                if testname is None:
+                    return
+                self._process(testname)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, testname):
+        if not self.threads:
+            self._process(testname)
+            return
+        self.queue.put(testname)
+
+    def close(self):
+        """Wait for the queued jobs to complete and log a summary"""
+        start = time.time()
+        for t in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        steps = ', '.join(["%s=%d" % (k, v) for k, v in sorted(self.stats.items())])
+        logger.info("Log post-processing: %d test case(s) (%s), %.1f s total processing time, %.1f s waited at the end" % (self.count, steps, self.busy_time, time.time() - start))
+        if self.failed:
+            logger.info("Log post-processing failed for: " + ' '.join(self.failed))
+        return self.failed
@@ -6,9 +6,177 @@
 # This software may be distributed under the terms of the BSD license.
 # See README for more details.
 
+import atexit
+import collections
+import json
+import logging
+import os
+import struct
+import subprocess
+import threading
+import wpaspy
 from wpaspy import Ctrl
 import remotehost
 
+logger = logging.getLogger()
+
+# Use a control interface agent (remotectrl_agent.py) on the remote host
+# instead of a wpa_cli process per request when possible.
+use_agent = True
+agent_dir = "/tmp/remotectrl-agent"
+
+class RemoteAgent:
+    """Connection to remotectrl_agent.py running on a host
+
+    One agent is shared by all RemoteCtrl instances for the same host. It
+    holds the control interface sockets on the host and multiplexes the
+    requests and the events from attached sockets over a single stream."""
+
+    def __init__(self, host):
+        self.host = host
+        self.proc = None
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.replies = {}
+        self.events = {}
+        self.next_id = 1
+        self.closed = False
+
+    def start(self):
+        srcdir = os.path.dirname(os.path.abspath(__file__))
+        agent = os.path.join(srcdir, "remotectrl_agent.py")
+        if self.host.host:
+            self.host.execute(["mkdir", "-p", agent_dir])
+            self.host.send_file(agent, agent_dir + "/remotectrl_agent.py")
+            self.host.send_file(wpaspy.__file__, agent_dir + "/wpaspy.py")
+            cmd = self.host.ssh_command(["python3",
+                                         agent_dir + "/remotectrl_agent.py"])
+        else:
+            cmd = ["python3", agent]
+        logger.debug("start control interface agent: " + ' '.join(cmd))
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, bufsize=0)
+        t = threading.Thread(target=self.reader, name="remotectrl-agent")
+        t.daemon = True
+        t.start()
+        try:
+            self.call({'op': 'hello'}, timeout=30)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_exact(self, length):
+        data = b''
+        while len(data) < length:
+            buf = self.proc.stdout.read(length - len(data))
+            if not buf:
+                return None
+            data += buf
+        return data
+
+    def reader(self):
+        while True:
+            hdr = self._read_exact(4)
+            data = self._read_exact(struct.unpack('>I', hdr)[0]) if hdr else None
+            with self.cond:
+                if data is None:
+                    self.closed = True
+                    self.cond.notify_all()
+                    return
+                msg = json.loads(data.decode())
+                if 'event' in msg:
+                    if msg['event'] in self.events:
+                        self.events[msg['event']].append(msg['msg'])
+                else:
+                    self.replies[msg['id']] = msg
+                self.cond.notify_all()
+
+    def call(self, msg, timeout=10):
+        with self.lock:
+            msg['id'] = self.next_id
+            self.next_id += 1
+            data = json.dumps(msg).encode()
+            self.proc.stdin.write(struct.pack('>I', len(data)) + data)
+        id = msg['id']
+        with self.cond:
+            # Allow some extra time for the agent to report its own timeout
+            if not self.cond.wait_for(lambda: id in self.replies or self.closed,
+                                      timeout + 5):
+                raise Exception("Timeout on waiting control interface agent")
+            if id not in self.replies:
+                raise Exception("Control interface agent exited")
+            reply = self.replies.pop(id)
+        if 'error' in reply:
+            raise Exception(reply['error'])
+        return reply
+
+    def open(self, path, ifname):
+        handle = self.call({'op': 'open', 'path': path, 'ifname': ifname})['handle']
+        with self.cond:
+            self.events[handle] = collections.deque()
+        return handle
+
+    def close_handle(self, handle):
+        with self.cond:
+            self.events.pop(handle, None)
+        if not self.closed:
+            self.call({'op': 'close', 'handle': handle})
+
+    def pending(self, handle, timeout=0):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.closed or
+                                      len(self.events.get(handle, [])) > 0,
+                                      timeout) and \
+                len(self.events.get(handle, [])) > 0
+
+    def recv(self, handle):
+        with self.cond:
+            if self.events.get(handle):
+                return self.events[handle].popleft()
+        return ""
+
+    def close(self):
+        if self.proc:
+            self.proc.stdin.close()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.proc = None
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+def get_agent(host):
+    key = host.ssh_target() if host.host else None
+    with _agents_lock:
+        agent = _agents.get(key)
+        if agent is not None and agent.closed:
+            agent = None
+        if agent is None:
+            if key in _agents:
+                # Do not retry starting an agent that failed
+                raise Exception("Control interface agent not available")
+            agent = RemoteAgent(host)
+            try:
+                agent.start()
+            except Exception:
+                _agents[key] = None
+                raise
+            _agents[key] = agent
+        return agent
+
+def close_agents():
+    with _agents_lock:
+        agents = [a for a in _agents.values() if a]
+        _agents.clear()
+    for agent in agents:
+        agent.close()
+
+atexit.register(close_agents)
+
 class RemoteCtrl(Ctrl):
     def __init__(self, path, port=9877, hostname=None, ifname=None):
         self.started = False
@@ -18,8 +186,17 @@ class RemoteCtrl(Ctrl):
         self.ifname = ifname
         self.hostname = hostname
         self.proc = None
+        self.agent = None
+        self.handle = None
 
         self.host = remotehost.Host(hostname)
+        if use_agent:
+            try:
+                self.agent = get_agent(self.host)
+                self.handle = self.agent.open(path, ifname)
+            except Exception as e:
+                logger.info("Control interface agent not used for %s: %s" % (hostname, str(e)))
+                self.agent = None
         self.started = True
 
     def __del__(self):
@@ -36,8 +213,18 @@ class RemoteCtrl(Ctrl):
 
         if self.host and self.started:
             self.started = False
+            if self.agent:
+                try:
+                    self.agent.close_handle(self.handle)
+                except Exception:
+                    pass
+                self.agent = None
 
     def request(self, cmd, timeout=10):
+        if self.agent:
+            return self.agent.call({'op': 'request', 'handle': self.handle,
+                                    'cmd': cmd, 'timeout': timeout},
+                                   timeout=timeout)['reply']
         if self.host:
             cmd = '\'' + cmd + '\''
             if self.ifname:
@@ -47,11 +234,19 @@ class RemoteCtrl(Ctrl):
             status, buf = self.host.execute(_cmd)
             return buf
 
+    def pipeline(self, cmds, timeout=10, window=8):
+        # Each request is a separate agent call or wpa_cli run, so there is
+        # nothing to pipeline here.
+        return [self.request(cmd, timeout=timeout) for cmd in cmds]
+
     def attach(self):
         if self.attached:
             return
 
-        if self.host:
+        if self.agent:
+            self.agent.call({'op': 'attach', 'handle': self.handle})
+            self.attached = True
+        elif self.host:
             if self.ifname:
                 _cmd = [ "wpa_cli", "-p", self.path, "-i", self.ifname ]
             else:
@@ -63,7 +258,10 @@ class RemoteCtrl(Ctrl):
         if not self.attached:
             return
 
-        if self.hostname and self.proc:
+        if self.agent:
+            self.agent.call({'op': 'detach', 'handle': self.handle})
+            self.attached = False
+        elif self.hostname and self.proc:
             self.request("DETACH")
             self.request("QUIT")
             self.host.proc_stop(self.proc)
@@ -81,11 +279,15 @@ class RemoteCtrl(Ctrl):
         self.close()
 
     def pending(self, timeout=0):
+        if self.agent:
+            return self.agent.pending(self.handle, timeout=timeout)
         if self.host and self.proc:
             return self.host.proc_pending(self.proc, timeout=timeout)
         return False
 
     def recv(self):
+        if self.agent:
+            return self.agent.recv(self.handle)
         if self.host and self.proc:
             res = self.host.proc_read(self.proc)
             return res
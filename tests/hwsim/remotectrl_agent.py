@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Control interface agent for RemoteCtrl
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+#
+# The agent is started on the remote host by remotectrl.RemoteAgent and it
+# talks to it over stdin/stdout. Each message is a JSON object prefixed with
+# a 32-bit big endian length. Requests carry an "id" that is copied into the
+# reply and events from attached control interfaces are sent as
+# {"event": handle, "msg": text} as soon as they are received.
+
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'wpaspy'))
+from wpaspy import Ctrl, is_event
+
+def write_frame(msg):
+    data = json.dumps(msg).encode()
+    data = struct.pack('>I', len(data)) + data
+    while data:
+        sent = os.write(1, data)
+        data = data[sent:]
+
+def read_exact(length):
+    data = b''
+    while len(data) < length:
+        buf = os.read(0, length - len(data))
+        if not buf:
+            return None
+        data += buf
+    return data
+
+def read_frame():
+    hdr = read_exact(4)
+    if hdr is None:
+        return None
+    length, = struct.unpack('>I', hdr)
+    data = read_exact(length)
+    if data is None:
+        return None
+    return json.loads(data.decode())
+
+class Agent:
+    def __init__(self):
+        self.ctrls = {}
+        self.next_handle = 1
+
+    def forward_events(self, handle):
+        ctrl = self.ctrls[handle]
+        while ctrl.pending():
+            write_frame({'event': handle, 'msg': ctrl.recv()})
+
+    def request(self, handle, cmd, timeout):
+        ctrl = self.ctrls[handle]
+        if not ctrl.attached:
+            return ctrl.request(cmd, timeout=timeout)
+        # Events received while waiting for the response are forwarded
+        # instead of being returned as the response.
+        self.forward_events(handle)
+        ctrl._send(cmd)
+        end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0 or not ctrl.pending(timeout=remaining):
+                raise Exception("Timeout on waiting response")
+            msg = ctrl.recv()
+            if not is_event(msg):
+                return msg
+            write_frame({'event': handle, 'msg': msg})
+
+    def handle(self, msg):
+        op = msg['op']
+        if op == 'hello':
+            return {'version': 1}
+        if op == 'open':
+            path = msg['path']
+            if msg.get('ifname'):
+                path = os.path.join(path, msg['ifname'])
+            handle = self.next_handle
+            self.next_handle += 1
+            self.ctrls[handle] = Ctrl(path)
+            return {'handle': handle}
+        handle = msg['handle']
+        ctrl = self.ctrls[handle]
+        if op == 'request':
+            return {'reply': self.request(handle, msg['cmd'],
+                                          msg.get('timeout', 10))}
+        if op == 'attach':
+            ctrl.attach()
+            return {}
+        if op == 'detach':
+            if ctrl.attached:
+                if "FAIL" in self.request(handle, "DETACH", 10):
+                    raise Exception("DETACH failed")
+                ctrl.attached = False
+            return {}
+        if op == 'close':
+            del self.ctrls[handle]
+            ctrl.close()
+            return {}
+        raise Exception("Unknown operation " + op)
+
+    def run(self):
+        while True:
+            socks = {}
+            for handle, ctrl in self.ctrls.items():
+                if ctrl.attached:
+                    socks[ctrl.s.fileno()] = handle
+            r, w, e = select.select([0] + list(socks.keys()), [], [])
+            for fd in r:
+                if fd in socks:
+                    self.forward_events(socks[fd])
+            if 0 not in r:
+                continue
+            msg = read_frame()
+            if msg is None:
+                break
+            try:
+                reply = self.handle(msg)
+            except Exception as e:
+                reply = {'error': str(e)}
+            reply['id'] = msg.get('id')
+            write_frame(reply)
+        for ctrl in self.ctrls.values():
+            try:
+                ctrl.close()
+            except Exception:
+                pass
+
+if __name__ == "__main__":
+    Agent().run()
@@ -11,6 +11,12 @@ import tempfile
 import os
 import traceback
 import select
+import shlex
+import binascii
+import atexit
+import time
+
+import instrument
 
 logger = logging.getLogger()
 
@@ -38,15 +44,125 @@ def execute_thread(command, reply):
     reply.append(buf)
 
 def gen_reaper_file(conf):
-    fd, filename = tempfile.mkstemp(dir='/tmp', prefix=conf + '-')
-    f = os.fdopen(fd, 'w')
-
-    f.write("#!/bin/sh\n")
-    f.write("name=\"$(basename $0)\"\n")
-    f.write("echo $$ > /tmp/$name.pid\n")
-    f.write("exec \"$@\"\n");
-
-    return filename;
+    # The reaper is a shell wrapper that records the PID of the command so
+    # that it can be killed later; only the name of the PID file is needed.
+    return "/tmp/%s-%s" % (conf, binascii.hexlify(os.urandom(6)).decode())
+
+def reaper_command(filename, command, remote):
+    script = 'echo $$ > ' + filename + '.pid; exec "$@"'
+    if remote:
+        return ["sh", "-c", shlex.quote(script), "reaper"] + command
+    return ["sh", "-c", script, "reaper"] + command
+
+# Use a shared SSH connection (ControlMaster) for all ssh/scp commands to a
+# host and a persistent shell session for Host.execute() so that each
+# command does not need a new SSH handshake.
+persistent_sessions = True
+ssh_control_path = "/tmp/remotehost-ssh-%r@%h:%p"
+ssh_control_persist = 60
+
+def ssh_options():
+    if not persistent_sessions:
+        return []
+    return ["-o", "ControlMaster=auto",
+            "-o", "ControlPath=" + ssh_control_path,
+            "-o", "ControlPersist=" + str(ssh_control_persist)]
+
+class SSHSession:
+    """Long-lived remote shell for running commands one at a time
+
+    Each command is run in a subshell and followed by a marker line with the
+    exit status and the stderr output of the command so that the output of
+    consecutive commands can be separated in the stdout stream. Commands
+    from multiple threads are serialized."""
+
+    def __init__(self, target):
+        self.target = target
+        self.lock = threading.Lock()
+        self.proc = None
+        self.buf = b''
+        self.count = 0
+
+    def start(self):
+        cmd = ["ssh"] + ssh_options() + [self.target, "exec sh"]
+        logger.debug("start SSH session: " + ' '.join(cmd))
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, bufsize=0)
+        self.buf = b''
+
+    def close(self):
+        with self.lock:
+            if self.proc is None:
+                return
+            try:
+                self.proc.stdin.write(b"exit\n")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+                self.proc.wait()
+            self.proc = None
+
+    def _read_until(self, marker):
+        while True:
+            pos = self.buf.find(marker)
+            if pos >= 0:
+                data = self.buf[0:pos]
+                self.buf = self.buf[pos + len(marker):]
+                return data
+            data = os.read(self.proc.stdout.fileno(), 65536)
+            if not data:
+                raise EOFError("SSH session to %s closed" % self.target)
+            self.buf += data
+
+    def run(self, command):
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self.start()
+            self.count += 1
+            token = "REMOTEHOST-%s-%d" % (binascii.hexlify(os.urandom(4)).decode(),
+                                          self.count)
+            err = "/tmp/remotehost-err.$$"
+            script = "(" + command + ") </dev/null 2>" + err + "; s=$?; "
+            script += "printf '\\n" + token + " %d\\n' $s; "
+            script += "if [ $s -ne 0 ]; then cat " + err + "; fi; "
+            script += "rm -f " + err + "; "
+            script += "printf '\\n" + token + "-END\\n'\n"
+            try:
+                self.proc.stdin.write(script.encode())
+                buf = self._read_until(b'\n' + token.encode() + b' ')
+                status = int(self._read_until(b'\n'))
+                errbuf = self._read_until(b'\n' + token.encode() + b'-END\n')
+            except (EOFError, OSError, ValueError) as e:
+                logger.debug("SSH session failed: " + str(e))
+                self.proc.kill()
+                self.proc.wait()
+                self.proc = None
+                return 255, str(e).encode()
+            if status != 0:
+                buf = errbuf
+            return status, buf
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(target):
+    with _sessions_lock:
+        session = _sessions.get(target)
+        if session is None:
+            session = SSHSession(target)
+            _sessions[target] = session
+        return session
+
+def close_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+atexit.register(close_sessions)
 
 class Host():
     def __init__(self, host=None, ifname=None, port=None, name="", user="root"):
@@ -79,14 +195,35 @@ class Host():
         logger.debug("buf: " + str(buf))
         return status, buf.decode()
 
+    def ssh_target(self):
+        if self.user:
+            return self.user + "@" + self.host
+        return self.host
+
+    def ssh_command(self, command):
+        return ["ssh"] + ssh_options() + [self.ssh_target(), ' '.join(command)]
+
     def execute(self, command):
+        if not instrument.enabled:
+            return self._execute(command)
+        start = time.perf_counter()
+        try:
+            return self._execute(command)
+        finally:
+            instrument.exec_done(command, start)
+
+    def _execute(self, command):
         if self.host is None:
             return self.local_execute(command)
 
-        if self.user:
-            cmd = ["ssh", self.user + "@" + self.host, ' '.join(command)]
-        else:
-            cmd = ["ssh", self.host, ' '.join(command)]
+        if persistent_sessions:
+            logger.debug(self.name + " execute: " + ' '.join(command))
+            status, buf = get_session(self.ssh_target()).run(' '.join(command))
+            logger.debug(self.name + " status: " + str(status))
+            logger.debug(self.name + " buf: " + str(buf))
+            return status, buf.decode()
+
+        cmd = self.ssh_command(command)
         _cmd = self.name + " execute: " + ' '.join(cmd)
         logger.debug(_cmd)
         err = tempfile.TemporaryFile()
@@ -107,9 +244,7 @@ class Host():
     def thread_run(self, command, res, use_reaper=True):
         if use_reaper:
             filename = gen_reaper_file("reaper")
-            self.send_file(filename, filename)
-            self.execute(["chmod", "755", filename])
-            _command = [filename] + command
+            _command = reaper_command(filename, command, self.host is not None)
         else:
             filename = ""
             _command = command
@@ -117,10 +252,7 @@ class Host():
         if self.host is None:
             cmd = _command
         else:
-            if self.user:
-                cmd = ["ssh", self.user + "@" + self.host, ' '.join(_command)]
-            else:
-                cmd = ["ssh", self.host, ' '.join(_command)]
+            cmd = self.ssh_command(_command)
         _cmd = self.name + " thread_run: " + ' '.join(cmd)
         logger.debug(_cmd)
         t = threading.Thread(target=execute_thread, name=filename, args=(cmd, res))
@@ -153,9 +285,7 @@ class Host():
         if t.is_alive():
             raise Exception("thread still alive")
 
-        self.execute(["rm", pid_file])
-        self.execute(["rm", t.name])
-        self.local_execute(["rm", t.name])
+        self.execute(["rm", "-f", pid_file])
 
     def thread_wait(self, t, wait=None):
         if wait == None:
@@ -175,15 +305,10 @@ class Host():
 
     def proc_run(self, command):
         filename = gen_reaper_file("reaper")
-        self.send_file(filename, filename)
-        self.execute(["chmod", "755", filename])
-        _command = [filename] + command
+        _command = reaper_command(filename, command, self.host is not None)
 
         if self.host:
-            if self.user:
-                cmd = ["ssh", self.user + "@" + self.host, ' '.join(_command)]
-            else:
-                cmd = ["ssh", self.host, ' '.join(_command)]
+            cmd = self.ssh_command(_command)
         else:
             cmd = _command
 
@@ -240,10 +365,8 @@ class Host():
         if not proc:
             return
 
-        self.execute(["kill `cat " + proc.reaper_file + ".pid`"])
-        self.execute(["rm", proc.reaper_file + ".pid"])
-        self.execute(["rm", proc.reaper_file])
-        self.local_execute(["rm", proc.reaper_file])
+        pid_file = proc.reaper_file + ".pid"
+        self.execute(["kill `cat " + pid_file + "`; rm -f " + pid_file])
         proc.kill()
 
     def proc_dump(self, proc):
@@ -271,9 +394,9 @@ class Host():
         for log in self.logs:
             if local_log_dir:
                 if self.user:
-                    self.local_execute(["scp", self.user + "@[" + self.host + "]:" + log, local_log_dir])
+                    self.local_execute(["scp"] + ssh_options() + [self.user + "@[" + self.host + "]:" + log, local_log_dir])
                 else:
-                    self.local_execute(["scp", "[" + self.host + "]:" + log, local_log_dir])
+                    self.local_execute(["scp"] + ssh_options() + ["[" + self.host + "]:" + log, local_log_dir])
             self.execute(["rm", log])
         del self.logs[:]
 
@@ -281,7 +404,8 @@ class Host():
         if self.host is None:
             return
         if self.user:
-            self.local_execute(["scp", src,
-                                self.user + "@[" + self.host + "]:" + dst])
+            self.local_execute(["scp"] + ssh_options() +
+                               [src, self.user + "@[" + self.host + "]:" + dst])
         else:
-            self.local_execute(["scp", src, "[" + self.host + "]:" + dst])
+            self.local_execute(["scp"] + ssh_options() +
+                               [src, "[" + self.host + "]:" + dst])
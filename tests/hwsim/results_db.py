@@ -0,0 +1,161 @@
+# sqlite3 database for test case results
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import logging
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger()
+
+class ResultsDB:
+    """Test results database (run-tests.py -S)
+
+    With wal=True, the database is used in WAL mode so that multiple test
+    runners can write to the same file without serializing on each commit
+    and a reader does not block the writers. WAL needs shared memory
+    mapping of the -shm file, so it must not be used on network or 9p
+    file systems; the rollback journal is used by default. Rows are
+    written in batched transactions that are committed after a number of
+    test cases or after a maximum delay. Log files are stored zlib
+    compressed and the logs.compression column indicates this for the
+    rows that have it set."""
+
+    def __init__(self, path, commit_interval=10, commit_delay=5,
+                 compress=True, wal=False):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.commit_interval = commit_interval
+        self.commit_delay = commit_delay
+        self.compress = compress
+        self.uncommitted = 0
+        self.last_commit = time.time()
+        try:
+            if wal:
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.execute('PRAGMA synchronous=NORMAL')
+            else:
+                # WAL mode is persistent, so switch back from it if an
+                # earlier run enabled it
+                mode = self.conn.execute('PRAGMA journal_mode').fetchone()[0]
+                if mode.lower() == 'wal':
+                    self.conn.execute('PRAGMA journal_mode=DELETE')
+        except sqlite3.Error as e:
+            logger.info("sqlite: could not set journal mode: " + str(e))
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results (test,result,run,time,duration,build,commitid)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tests (test,description)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS logs (test,run,type,contents,compression)')
+        cols = [row[1] for row in self.conn.execute('PRAGMA table_info(logs)')]
+        if 'compression' not in cols:
+            self.conn.execute('ALTER TABLE logs ADD COLUMN compression')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_test_run_result ON results (test,run,result)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_run ON results (run)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS logs_test_run ON logs (test,run)')
+        try:
+            self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS tests_idx ON tests (test)')
+        except sqlite3.Error as e:
+            # Older databases may already have duplicate entries
+            logger.debug("sqlite: could not add tests index: " + str(e))
+        self.conn.commit()
+
+    def close(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.time()
+
+    def test_done(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval or \
+           time.time() - self.last_commit >= self.commit_delay:
+            self.commit()
+
+    def set_description(self, test, description):
+        sql = 'INSERT OR REPLACE INTO tests(test,description) VALUES (?, ?)'
+        self.conn.execute(sql, (test, description))
+
+    def add_result(self, test, result, run, duration, build, commit,
+                   prefill=False):
+        if prefill:
+            self.conn.execute('DELETE FROM results WHERE test=? AND run=? AND result=?',
+                              (test, run, 'NOTRUN'))
+        sql = "INSERT INTO results(test,result,run,time,duration,build,commitid) VALUES(?, ?, ?, ?, ?, ?, ?)"
+        self.conn.execute(sql, (test, result, run, time.time(), duration,
+                                build, commit))
+
+    def add_log_file(self, test, run, type, path):
+        # Compress the file in chunks so that the full uncompressed contents
+        # is never in memory.
+        chunks = []
+        length = 0
+        comp = zlib.compressobj() if self.compress else None
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(65536)
+                if not data:
+                    break
+                if comp:
+                    data = comp.compress(data)
+                if data:
+                    chunks.append(data)
+                    length += len(data)
+        if comp:
+            data = comp.flush()
+            chunks.append(data)
+            length += len(data)
+        compression = 'zlib' if comp else None
+        if not hasattr(self.conn, 'blobopen'):
+            sql = "INSERT INTO logs(test,run,type,contents,compression) VALUES(?, ?, ?, ?, ?)"
+            self.conn.execute(sql, (test, run, type, b''.join(chunks),
+                                    compression))
+            return
+        sql = "INSERT INTO logs(test,run,type,contents,compression) VALUES(?, ?, ?, zeroblob(?), ?)"
+        cur = self.conn.execute(sql, (test, run, type, length, compression))
+        with self.conn.blobopen('logs', 'contents', cur.lastrowid) as blob:
+            for data in chunks:
+                blob.write(data)
+
+    def get_log(self, test, run, type):
+        sql = "SELECT contents,compression FROM logs WHERE test=? AND run=? AND type=?"
+        row = self.conn.execute(sql, (test, run, type)).fetchone()
+        if row is None:
+            return None
+        contents, compression = row
+        if compression == 'zlib':
+            return zlib.decompress(contents)
+        return contents
+
+    def pass_rate(self, test=None, runs=None):
+        """Return {test: (passed, total)} over the last runs (all if None)"""
+        sql = "SELECT test,SUM(result='PASS'),COUNT(*) FROM results WHERE result IN ('PASS','FAIL')"
+        params = []
+        if test:
+            sql += " AND test=?"
+            params.append(test)
+        if runs:
+            sql += " AND run IN (SELECT DISTINCT run FROM results ORDER BY run DESC LIMIT ?)"
+            params.append(runs)
+        sql += " GROUP BY test"
+        res = {}
+        for name, passed, total in self.conn.execute(sql, params):
+            res[name] = (passed, total)
+        return res
+
+    def duration_history(self, test, limit=None, result='PASS'):
+        """Return [(run, time, duration, result)] for a test, newest first"""
+        sql = "SELECT run,time,duration,result FROM results WHERE test=?"
+        params = [test]
+        if result:
+            sql += " AND result=?"
+            params.append(result)
+        sql += " ORDER BY time DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
@@ -10,10 +10,14 @@ import os
 import re
 import gc
 import sys
+import ast
+import json
 import time
-import glob
+import hashlib
+import resource
 from datetime import datetime
 import argparse
+import atexit
 import subprocess
 import termios
 
@@ -31,9 +35,13 @@ sys.path.append(os.path.join(scriptsdir, '..', '..', 'wpaspy'))
 
 from wpasupplicant import WpaSupplicant
 from hostapd import HostapdGlobal
-from check_kernel import check_kernel
+from check_kernel import check_kernel, KmsgWatcher
+from postprocess import LogPostProcessor
+from logindex import LogIndexer
 from wlantest import Wlantest
+import tshark
 from utils import HwsimSkip
+import instrument
 
 def set_term_echo(fd, enabled):
     [iflag, oflag, cflag, lflag, ispeed, ospeed, cc] = termios.tcgetattr(fd)
@@ -44,6 +52,58 @@ def set_term_echo(fd, enabled):
     termios.tcsetattr(fd, termios.TCSANOW,
                       [iflag, oflag, cflag, lflag, ispeed, ospeed, cc])
 
+class CtrlPool(object):
+    # Global control interface connections that are reused between test
+    # cases instead of opening new sockets multiple times for each test
+    # case. A connection is verified with PING before it is returned and
+    # replaced with a new one if the process does not respond anymore.
+    def __init__(self):
+        self.conns = {}
+
+    def _get(self, key, create, ping):
+        conn = self.conns.get(key)
+        if conn:
+            try:
+                if ping(conn):
+                    return conn
+            except Exception as e:
+                pass
+            logger.debug("Reconnect pooled control interface " + key)
+            self.remove(key)
+        conn = create()
+        self.conns[key] = conn
+        return conn
+
+    def wpas(self, global_iface):
+        return self._get(global_iface,
+                         lambda: WpaSupplicant(global_iface=global_iface,
+                                               monitor=False),
+                         lambda wpas: wpas.global_ping())
+
+    def hapd(self):
+        return self._get('hostapd', lambda: HostapdGlobal(monitor=False),
+                         lambda hapd: hapd.ping())
+
+    def remove(self, key):
+        conn = self.conns.pop(key, None)
+        if conn is None:
+            return
+        try:
+            if isinstance(conn, WpaSupplicant):
+                conn.close_ctrl()
+            else:
+                conn.close()
+        except Exception as e:
+            pass
+
+    def close(self):
+        for key in list(self.conns.keys()):
+            self.remove(key)
+
+ctrl_pool = CtrlPool()
+log_indexer = None
+kmsg_watcher = None
+
 def reset_devs(dev, apdev):
     ok = True
     for d in dev:
@@ -54,21 +114,17 @@ def reset_devs(dev, apdev):
             ok = False
 
     for ifname in ['/tmp/wpas-wlan5', '/tmp/wpas-wlan6', '/tmp/wpas-wlan7']:
-        wpas = None
         try:
-            wpas = WpaSupplicant(global_iface=ifname, monitor=False)
+            wpas = ctrl_pool.wpas(ifname)
             ifaces = wpas.global_request("INTERFACES").splitlines()
             for iface in ifaces:
                 if iface.startswith("wlan"):
                     wpas.interface_remove(iface)
         except Exception as e:
             pass
-        if wpas:
-            wpas.close_ctrl()
-            del wpas
 
     try:
-        hapd = HostapdGlobal()
+        hapd = ctrl_pool.hapd()
         hapd.flush()
         ifaces = hapd.request("INTERFACES").splitlines()
         for iface in ifaces:
@@ -83,19 +139,11 @@ def reset_devs(dev, apdev):
 def add_log_file(conn, test, run, type, path):
     if not os.path.exists(path):
         return
-    contents = None
-    with open(path, 'rb') as f:
-        contents = f.read()
-    if contents is None:
-        return
-    sql = "INSERT INTO logs(test,run,type,contents) VALUES(?, ?, ?, ?)"
-    params = (test, run, type, sqlite3.Binary(contents))
     try:
-        conn.execute(sql, params)
-        conn.commit()
+        conn.add_log_file(test, run, type, path)
     except Exception as e:
         logger.exception("sqlite:")
-        logger.error("sql: %r" % (params, ))
+        logger.error("sql: %r" % ((test, run, type, path), ))
 
 def report(conn, prefill, build, commit, run, test, result, duration, logdir,
            sql_commit=True):
@@ -104,14 +152,10 @@ def report(conn, prefill, build, commit, run, test, result, duration, logdir,
             build = ''
         if not commit:
             commit = ''
-        if prefill:
-            conn.execute('DELETE FROM results WHERE test=? AND run=? AND result=?', (test, run, 'NOTRUN'))
-        sql = "INSERT INTO results(test,result,run,time,duration,build,commitid) VALUES(?, ?, ?, ?, ?, ?, ?)"
-        params = (test, result, run, time.time(), duration, build, commit)
+        params = (test, result, run, duration, build, commit)
         try:
-            conn.execute(sql, params)
-            if sql_commit:
-                conn.commit()
+            conn.add_result(test, result, run, duration, build, commit,
+                            prefill=prefill)
         except Exception as e:
             logger.exception("sqlite:")
             logger.error("sql: %r" % (params, ))
@@ -121,6 +165,8 @@ def report(conn, prefill, build, commit, run, test, result, duration, logdir,
                         "hostapd", "dmesg", "hwsim0", "hwsim0.pcapng"]:
                 add_log_file(conn, test, run, log,
                              logdir + "/" + test + "." + log)
+        if sql_commit:
+            conn.test_done()
 
 class DataCollector(object):
     def __init__(self, logdir, testname, kmemleak, args):
@@ -130,6 +176,7 @@ class DataCollector(object):
         self._dmesg = args.dmesg
         self._kmemleak = kmemleak
         self._dbus = args.dbus
+        self.kernel_issues = None
     def __enter__(self):
         if self._tracing:
             output = os.path.abspath(os.path.join(self._logdir, '%s.dat' % (self._testname, )))
@@ -161,36 +208,6 @@ class DataCollector(object):
             self._trace_cmd.stdin.flush()
             self._trace_cmd.wait()
 
-        pcap = os.path.join(self._logdir, f'{self._testname}.hwsim0.pcapng')
-        if os.path.exists(pcap):
-            found_key = False
-            pmks_name = os.path.join(self._logdir, f'{self._testname}.pmks')
-            ptks_name = os.path.join(self._logdir, f'{self._testname}.ptks')
-            with open(pmks_name, 'wb') as pmks, \
-                 open(ptks_name, 'wb') as ptks:
-                logs = os.path.join(self._logdir, f'{self._testname}.*')
-                for f in glob.glob(logs):
-                    if f.endswith('.pcapng'): continue
-                    with open(f, 'rb') as logfile:
-                        for line in logfile:
-                            if b'PTK - hexdump' in line:
-                                ptks.write(line.split(b':')[-1].replace(b' ', b''))
-                                found_key = True
-                            if b'PMK - hexdump' in line:
-                                pmks.write(line.split(b':')[-1].replace(b' ', b''))
-                                found_key = True
-
-            if found_key:
-                out_pcap = os.path.join(self._logdir, f'{self._testname}.hwsim0.dec.pcapng')
-                if os.path.isfile('../../wlantest/wlantest'):
-                    wlantest_bin = '../../wlantest/wlantest'
-                else:
-                    wlantest_bin = 'wlantest'
-                with open(os.path.join(self._logdir, f'{self._testname}.dec.log'), 'w') as dec_log:
-                    subprocess.run([wlantest_bin, '-r', pcap, '-f', pmks_name,
-                                    '-T', ptks_name, '-n', out_pcap],
-                                   stdout=dec_log)
-
         if self._kmemleak:
             output = os.path.join(self._logdir, '%s.kmemleak' % (self._testname, ))
             num = 0
@@ -226,7 +243,18 @@ class DataCollector(object):
             while os.path.exists(output):
                 output = os.path.join(self._logdir, '%s.dmesg-%d' % (self._testname, num))
                 num += 1
-            subprocess.call(['dmesg', '-c'], stdout=open(output, 'w'))
+            if kmsg_watcher:
+                self.kernel_issues = kmsg_watcher.finish(self._testname,
+                                                         output)
+            else:
+                subprocess.call(['dmesg', '-c'], stdout=open(output, 'w'))
+
+def progress(msg_type, **kw):
+    # JSON text sequence (RFC 7464) framing: each message starts with RS
+    # and ends with LF so that it can be separated from any other output.
+    kw['type'] = msg_type
+    sys.stdout.write('\x1e' + json.dumps(kw) + '\n')
+    sys.stdout.flush()
 
 def rename_log(logdir, basename, testname, dev):
     try:
@@ -242,43 +270,112 @@ def rename_log(logdir, basename, testname, dev):
         if dev:
             dev.relog()
             subprocess.call(['chown', '-f', getpass.getuser(), srcname])
+        if log_indexer:
+            log_indexer.finish(basename, dstname)
+        return dstname
     except Exception as e:
         logger.exception("Failed to rename log files")
+    return None
 
 def is_long_duration_test(t):
     return hasattr(t, "long_duration_test") and t.long_duration_test
 
 def get_test_description(t):
-    if t.__doc__ is None:
+    if t['doc'] is None:
         desc = "MISSING DESCRIPTION"
     else:
-        desc = t.__doc__
-    if is_long_duration_test(t):
+        desc = t['doc']
+    if t['long']:
         desc += " [long]"
     return desc
 
+def scan_test_module(data, fname):
+    # Find the test cases without importing the module. A later definition
+    # with the same name replaces the earlier one like it would on import.
+    tests = {}
+    for node in ast.parse(data, fname).body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        if not node.name.startswith("test_"):
+            continue
+        long_duration = False
+        for d in node.decorator_list:
+            if isinstance(d, ast.Name) and d.id == "long_duration_test":
+                long_duration = True
+            elif isinstance(d, ast.Attribute) and d.attr == "long_duration_test":
+                long_duration = True
+        tests[node.name] = [ast.get_docstring(node, clean=False),
+                            long_duration]
+    return [[func] + val for func, val in tests.items()]
+
+def load_test_index():
+    index_file = os.path.join(scriptsdir, '.test-index.json')
+    try:
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != 1:
+            index = {}
+    except Exception:
+        index = {}
+    files = index.get('files', {})
+    updated = False
+    modules = []
+    new_files = {}
+    for fname in os.listdir(scriptsdir):
+        m = re.match(r'(test_.*)\.py$', fname)
+        if not m:
+            continue
+        path = os.path.join(scriptsdir, fname)
+        st = os.stat(path)
+        entry = files.get(fname)
+        if not entry or entry['mtime'] != st.st_mtime_ns or \
+           entry['size'] != st.st_size:
+            with open(path, 'rb') as f:
+                data = f.read()
+            sha1 = hashlib.sha1(data).hexdigest()
+            if not entry or entry['sha1'] != sha1:
+                entry = {'sha1': sha1, 'tests': scan_test_module(data, path)}
+            entry['mtime'] = st.st_mtime_ns
+            entry['size'] = st.st_size
+            updated = True
+        new_files[fname] = entry
+        modules.append((m.group(1), entry['tests']))
+    if updated or len(new_files) != len(files):
+        # The index is only a cache, so ignore failures to write it (e.g.,
+        # read-only file system within a VM).
+        tmp = index_file + '.%d' % os.getpid()
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'version': 1, 'files': new_files}, f)
+            os.rename(tmp, index_file)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    return modules
+
 def import_test_cases():
     tests = []
     test_modules = []
     names = set()
-    files = os.listdir(scriptsdir)
-    re_files = (re.match(r'(test_.*)\.py$', n) for n in files)
-    test_files = (m.group(1) for m in re_files if m)
-    for t in test_files:
-        mod = __import__(t)
-        test_modules.append(mod.__name__.replace('test_', '', 1))
-        for key, val in mod.__dict__.items():
-            if key.startswith("test_"):
-                if val.__doc__ is None:
-                    print(f"Test case {val.__name__} misses __doc__")
-                tests.append(val)
-
-                name = val.__name__.replace('test_', '', 1)
-                if name in names:
-                    print(f"Test case {name} defined multiple times")
-                names.add(name)
+    for module, entries in load_test_index():
+        test_modules.append(module.replace('test_', '', 1))
+        for func, doc, long_duration in entries:
+            if doc is None:
+                print(f"Test case {func} misses __doc__")
+            name = func.replace('test_', '', 1)
+            tests.append({'name': name, 'module': module, 'func': func,
+                          'doc': doc, 'long': long_duration})
+            if name in names:
+                print(f"Test case {name} defined multiple times")
+            names.add(name)
     return tests, test_modules, names
 
+def load_test(t):
+    # Test modules are imported only when one of their test cases is run
+    return getattr(__import__(t['module']), t['func'])
+
 def main():
     tests, test_modules, test_names = import_test_cases()
 
@@ -297,6 +394,8 @@ def main():
 
     parser.add_argument('-S', metavar='<sqlite3 db>', dest='database',
                         help='database to write results to')
+    parser.add_argument('--db-wal', action='store_true',
+                        help='use WAL mode for the results database (only on a local file system)')
     parser.add_argument('--prefill-tests', action='store_true', dest='prefill',
                         help='prefill test database with NOTRUN before all tests')
     parser.add_argument('--commit', metavar='<commit id>',
@@ -310,6 +409,12 @@ def main():
                         help='collect dmesg per test case (in log directory)')
     parser.add_argument('--dbus', action='store_true', dest='dbus',
                         help='collect dbus per test case (in log directory)')
+    parser.add_argument('--postprocess-workers', metavar='<num>', type=int,
+                        default=2, dest='postprocess_workers',
+                        help='number of background threads for log post-processing (0 = process after each test case)')
+    parser.add_argument('--compress-logs', action='store_true',
+                        dest='compress_logs',
+                        help='gzip the per test case log files after post-processing')
     parser.add_argument('--shuffle-tests', action='store_true',
                         dest='shuffle_tests',
                         help='Shuffle test cases to randomize order')
@@ -325,6 +430,17 @@ def main():
                         help='test modules file name')
     parser.add_argument('-i', action='store_true', dest='stdin_ctrl',
                         help='stdin-controlled test case execution')
+    parser.add_argument('--progress-json', action='store_true',
+                        dest='progress_json',
+                        help='write progress messages to stdout as RS-prefixed JSON lines')
+    parser.add_argument('--perf', action='store_true',
+                        help='record timing of control interface requests, event waits, sleeps, and command executions per test case (<test>.perf in log directory)')
+    parser.add_argument('--sleep-audit', action='store_true',
+                        dest='sleep_audit',
+                        help='report the time spent in fixed time.sleep() calls per test case (sleep-audit.txt in log directory)')
+    parser.add_argument('--pcapng-filter', action='store_true',
+                        dest='pcapng_filter',
+                        help='evaluate the common tshark display filters and fields in-process instead of running tshark')
     parser.add_argument('tests', metavar='<test>', nargs='*', type=str,
                         help='tests to run (only valid without -f)')
 
@@ -357,10 +473,11 @@ def main():
         if not sqlite3_imported:
             print("No sqlite3 module found")
             sys.exit(2)
-        conn = sqlite3.connect(args.database)
-        conn.execute('CREATE TABLE IF NOT EXISTS results (test,result,run,time,duration,build,commitid)')
-        conn.execute('CREATE TABLE IF NOT EXISTS tests (test,description)')
-        conn.execute('CREATE TABLE IF NOT EXISTS logs (test,run,type,contents)')
+        from results_db import ResultsDB
+        conn = ResultsDB(args.database, wal=args.db_wal)
+        # Results are committed in batches, so make sure the last ones are
+        # committed on all exit paths
+        atexit.register(conn.close)
     else:
         conn = None
 
@@ -381,7 +498,7 @@ def main():
     if args.tests:
         for selected in args.tests:
             for t in tests:
-                name = t.__name__.replace('test_', '', 1)
+                name = t['name']
                 if selected.endswith('*'):
                     prefix = selected.rstrip('*')
                     if name.startswith(prefix):
@@ -390,26 +507,23 @@ def main():
                     tests_to_run.append(t)
     else:
         for t in tests:
-            name = t.__name__.replace('test_', '', 1)
             if args.testmodules:
-                if t.__module__.replace('test_', '', 1) not in args.testmodules:
+                if t['module'].replace('test_', '', 1) not in args.testmodules:
                     continue
             tests_to_run.append(t)
 
     if args.update_tests_db:
         for t in tests_to_run:
-            name = t.__name__.replace('test_', '', 1)
+            name = t['name']
             print(name + " - " + get_test_description(t))
             if conn:
-                sql = 'INSERT OR REPLACE INTO tests(test,description) VALUES (?, ?)'
                 params = (name, get_test_description(t))
                 try:
-                    conn.execute(sql, params)
+                    conn.set_description(*params)
                 except Exception as e:
                     logger.exception("sqlite:")
                     logger.error("sql: %r" % (params,))
         if conn:
-            conn.commit()
             conn.close()
         sys.exit(0)
 
@@ -462,8 +576,13 @@ def main():
             conn = None
         sys.exit(1)
 
+    global kmsg_watcher
     if args.dmesg:
-        subprocess.call(['dmesg', '-c'], stdout=open('/dev/null', 'w'))
+        try:
+            kmsg_watcher = KmsgWatcher()
+        except OSError as e:
+            logger.info("Cannot read /dev/kmsg (%s) - use dmesg -c" % str(e))
+            subprocess.call(['dmesg', '-c'], stdout=open('/dev/null', 'w'))
 
     try:
         # try to clear out any leaks that happened earlier
@@ -480,7 +599,7 @@ def main():
 
     if conn and args.prefill:
         for t in tests_to_run:
-            name = t.__name__.replace('test_', '', 1)
+            name = t['name']
             report(conn, False, args.build, args.commit, run, name, 'NOTRUN', 0,
                    args.logdir, sql_commit=False)
         conn.commit()
@@ -491,7 +610,7 @@ def main():
         split_total = int(vals[1])
         logger.info("Parallel execution - %d/%d" % (split_server, split_total))
         split_server -= 1
-        tests_to_run.sort(key=lambda t: t.__name__)
+        tests_to_run.sort(key=lambda t: t['func'])
         tests_to_run = [x for i, x in enumerate(tests_to_run) if i % split_total == split_server]
 
     if args.shuffle_tests:
@@ -500,14 +619,32 @@ def main():
 
     count = 0
     if args.stdin_ctrl:
-        print("READY")
-        sys.stdout.flush()
+        if args.progress_json:
+            progress('ready')
+        else:
+            print("READY")
+            sys.stdout.flush()
         num_tests = 0
     else:
         num_tests = len(tests_to_run)
     if args.stdin_ctrl:
         set_term_echo(sys.stdin.fileno(), False)
 
+    global log_indexer
+    log_indexer = LogIndexer(args.logdir, ['log0', 'log1', 'log2', 'log5',
+                                           'log6', 'log7', 'hostapd'])
+    perf_total = {}
+    sleep_audit = []
+    if args.pcapng_filter:
+        tshark.use_pcapng_filter = True
+    if args.perf:
+        instrument.enable()
+    elif args.sleep_audit:
+        instrument.enable(sleep_only=True)
+    postproc = LogPostProcessor(args.logdir,
+                                workers=args.postprocess_workers,
+                                compress=args.compress_logs)
+
     check_country_00 = True
     for d in dev:
         if d.get_driver_status_field("country") != "00":
@@ -523,18 +660,20 @@ def main():
                 break
             t = None
             for tt in tests:
-                name = tt.__name__.replace('test_', '', 1)
-                if name == test:
-                    t = tt
+                if tt['name'] == test:
+                    t = load_test(tt)
                     break
             if not t:
-                print("NOT-FOUND")
-                sys.stdout.flush()
+                if args.progress_json:
+                    progress('not-found', name=test)
+                else:
+                    print("NOT-FOUND")
+                    sys.stdout.flush()
                 continue
         else:
             if len(tests_to_run) == 0:
                 break
-            t = tests_to_run.pop(0)
+            t = load_test(tests_to_run.pop(0))
 
         if dev[0].get_driver_status_field("country") == "98":
             # Work around cfg80211 regulatory issues in clearing intersected
@@ -577,16 +716,23 @@ def main():
             pass
 
         reset_ok = True
-        with DataCollector(args.logdir, name, have_kmemleak, args):
+        collector = DataCollector(args.logdir, name, have_kmemleak, args)
+        with collector:
             count = count + 1
             msg = "START {} {}/{}".format(name, count, num_tests)
             logger.info(msg)
-            if args.loglevel == logging.WARNING:
+            if args.progress_json:
+                progress('start', name=name, count=count, total=num_tests)
+            elif args.loglevel == logging.WARNING:
                 print(msg)
                 sys.stdout.flush()
             if t.__doc__:
                 logger.info("Test: " + t.__doc__)
             start = datetime.now()
+            start_rusage = resource.getrusage(resource.RUSAGE_SELF)
+            test_logs = [os.path.join(args.logdir, name + '.log')]
+            if args.perf or args.sleep_audit:
+                instrument.reset()
             open('/dev/kmsg', 'w').write('TEST-START %s @%.6f\n' % (name, time.time()))
             for d in dev:
                 try:
@@ -598,7 +744,12 @@ def main():
                     d.request("NOTE TEST-START " + name)
                 except Exception as e:
                     logger.exception("Failed to issue TEST-START before " + name + " for " + d.ifname)
-                    print("FAIL " + name + " - could not start test")
+                    if args.progress_json:
+                        progress('result', name=name, result='FAIL',
+                                 duration=0, reason="could not start test")
+                    else:
+                        print("FAIL " + name + " - could not start test")
+                    postproc.close()
                     if conn:
                         conn.close()
                         conn = None
@@ -606,21 +757,26 @@ def main():
                         set_term_echo(sys.stdin.fileno(), True)
                     sys.exit(1)
             for ifname in ['/tmp/wpas-wlan5']:
-                wpas = None
                 try:
-                    wpas = WpaSupplicant(global_iface=ifname, monitor=False)
+                    wpas = ctrl_pool.wpas(ifname)
                     wpas.global_request("NOTE TEST-START " + name)
-                    del wpas
                 except:
                     logger.exception("Failed to issue TEST-START before " + name + " for " + ifname)
-                    print("FAIL " + name + " - could not start test")
+                    if args.progress_json:
+                        progress('warning', name=name,
+                                 text="could not issue TEST-START for " + ifname)
+                    else:
+                        print("FAIL " + name + " - could not start test")
             try:
-                hapd = HostapdGlobal()
+                hapd = ctrl_pool.hapd()
                 hapd.request("NOTE TEST-START " + name)
-                del hapd
             except Exception as e:
                 logger.exception("Failed to issue TEST-START before " + name + " for hostapd")
-                print("FAIL " + name + " - could not start test")
+                if args.progress_json:
+                    progress('warning', name=name,
+                             text="could not issue TEST-START for hostapd")
+                else:
+                    print("FAIL " + name + " - could not start test")
             skip_reason = None
             try:
                 if is_long_duration_test(t) and not args.long:
@@ -692,50 +848,49 @@ def main():
                 reset_ok = reset_devs(dev, apdev)
 
             for i in [5, 6, 7]:
-                wpas = None
                 try:
-                    wpas = WpaSupplicant(global_iface="/tmp/wpas-wlan%d" % i,
-                                         monitor=False)
-                    rename_log(args.logdir, 'log%d' % i, name, wpas)
+                    wpas = ctrl_pool.wpas("/tmp/wpas-wlan%d" % i)
+                    test_logs.append(rename_log(args.logdir, 'log%d' % i, name, wpas))
                     if not args.no_reset:
                         wpas.remove_ifname()
                 except Exception as e:
                     pass
-                if wpas:
-                    wpas.close_ctrl()
-                    del wpas
 
             for i in range(0, 3):
-                rename_log(args.logdir, 'log' + str(i), name, dev[i])
+                test_logs.append(rename_log(args.logdir, 'log' + str(i), name, dev[i]))
             try:
-                hapd = HostapdGlobal()
+                hapd = ctrl_pool.hapd()
             except Exception as e:
                 logger.exception("Failed to connect to hostapd interface")
                 reset_ok = False
                 result = "FAIL"
                 hapd = None
-            rename_log(args.logdir, 'hostapd', name, hapd)
-            if hapd:
-                del hapd
-                hapd = None
+            test_logs.append(rename_log(args.logdir, 'hostapd', name, hapd))
+            hapd = None
 
             # Use None here since this instance of Wlantest() will never be
             # used for remote host hwsim tests on real hardware.
             Wlantest.setup(None)
             wt = Wlantest()
-            rename_log(args.logdir, 'hwsim0.pcapng', name, wt)
-            rename_log(args.logdir, 'hwsim0', name, wt)
+            test_logs.append(rename_log(args.logdir, 'hwsim0.pcapng', name, wt))
+            test_logs.append(rename_log(args.logdir, 'hwsim0', name, wt))
             if os.path.exists(os.path.join(args.logdir, 'fst-wpa_supplicant')):
-                rename_log(args.logdir, 'fst-wpa_supplicant', name, None)
+                test_logs.append(rename_log(args.logdir, 'fst-wpa_supplicant', name, None))
             if os.path.exists(os.path.join(args.logdir, 'fst-hostapd')):
-                rename_log(args.logdir, 'fst-hostapd', name, None)
+                test_logs.append(rename_log(args.logdir, 'fst-hostapd', name, None))
             if os.path.exists(os.path.join(args.logdir, 'wmediumd.log')):
-                rename_log(args.logdir, 'wmediumd.log', name, None)
+                test_logs.append(rename_log(args.logdir, 'wmediumd.log', name, None))
 
         end = datetime.now()
         diff = end - start
 
-        if result == 'PASS' and args.dmesg:
+        if result == 'PASS' and collector.kernel_issues:
+            for phase, line in collector.kernel_issues:
+                logger.info("Kernel issue %s the test case: %s" % (phase, line))
+            logger.info("Kernel issue found in dmesg - mark test failed")
+            result = 'FAIL'
+        elif result == 'PASS' and args.dmesg and \
+             collector.kernel_issues is None:
             if not check_kernel(os.path.join(args.logdir, name + '.dmesg')):
                 logger.info("Kernel issue found in dmesg - mark test failed")
                 result = 'FAIL'
@@ -753,11 +908,36 @@ def main():
         else:
             failed.append(name)
 
+        if args.perf or args.sleep_audit:
+            stats = instrument.reset()
+            instrument.merge(perf_total, stats)
+        if args.perf:
+            perf_file = os.path.join(args.logdir, name + '.perf')
+            instrument.write(perf_file, stats)
+            test_logs.append(perf_file)
+        if args.sleep_audit:
+            sleep_time, sites = instrument.sleep_sites(stats)
+            sleep_count = sum([stat.count for key, stat in sites])
+            sleep_audit.append((name, sleep_time, sleep_count))
+            logger.info("sleep-audit: %.3f s in %d fixed sleep(s)%s" % (
+                sleep_time, sleep_count,
+                (" (most in " + sites[0][0] + ")") if sites else ""))
+
         report(conn, args.prefill, args.build, args.commit, run, name, result,
                diff.total_seconds(), args.logdir)
+        postproc.submit(name)
+        if args.progress_json:
+            rusage = resource.getrusage(resource.RUSAGE_SELF)
+            progress('result', name=name, result=result,
+                     duration=diff.total_seconds(), end=str(end),
+                     reason=str(skip_reason) if skip_reason else None,
+                     rusage={'utime': rusage.ru_utime - start_rusage.ru_utime,
+                             'stime': rusage.ru_stime - start_rusage.ru_stime,
+                             'maxrss': rusage.ru_maxrss},
+                     logs=[l for l in test_logs if l])
         result = "{} {} {} {}".format(result, name, diff.total_seconds(), end)
         logger.info(result)
-        if args.loglevel == logging.WARNING:
+        if args.loglevel == logging.WARNING and not args.progress_json:
             print(result)
             if skip_reason:
                 print("REASON", skip_reason)
@@ -769,6 +949,24 @@ def main():
 
     for d in dev:
         d.close_ctrl()
+    ctrl_pool.close()
+    log_indexer.close()
+    if kmsg_watcher:
+        kmsg_watcher.close()
+    postproc.close()
+
+    if args.perf:
+        lines = instrument.summary(perf_total)
+        with open(os.path.join(args.logdir, 'perf-summary.txt'), 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+                logger.info("perf: " + line)
+    if args.sleep_audit:
+        lines = instrument.sleep_report(sleep_audit, perf_total)
+        with open(os.path.join(args.logdir, 'sleep-audit.txt'), 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+                logger.info("sleep-audit: " + line)
 
     if args.stdin_ctrl:
         set_term_echo(sys.stdin.fileno(), True)
@@ -445,17 +445,19 @@ def test_ap_acs_errors(dev, apdev):
         if "FAIL" not in hapd.request("ENABLE"):
             raise Exception("Unexpected success for ENABLE")
 
-    hapd.dump_monitor()
+    since = hapd.mark_events()
     with fail_test(hapd, 1, "acs_scan_complete"):
         hapd.enable()
-        ev = hapd.wait_event(["AP-ENABLED", "AP-DISABLED"], timeout=10)
+        ev = hapd.wait_event(["AP-ENABLED", "AP-DISABLED"], timeout=10,
+                             since=since)
         if not ev:
             raise Exception("ACS start timed out")
 
-    hapd.dump_monitor()
+    since = hapd.mark_events()
     with fail_test(hapd, 1, "acs_request_scan;acs_scan_complete"):
         hapd.enable()
-        ev = hapd.wait_event(["AP-ENABLED", "AP-DISABLED"], timeout=10)
+        ev = hapd.wait_event(["AP-ENABLED", "AP-DISABLED"], timeout=10,
+                             since=since)
         if not ev:
             raise Exception("ACS start timed out")
 
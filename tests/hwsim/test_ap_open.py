@@ -216,12 +216,13 @@ def test_ap_open_external_assoc(dev, apdev):
         id = dev[0].connect("open-ext-assoc", key_mgmt="NONE", scan_freq="2412",
                             only_add_network=True)
         dev[0].request("ENABLE_NETWORK %s no-connect" % id)
-        dev[0].dump_monitor()
+        since = dev[0].mark_events()
         # This will be accepted due to matching network
         dev[0].cmd_execute(['iw', 'dev', dev[0].ifname, 'connect',
                             'open-ext-assoc', "2412", apdev[0]['bssid']])
         ev = dev[0].wait_event(["CTRL-EVENT-DISCONNECTED",
-                                "CTRL-EVENT-CONNECTED"], timeout=10)
+                                "CTRL-EVENT-CONNECTED"], timeout=10,
+                               since=since)
         if ev is None:
             raise Exception("Connection timed out")
         if "CTRL-EVENT-DISCONNECTED" in ev:
@@ -673,10 +674,11 @@ def test_ap_open_reassoc_not_found(dev, apdev):
     dev[0].request("DISCONNECT")
 
     time.sleep(0.1)
-    dev[0].dump_monitor()
+    since = dev[0].mark_events()
 
     dev[0].request("REASSOCIATE")
-    ev = dev[0].wait_event(["CTRL-EVENT-NETWORK-NOT-FOUND"], timeout=10)
+    ev = dev[0].wait_event(["CTRL-EVENT-NETWORK-NOT-FOUND"], timeout=10,
+                           since=since)
     if ev is None:
         raise Exception("No result reported")
     dev[0].request("DISCONNECT")
@@ -26,6 +26,7 @@ from utils import *
 import hwsim_utils
 from wpasupplicant import WpaSupplicant
 from tshark import run_tshark
+from frames import parse_eapol
 from wlantest import WlantestCapture, Wlantest
 
 def check_mib(dev, vals):
@@ -1390,39 +1391,6 @@ def test_ap_wpa2_psk_ext_delayed_ptk_rekey(dev, apdev):
     if keyinfo != "028a":
         raise Exception("Unexpected key info when expected msg 1/4:" + keyinfo)
 
-def parse_eapol(data):
-    (version, type, length) = struct.unpack('>BBH', data[0:4])
-    payload = data[4:]
-    if length > len(payload):
-        raise Exception("Invalid EAPOL length")
-    if length < len(payload):
-        payload = payload[0:length]
-    eapol = {}
-    eapol['version'] = version
-    eapol['type'] = type
-    eapol['length'] = length
-    eapol['payload'] = payload
-    if type == 3:
-        # EAPOL-Key
-        (eapol['descr_type'],) = struct.unpack('B', payload[0:1])
-        payload = payload[1:]
-        if eapol['descr_type'] == 2 or eapol['descr_type'] == 254:
-            # RSN EAPOL-Key
-            (key_info, key_len) = struct.unpack('>HH', payload[0:4])
-            eapol['rsn_key_info'] = key_info
-            eapol['rsn_key_len'] = key_len
-            eapol['rsn_replay_counter'] = payload[4:12]
-            eapol['rsn_key_nonce'] = payload[12:44]
-            eapol['rsn_key_iv'] = payload[44:60]
-            eapol['rsn_key_rsc'] = payload[60:68]
-            eapol['rsn_key_id'] = payload[68:76]
-            eapol['rsn_key_mic'] = payload[76:92]
-            payload = payload[92:]
-            (eapol['rsn_key_data_len'],) = struct.unpack('>H', payload[0:2])
-            payload = payload[2:]
-            eapol['rsn_key_data'] = payload
-    return eapol
-
 def build_eapol(msg):
     data = struct.pack(">BBH", msg['version'], msg['type'], msg['length'])
     if msg['type'] == 3:
@@ -10,7 +10,7 @@ import tempfile
 
 import hostapd
 from utils import *
-from hwsim import HWSimRadio
+from hwsim import HWSimRadio, HWSimRadios
 import hwsim_utils
 from wpasupplicant import WpaSupplicant
 import re
@@ -351,8 +351,8 @@ def _eht_mld_probe_req(wpas, hapd, tsf0, link_id=-1):
 
 def test_eht_mld_discovery(dev, apdev):
     """EHT MLD AP discovery"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -479,9 +479,9 @@ def _eht_mld_owe_two_links(dev, apdev, second_link_disabled=False,
                            only_one_link=False, scan_only_second_link=False,
                            wait_for_timeout=False, reconf_mle=None,
                            only_second=False, frag_subelem=False):
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (hapd1_radio, hapd1_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(3, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (hapd1_radio, hapd1_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -561,8 +561,8 @@ def test_eht_mld_sae_single_link_anti_clogging_token(dev, apdev):
     run_eht_mld_sae_single_link(dev, apdev, anti_clogging_token=True)
 
 def run_eht_mld_sae_single_link(dev, apdev, anti_clogging_token=False):
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-            HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
         check_sae_capab(wpas)
@@ -587,8 +587,8 @@ def run_eht_mld_sae_single_link(dev, apdev, anti_clogging_token=False):
 
 def run_eht_mld_sae_two_links(dev, apdev, beacon_prot="1",
                               disable_enable=False, bridge=False):
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -689,8 +689,8 @@ def test_eht_mld_sae_two_links_bridge(dev, apdev):
 
 def test_eht_mld_sae_ext_one_link(dev, apdev):
     """EHT MLD AP with MLD client SAE-EXT H2E connection using single link"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -712,8 +712,8 @@ def test_eht_mld_sae_ext_one_link(dev, apdev):
 
 def test_eht_mld_sae_ext_two_links(dev, apdev):
     """EHT MLD AP with MLD client SAE-EXT H2E connection using two links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -776,8 +776,8 @@ def test_eht_mld_sae_legacy_client(dev, apdev):
 
 def test_eht_mld_sae_transition(dev, apdev):
     """EHT MLD AP in SAE/PSK transition mode with MLD client connection using two links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -812,8 +812,8 @@ def test_eht_mld_sae_transition(dev, apdev):
 
 def test_eht_mld_ptk_rekey(dev, apdev):
     """EHT MLD AP and PTK rekeying with MLD client connection using two links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -853,8 +853,8 @@ def test_eht_mld_ptk_rekey(dev, apdev):
 
 def test_eht_mld_gtk_rekey(dev, apdev):
     """AP MLD and GTK rekeying with MLD client connection using two links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -895,8 +895,8 @@ def test_eht_mld_gtk_rekey(dev, apdev):
 
 def test_eht_mld_gtk_rekey_failure(dev, apdev):
     """AP MLD and GTK rekeying failure with MLD client connection using two links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -942,8 +942,8 @@ def test_eht_mld_gtk_rekey_failure(dev, apdev):
 
 def test_eht_ml_probe_req(dev, apdev):
     """AP MLD with two links and non-AP MLD sending ML Probe Request"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -982,8 +982,8 @@ def test_eht_ml_probe_req(dev, apdev):
 
 def _eht_mld_connect_probes(params, hidden=False):
     """MLD client sends ML probe to connect to not discovered links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1045,8 +1045,8 @@ def test_eht_mld_connect_probes_hidden(dev, apdev, params):
 
 def test_eht_tx_link_rejected_connect_other(dev, apdev, params):
     """EHT MLD AP with MLD client being rejected on TX link, but then connecting on second link"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1076,8 +1076,8 @@ def test_eht_tx_link_rejected_connect_other(dev, apdev, params):
 
 def test_eht_all_links_rejected(dev, apdev, params):
     """EHT MLD AP with MLD client ignores all rejected links"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1118,8 +1118,8 @@ def test_eht_all_links_rejected(dev, apdev, params):
 
 def test_eht_assoc_failure(dev, apdev, params):
     """EHT MLD AP with MLD client that fails the association the first time"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1151,8 +1151,8 @@ def test_eht_assoc_failure(dev, apdev, params):
 
 def test_eht_non_assoc_links_rejected(dev, apdev, params):
     """EHT MLD AP with all non assoc links rejected in association"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1189,8 +1189,8 @@ def test_eht_non_assoc_links_rejected(dev, apdev, params):
 
 def test_eht_connect_invalid_link(dev, apdev, params):
     """EHT MLD AP where one link is incorrectly configured and rejected by mac80211"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1233,8 +1233,8 @@ def test_eht_connect_invalid_link(dev, apdev, params):
 def test_eht_mld_link_removal(dev, apdev):
     """EHT MLD with two links. Links removed during association"""
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1284,8 +1284,8 @@ def test_eht_mld_link_removal(dev, apdev):
 def test_eht_mld_bss_trans_mgmt_link_removal_imminent(dev, apdev):
     """EHT MLD with two links. BSS transition management with link removal imminent"""
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1342,8 +1342,8 @@ def send_check(hapd, frame, no_tx_status=False):
 
 def test_eht_ap_mld_proto(dev, apdev):
     """AP MLD protocol testing"""
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (hapd1_radio, hapd1_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (hapd1_radio, hapd1_iface)]:
 
         ssid = "mld_ap_owe_two_link"
         params = eht_mld_ap_wpa2_params(ssid, key_mgmt="OWE", mfp="2")
@@ -1783,9 +1783,9 @@ def test_eht_mld_gas(dev, apdev):
     params['channel'] = "11"
     hapd = hostapd.add_ap(apdev[0], params)
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (hapd1_radio, hapd1_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(3, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (hapd1_radio, hapd1_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1824,9 +1824,9 @@ def test_eht_mld_dpp_responder_while_assoc(dev, apdev):
     """DPP responder while ML associated"""
     check_dpp_capab(dev[0])
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (hapd1_radio, hapd1_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(3, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (hapd1_radio, hapd1_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1854,8 +1854,8 @@ def test_eht_mld_dpp_responder_while_assoc(dev, apdev):
         wait_auth_success(dev[0], wpas)
 
 def _eht_mld_disconnect(dev, apdev, disassoc=True):
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1909,8 +1909,8 @@ def test_eht_mld_deauthenticate(dev, apdev):
 def test_eht_mld_non_pref_chan(dev, apdev):
     """EHT MLD with one link. MBO non preferred channels"""
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1996,9 +1996,9 @@ def test_eht_mld_non_pref_chan(dev, apdev):
 def test_eht_mld_rrm_beacon_req(dev, apdev):
     """EHT MLD with one link. RRM beacon request"""
 
-    with HWSimRadio(use_mlo=True) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True) as (hapd1_radio, hapd1_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(3, use_mlo=True) as [(hapd0_radio, hapd0_iface),
+                                          (hapd1_radio, hapd1_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -2085,9 +2085,9 @@ def test_eht_mld_and_mlds(dev, apdev):
     """EHT AP MLD and multiple non-AP MLDs"""
     check_sae_capab(dev[0])
 
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-            HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface), \
-            HWSimRadio(use_mlo=True) as (wpas_radio2, wpas_iface2):
+    with HWSimRadios(3, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface),
+                                          (wpas_radio2, wpas_iface2)]:
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
         check_sae_capab(wpas)
@@ -2157,8 +2157,8 @@ def test_eht_mlo_csa(dev, apdev):
         """EHT MLD AP connected to non-AP MLD. Seamless channel switch"""
         csa_supported(dev[0])
 
-        with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-            HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+        with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                              (wpas_radio, wpas_iface)]:
 
             wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
             wpas.interface_add(wpas_iface)
@@ -2509,8 +2509,8 @@ def test_eht_mld_cohosted_connectivity(dev, apdev, params):
 
 def test_eht_mlo_color_change(dev, apdev):
     """AP MLD and Color Change Announcement"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         ssid = "mld_ap"
         passphrase = 'qwertyuiop'
@@ -2610,8 +2610,8 @@ def _test_eht_mld_invalid_link(hapd_iface, wpas_iface, test_params,
 def test_eht_mld_invalid_link(dev, apdev, params):
     """EHT AP MLD where one AP advertises only WPA-PSK and the other SAE"""
 
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         _test_eht_mld_invalid_link(hapd_iface, wpas_iface, params,
                                    key_mgmt="WPA-PSK", pwe=None)
@@ -2619,8 +2619,8 @@ def test_eht_mld_invalid_link(dev, apdev, params):
 def test_eht_mld_invalid_link_akm(dev, apdev, params):
     """EHT AP MLD where one AP uses a different AKM cipher"""
 
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         _test_eht_mld_invalid_link(hapd_iface, wpas_iface, params,
                                    key_mgmt="SAE-EXT-KEY", pwe="1")
@@ -2628,16 +2628,16 @@ def test_eht_mld_invalid_link_akm(dev, apdev, params):
 def test_eht_mld_invalid_link_pairwise(dev, apdev, params):
     """EHT AP MLD where one AP uses a different pairwise cipher"""
 
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         _test_eht_mld_invalid_link(hapd_iface, wpas_iface, params,
                                    rsn_pairwise="GCMP-256")
 
 def test_eht_mld_control_socket_connectivity(dev, apdev):
     """AP MLD control socket connectivity"""
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         ssid = "mld_ap"
         link0_params = {"ssid": ssid,
@@ -2831,8 +2831,8 @@ def test_eht_mld_no_common_key_mgmt(dev, apdev):
 
 def test_eht_ml_setup_reconfig_AB_A_AB(dev, apdev, params):
         """EHT MLD with two links. ML Setup reconfig link removal and addition"""
-        with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-            HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+        with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                              (wpas_radio, wpas_iface)]:
 
             wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
             wpas.interface_add(wpas_iface)
@@ -2915,8 +2915,8 @@ def test_eht_ml_setup_reconfig_AB_A_AB(dev, apdev, params):
 
 def test_eht_mld_and_autogo(dev, apdev):
     """EHT MLD connection and autonomous P2P GO on the station device"""
-    with HWSimRadio(use_mlo=True, n_channels=2) as (hapd0_radio, hapd0_iface), \
-        HWSimRadio(use_mlo=True, n_channels=2) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True, n_channels=2) as [(hapd0_radio, hapd0_iface),
+                                                        (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
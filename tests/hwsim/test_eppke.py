@@ -11,7 +11,7 @@ import hostapd
 import hwsim_utils
 from wpasupplicant import WpaSupplicant
 from utils import *
-from hwsim import HWSimRadio
+from hwsim import HWSimRadio, HWSimRadios
 from test_eht import eht_mld_ap_wpa2_params, eht_mld_enable_ap, traffic_test, eht_verify_status
 
 def check_eppke_capab(dev):
@@ -129,8 +129,8 @@ def test_eppke_mld_ap_with_base_akm_sae_ext_non_mld_client(dev, apdev):
             dev[0].set("sae_pwe", "0")
 
 def run_eppke_mld_three_links(dev, apdev, key_mgmt):
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -167,8 +167,8 @@ def run_eppke_mld_three_links(dev, apdev, key_mgmt):
         hwsim_utils.test_connectivity(wpas, hapd0)
 
 def run_eppke_mld_two_links(dev, apdev, key_mgmt):
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -203,8 +203,8 @@ def run_eppke_mld_two_links(dev, apdev, key_mgmt):
 
 def run_eppke_mld_one_link(dev, apdev, key_mgmt):
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -356,8 +356,8 @@ def test_eppke_mld_ap_with_base_akm_sae_ext_non_mld_client_pmksa_cached(dev, apd
 
 def run_eppke_mld_one_link_pmksa_cached(dev, apdev, key_mgmt):
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -404,8 +404,8 @@ def test_eppke_with_base_akm_sae_ext_single_link_pmksa_cached(dev, apdev):
 
 def run_eppke_mld_two_links_pmksa_cached(dev, apdev, key_mgmt):
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -491,8 +491,8 @@ def test_eppke_ap_gtk_rekey_with_base_akm_sae_ext_non_mld_client(dev, apdev):
 def test_eppke_ap_gtk_rekey_with_base_akm_sae_ext_key_one_link(dev, apdev):
     """EPPKE AP and GTK rekey with MLO AP with 1 link"""
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -530,8 +530,8 @@ def test_eppke_ap_gtk_rekey_with_base_akm_sae_ext_key_one_link(dev, apdev):
 def test_eppke_ap_gtk_rekey_with_base_akm_sae_ext_key_two_link(dev, apdev):
     """EPPKE AP and GTK rekey with MLO AP with 2 links"""
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1080,8 +1080,8 @@ def test_eppke_ap_with_base_akm_sae_ext_legacy_client_group_retry(dev, apdev):
 def run_eppke_mld_ap_mld_sta_group_retry(dev, apdev):
     """EPPKE authentication with MLD AP and MLD STA (single link) with PASN group retry - AP supports groups 20 and 21, STA starts with group 19, gets rejected, retries with group 20"""
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1124,8 +1124,8 @@ def test_eppke_mld_ap_with_base_akm_sae_ext_mld_sta_group_retry(dev, apdev):
 def run_eppke_mld_sta_group_retry(dev, apdev):
     """EPPKE authentication with MLD AP and MLD STA with PASN group retry - AP supports groups 20 and 21, STA starts with group 19, gets rejected, retries with group 20"""
     check_eppke_capab(dev[0])
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
@@ -1212,8 +1212,8 @@ def test_eppke_without_base_akm_mld_ap(dev, apdev):
     ssid = "test-eppke-nobaseakm-mld"
 
     try:
-        with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-             HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+        with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                              (wpas_radio, wpas_iface)]:
             wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
             wpas.interface_add(wpas_iface)
 
@@ -11,7 +11,7 @@ import hostapd
 import hwsim_utils
 from utils import *
 from wpasupplicant import WpaSupplicant
-from hwsim import HWSimRadio
+from hwsim import HWSimRadios
 from test_eht import eht_mld_ap_wpa2_params, eht_mld_enable_ap, eht_verify_status
 
 logger = logging.getLogger()
@@ -639,8 +639,8 @@ def test_ieee8021x_auth_alg_eap_fast(dev, apdev):
 def test_ieee8021x_auth_mlo_single_link(dev, apdev):
     """IEEE 802.1X Authentication frames: MLO single-link EAP-TLS"""
     ssid = "test-ieee8021x-auth-mlo-1l"
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-         HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         # AP MLD: single link (link-0)
         params = eht_mld_ap_wpa2_params(ssid, key_mgmt="WPA-EAP-SHA256")
@@ -686,8 +686,8 @@ def test_ieee8021x_auth_mlo_single_link(dev, apdev):
 def test_ieee8021x_auth_mlo_two_links(dev, apdev):
     """IEEE 802.1X Authentication frames: MLO two-link EAP-TLS"""
     ssid = "test-ieee8021x-auth-mlo-2l"
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-         HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         # AP MLD: two links (link-0 @ ch1, link-1 @ ch6)
         params = eht_mld_ap_wpa2_params(ssid, key_mgmt="WPA-EAP-SHA256")
@@ -738,8 +738,8 @@ def test_ieee8021x_auth_mlo_two_links(dev, apdev):
 def test_ieee8021x_auth_mlo_three_links(dev, apdev):
     """IEEE 802.1X Authentication frames: MLO three-link EAP-TLS"""
     ssid = "test-ieee8021x-auth-mlo-3l"
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-         HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         params = eht_mld_ap_wpa2_params(ssid, key_mgmt="WPA-EAP-SHA256")
         params.update(hostapd.radius_params())
@@ -789,8 +789,8 @@ def test_ieee8021x_auth_mlo_three_links(dev, apdev):
 def test_ieee8021x_auth_mlo_connect_disconnect_reconnect(dev, apdev):
     """IEEE 802.1X Authentication frames: MLO two-link connect/disconnect/reconnect"""
     ssid = "test-ieee8021x-auth-mlo-cdr"
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-         HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         params = eht_mld_ap_wpa2_params(ssid, key_mgmt="WPA-EAP-SHA256")
         params.update(hostapd.radius_params())
@@ -14,6 +14,7 @@ import struct
 import subprocess
 import time
 
+import frames
 import hostapd
 from wpasupplicant import WpaSupplicant
 from utils import *
@@ -783,28 +784,19 @@ class BeaconReport:
         self.antenna_id, self.parent_tsf = struct.unpack("<BI", report[0:5])
         report = report[5:]
         self.subelems = report
-        self.frame_body = None
-        self.frame_body_fragment_id = None
-        self.last_indication = None
-        while len(report) >= 2:
-            eid, elen = struct.unpack('BB', report[0:2])
-            report = report[2:]
-            if len(report) < elen:
-                raise Exception("Invalid subelement in beacon report")
-            if eid == 1:
-                # Reported Frame Body
-                # Contents depends on the reporting detail request:
-                # 0 = no Reported Frame Body subelement
-                # 1 = all fixed fields and any elements identified in Request
-                #     element
-                # 2 = all fixed fields and all elements
-                # Fixed fields: Timestamp[8] BeaconInt[2] CapabInfo[2]
-                self.frame_body = report[0:elen]
-            if eid == 2:
-                self.frame_body_fragment_id = report[0:elen]
-            if eid == 164:
-                self.last_indication = report[0:elen]
-            report = report[elen:]
+        subelems = frames.Elements(report)
+        # Reported Frame Body
+        # Contents depends on the reporting detail request:
+        # 0 = no Reported Frame Body subelement
+        # 1 = all fixed fields and any elements identified in Request
+        #     element
+        # 2 = all fixed fields and all elements
+        # Fixed fields: Timestamp[8] BeaconInt[2] CapabInfo[2]
+        self.frame_body = subelems.get(1)
+        self.frame_body_fragment_id = subelems.get(2)
+        self.last_indication = subelems.get(164)
+        if subelems.truncated:
+            raise Exception("Invalid subelement in beacon report")
     def __str__(self):
         txt = "opclass={} channel={} start={} duration={} frame_info={} rcpi={} rsni={} bssid={} antenna_id={} parent_tsf={}".format(self.opclass, self.channel, self.start, self.duration, self.frame_info, self.rcpi, self.rsni, self.bssid_str, self.antenna_id, self.parent_tsf)
         if self.frame_body:
@@ -1403,7 +1395,8 @@ def test_rrm_beacon_req_table_rsne(dev, apdev):
         raise Exception("Reported Frame Body subelement missing")
     if len(report.frame_body) != 12 + 22:
         raise Exception("Unexpected Reported Frame Body subelement length with Reporting Detail 1 and requested element RSNE")
-    if binascii.unhexlify("30140100000fac040100000fac040100000fac020c00") not in report.frame_body:
+    rsne = frames.Elements(report.frame_body[12:]).get(48)
+    if rsne != binascii.unhexlify("0100000fac040100000fac040100000fac020c00"):
         raise Exception("Full RSNE not found")
 
 def test_rrm_beacon_req_table_vht(dev, apdev):
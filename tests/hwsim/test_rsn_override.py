@@ -6,7 +6,7 @@
 
 import hostapd
 from utils import *
-from hwsim import HWSimRadio
+from hwsim import HWSimRadios
 from wpasupplicant import WpaSupplicant
 from test_eht import eht_mld_enable_ap, eht_verify_status, eht_verify_wifi_version, traffic_test
 
@@ -132,8 +132,8 @@ def test_rsn_override_mld_too_long_elems(dev, apdev):
 
 def run_rsn_override_mld(dev, apdev, mixed, only_sta=False,
                          too_long_elems=False):
-    with HWSimRadio(use_mlo=True) as (hapd_radio, hapd_iface), \
-        HWSimRadio(use_mlo=True) as (wpas_radio, wpas_iface):
+    with HWSimRadios(2, use_mlo=True) as [(hapd_radio, hapd_iface),
+                                          (wpas_radio, wpas_iface)]:
 
         wpas = WpaSupplicant(global_iface='/tmp/wpas-wlan5')
         wpas.interface_add(wpas_iface)
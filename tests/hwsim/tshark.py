@@ -7,12 +7,13 @@
 # This software may be distributed under the terms of the BSD license.
 # See README for more details.
 
-import time
+import struct
 import subprocess
 import logging
 logger = logging.getLogger()
 
 from utils import *
+import pcapng
 
 class UnknownFieldsException(Exception):
     def __init__(self, fields):
@@ -21,13 +22,29 @@ class UnknownFieldsException(Exception):
 
 _tshark_filter_arg = '-Y'
 
+# Evaluate the supported display filters and fields with pcapng.run_filter()
+# instead of starting tshark (run-tests.py --pcapng-filter)
+use_pcapng_filter = False
+
 def _run_tshark(filename, filter, display=None, wait=True):
     global _tshark_filter_arg
 
     if wait:
         # wait a bit to make it more likely for wlantest sniffer to have
-        # captured and written the results into a file that we can process here
-        time.sleep(0.1)
+        # captured and written the results into a file that we can process
+        # here; frames may still be in flight even if the file is not being
+        # written at the moment, so wait at least 0.1 s and longer while
+        # the file is still changing
+        wait_file_idle(filename, min_wait=0.1, idle=0.03, timeout=0.3)
+
+    if display and use_pcapng_filter:
+        # Most of the checks need only the basic IEEE 802.11 header and
+        # element fields and can be done without starting tshark.
+        try:
+            return pcapng.run_filter(filename, filter, display)
+        except (pcapng.UnsupportedFilter, OSError, struct.error,
+                IndexError) as e:
+            logger.debug("tshark: use external tshark (%s)" % str(e))
 
     try:
         arg = ["tshark", "-r", filename,
@@ -0,0 +1,134 @@
+# Unit tests for the monitor event buffer in eventbuffer.py
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eventbuffer
+
+class FakeMon(object):
+    """Monitor socket replacement with a list of queued events"""
+
+    def __init__(self, msgs=None):
+        self.msgs = list(msgs or [])
+
+    def pending(self, timeout=0):
+        return len(self.msgs) > 0
+
+    def recv(self):
+        return self.msgs.pop(0)
+
+def fill(buf, count, name="CTRL-EVENT-TEST"):
+    for i in range(count):
+        buf.add("<3>%s %d" % (name, i))
+
+class TestEventBuffer(unittest.TestCase):
+    def test_name_index(self):
+        buf = eventbuffer.EventBuffer()
+        buf.add("<3>CTRL-EVENT-CONNECTED - Connection to 02:00:00:00:03:00")
+        buf.add("IFNAME=wlan0 <3>P2P-GROUP-STARTED wlan0 GO")
+        buf.add("AP-STA-CONNECTED 02:00:00:00:00:00")
+        self.assertEqual(sorted(buf.index.keys()),
+                         ["AP-STA-CONNECTED", "CTRL-EVENT-CONNECTED",
+                          "P2P-GROUP-STARTED"])
+
+    def test_next_in_order(self):
+        buf = eventbuffer.EventBuffer()
+        fill(buf, 3)
+        self.assertEqual([buf.next().seq for i in range(3)], [1, 2, 3])
+        self.assertIsNone(buf.next())
+        self.assertEqual(buf.unconsumed(), 0)
+
+    def test_trim_consumed(self):
+        buf = eventbuffer.EventBuffer(history=5)
+        fill(buf, 10)
+        # Nothing has been consumed, so nothing can be trimmed
+        self.assertEqual(len(buf.events), 10)
+        buf.consume(7)
+        self.assertEqual([ev.seq for ev in buf.events], [6, 7, 8, 9, 10])
+        self.assertEqual(len(buf.index["CTRL-EVENT-TEST"]), 5)
+        self.assertEqual(buf.next().seq, 8)
+        fill(buf, 3)
+        self.assertEqual(buf.events[0].seq, 9)
+        self.assertEqual(buf.unconsumed(), 5)
+
+    def test_trim_removes_index(self):
+        buf = eventbuffer.EventBuffer(history=2)
+        buf.add("<3>CTRL-EVENT-ONE")
+        fill(buf, 2)
+        buf.consume(buf.seq)
+        self.assertNotIn("CTRL-EVENT-ONE", buf.index)
+        self.assertIsNone(buf.find(["CTRL-EVENT-ONE"]))
+
+    def test_find_oldest(self):
+        buf = eventbuffer.EventBuffer()
+        buf.add("<3>CTRL-EVENT-SCAN-RESULTS")
+        buf.add("<3>CTRL-EVENT-CONNECTED - Connection to 02:00:00:00:03:00")
+        buf.add("<3>CTRL-EVENT-DISCONNECTED bssid=02:00:00:00:03:00")
+        ev = buf.find(["CTRL-EVENT-DISCONNECTED", "CTRL-EVENT-CONNECTED"])
+        self.assertEqual(ev.seq, 2)
+        # Event name prefix and a substring that is not an event name
+        self.assertEqual(buf.find(["CTRL-EVENT-"]).seq, 1)
+        self.assertEqual(buf.find(["bssid=02:00:00:00:03:00"]).seq, 3)
+        self.assertIsNone(buf.find(["CTRL-EVENT-TERMINATING"]))
+
+    def test_find_since(self):
+        buf = eventbuffer.EventBuffer()
+        fill(buf, 3)
+        since = buf.seq
+        fill(buf, 2)
+        self.assertEqual(buf.find(["CTRL-EVENT-TEST"], since).seq, 4)
+        self.assertEqual(buf.find(["CTRL-EVENT-TEST 1"], since).seq, 5)
+        self.assertIsNone(buf.find(["CTRL-EVENT-TEST 2"], since))
+        self.assertIsNone(buf.find(["CTRL-EVENT-TEST"], buf.seq))
+
+class TestWaitEvent(unittest.TestCase):
+    def test_wait_event_discards(self):
+        mon = FakeMon(["<3>CTRL-EVENT-A", "<3>CTRL-EVENT-B",
+                       "<3>CTRL-EVENT-C"])
+        self.assertEqual(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-B"], 0),
+                         "<3>CTRL-EVENT-B")
+        # A was consumed without matching like in the old wait_event()
+        self.assertIsNone(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-A"],
+                                                 0))
+        self.assertEqual(eventbuffer.monitor_events(mon).unconsumed(), 0)
+
+    def test_wait_event_since(self):
+        mon = FakeMon(["<3>CTRL-EVENT-A"])
+        since = eventbuffer.read_pending(mon, "")
+        mon.msgs += ["<3>CTRL-EVENT-B", "<3>CTRL-EVENT-C"]
+        self.assertEqual(eventbuffer.dump_events(mon, ""), 3)
+        # Consumed by dump_events(), but still newer than since
+        self.assertEqual(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-B"], 0,
+                                                since=since),
+                         "<3>CTRL-EVENT-B")
+        self.assertIsNone(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-A"],
+                                                 0, since=since))
+
+    def test_wait_event_since_consumes(self):
+        mon = FakeMon(["<3>CTRL-EVENT-A", "<3>CTRL-EVENT-B",
+                       "<3>CTRL-EVENT-C"])
+        self.assertEqual(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-B"], 0,
+                                                since=0),
+                         "<3>CTRL-EVENT-B")
+        # Events up to the match are consumed, later ones are not
+        self.assertEqual(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-"], 0),
+                         "<3>CTRL-EVENT-C")
+
+    def test_wait_event_since_trimmed(self):
+        mon = FakeMon()
+        buf = eventbuffer.monitor_events(mon)
+        buf.history = 3
+        since = eventbuffer.read_pending(mon, "")
+        mon.msgs += ["<3>CTRL-EVENT-A"] + ["<3>CTRL-EVENT-B"] * 5
+        eventbuffer.dump_events(mon, "")
+        self.assertEqual(len(buf.events), 3)
+        self.assertIsNone(eventbuffer.wait_event(mon, "", ["CTRL-EVENT-A"], 0,
+                                                 since=since))
+
+if __name__ == "__main__":
+    unittest.main()
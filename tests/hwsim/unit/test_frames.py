@@ -0,0 +1,56 @@
+# Unit tests for the element index in frames.py
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import binascii
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import frames
+
+# SSID, two vendor specific elements, Extended Capabilities, a second SSID,
+# and an extension element with ext-EID 35 (HE Capabilities)
+ies = binascii.unhexlify("000474657374" + "dd06506f9a090102" +
+                         "dd0400137401" + "7f0104" + "0003616263" +
+                         "ff0323aabb")
+
+class TestElements(unittest.TestCase):
+    def setUp(self):
+        self.elems = frames.Elements(ies)
+
+    def test_get(self):
+        self.assertEqual(self.elems.get(0), b'test')
+        self.assertEqual(self.elems.get(127), b'\x04')
+        self.assertIsNone(self.elems.get(48))
+        self.assertEqual(self.elems.get_all(0), [b'test', b'abc'])
+        self.assertIn(127, self.elems)
+        self.assertNotIn(48, self.elems)
+        self.assertFalse(self.elems.truncated)
+
+    def test_extension(self):
+        self.assertEqual(self.elems.get(255, 35), b'\x23\xaa\xbb')
+        self.assertIn((255, 35), self.elems)
+        self.assertIsNone(self.elems.get(255))
+
+    def test_vendor(self):
+        self.assertEqual(self.elems.vendor(b'\x50\x6f\x9a\x09'),
+                         [b'\x01\x02'])
+        self.assertEqual(self.elems.vendor(b'\x00\x13\x74'), [b'\x01'])
+        self.assertEqual(self.elems.vendor(b'\x00\x50\xf2'), [])
+
+    def test_truncated(self):
+        elems = frames.Elements(ies + b'\x30\x14\x01\x00')
+        self.assertEqual(elems.get(0), b'test')
+        self.assertTrue(elems.truncated)
+        self.assertIsNone(elems.get(48))
+
+    def test_to_dict(self):
+        d = self.elems.to_dict()
+        self.assertEqual(d[0], b'abc')
+        self.assertEqual(d[255], b'\x23\xaa\xbb')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# Unit tests for the debug log sidecar index in logindex.py
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import logindex
+import postprocess
+
+PMK = b"1234.000000: WPA: PMK - hexdump(len=32): 00 11 22 33\n"
+PTK = b"1234.000001: WPA: PTK - hexdump(len=48): 44 55 66 77\n"
+OTHER = b"1234.000002: wlan0: State: COMPLETED -> DISCONNECTED\n"
+
+class TestLogIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'log0')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append(self, data):
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def test_partial_last_line(self):
+        idx = logindex.LogIndex(self.path)
+        self.append(OTHER + PMK[:20])
+        idx.update()
+        self.assertEqual(idx.offset, len(OTHER))
+        self.assertEqual(idx.keys, [])
+        self.append(PMK[20:] + PTK)
+        idx.update()
+        self.assertEqual(idx.offset, len(OTHER + PMK + PTK))
+        self.assertEqual(idx.keys, [(len(OTHER), 'PMK'),
+                                    (len(OTHER + PMK), 'PTK')])
+        self.assertEqual(logindex.read_lines(self.path,
+                                             [k[0] for k in idx.keys]),
+                         [PMK, PTK])
+
+    def test_inode_change(self):
+        idx = logindex.LogIndex(self.path)
+        self.append(OTHER + PMK)
+        idx.update()
+        self.assertEqual(idx.keys, [(len(OTHER), 'PMK')])
+        # A new file with the same name replaces the indexed one
+        os.rename(self.path, self.path + '.old')
+        self.append(PTK + OTHER + OTHER)
+        os.unlink(self.path + '.old')
+        idx.update()
+        self.assertEqual(idx.keys, [(0, 'PTK')])
+        self.assertEqual(idx.offset, len(PTK + OTHER + OTHER))
+
+    def test_truncated(self):
+        idx = logindex.LogIndex(self.path)
+        self.append(OTHER + OTHER + PMK)
+        idx.update()
+        with open(self.path, 'wb') as f:
+            f.write(PTK)
+        idx.update()
+        self.assertEqual(idx.keys, [(0, 'PTK')])
+
+    def test_missing_file(self):
+        idx = logindex.LogIndex(self.path)
+        idx.update()
+        self.assertIsNone(idx.ino)
+        self.assertEqual(idx.keys, [])
+
+class TestKeyLines(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.log0')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_indexed(self, indexed, rest=b''):
+        with open(self.path, 'wb') as f:
+            f.write(indexed)
+        idx = logindex.LogIndex(self.path)
+        idx.update()
+        idx.write(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(rest)
+
+    def test_no_index(self):
+        with open(self.path, 'wb') as f:
+            f.write(OTHER + PMK)
+        self.assertEqual(list(postprocess.key_lines(self.path)), [OTHER, PMK])
+
+    def test_index(self):
+        self.write_indexed(OTHER + PMK + OTHER)
+        self.assertEqual(list(postprocess.key_lines(self.path)), [PMK])
+
+    def test_lines_after_index(self):
+        self.write_indexed(OTHER + PMK + PTK[:10], PTK[10:] + OTHER)
+        self.assertEqual(list(postprocess.key_lines(self.path)),
+                         [PMK, PTK, OTHER])
+
+    def test_stale_index(self):
+        self.write_indexed(OTHER + OTHER + PMK)
+        with open(self.path, 'wb') as f:
+            f.write(PTK)
+        self.assertEqual(list(postprocess.key_lines(self.path)), [PTK])
+
+    def test_extract_keys(self):
+        self.write_indexed(PMK + OTHER, PTK)
+        self.assertTrue(postprocess.extract_keys(self.dir, 'test'))
+        with open(os.path.join(self.dir, 'test.pmks'), 'rb') as f:
+            self.assertEqual(f.read(), b'00112233\n')
+        with open(os.path.join(self.dir, 'test.ptks'), 'rb') as f:
+            self.assertEqual(f.read(), b'44556677\n')
+
+if __name__ == "__main__":
+    unittest.main()
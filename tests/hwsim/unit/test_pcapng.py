@@ -0,0 +1,159 @@
+# Unit tests for the in-process tshark filter subset in pcapng.py
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pcapng
+
+AP = b'\x02\x00\x00\x00\x03\x00'
+STA = b'\x02\x00\x00\x00\x00\x00'
+BCAST = b'\xff' * 6
+
+def mgmt(subtype, da, sa, bssid, body, protected=False):
+    fc = subtype << 4
+    if protected:
+        fc |= 0x4000
+    return struct.pack('<HH', fc, 0) + da + sa + bssid + b'\0\0' + body
+
+def elem(eid, data):
+    return struct.pack('BB', eid, len(data)) + data
+
+def write_pcap(path, frames):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535,
+                            pcapng.LINKTYPE_IEEE802_11))
+        for frame in frames:
+            f.write(struct.pack('<IIII', 0, 0, len(frame), len(frame)))
+            f.write(frame)
+
+# Beacon with SSID, Supported Rates, and Extended Capabilities
+beacon = mgmt(8, BCAST, AP, AP, b'\0' * 8 + b'\x64\x00\x01\x04' +
+              elem(0, b'test') + elem(1, b'\x82\x84') + elem(127, b'\x04'))
+# Association Response with status code 17 and an RSNXE
+assoc_resp = mgmt(1, STA, AP, AP, b'\x01\x04\x11\x00\x00\xc0' +
+                  elem(1, b'\x82') + elem(244, b'\x20'))
+# Protected Deauthentication; the body is encrypted
+deauth = mgmt(12, STA, AP, AP, b'\x00\x01\x30\x02\x01\x00', protected=True)
+# Public Action (GAS Initial Request)
+action = mgmt(13, AP, STA, AP, b'\x04\x0a\x01')
+# Action No Ack
+action_noack = mgmt(14, AP, STA, AP, b'\x0a\x01')
+# Authentication (SAE commit) with status code 0
+auth = mgmt(11, AP, STA, AP, b'\x03\x00\x01\x00\x00\x00' + b'\x13\x00')
+
+class TestRunFilter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.pcap')
+        write_pcap(self.path, [beacon, assoc_resp, deauth, action,
+                               action_noack, auth])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_filter(self, filter, display):
+        return pcapng.run_filter(self.path, filter, display)
+
+    def test_header_fields(self):
+        out = self.run_filter("wlan.fc.type == 0",
+                              ["frame.number", "wlan.fc.type_subtype",
+                               "wlan.fc.protected", "wlan.sa", "wlan.bssid"])
+        self.assertEqual(out.splitlines(),
+                         ["1\t8\t0\t02:00:00:00:03:00\t02:00:00:00:03:00",
+                          "2\t1\t0\t02:00:00:00:03:00\t02:00:00:00:03:00",
+                          "3\t12\t1\t02:00:00:00:03:00\t02:00:00:00:03:00",
+                          "4\t13\t0\t02:00:00:00:00:00\t02:00:00:00:03:00",
+                          "5\t14\t0\t02:00:00:00:00:00\t02:00:00:00:03:00",
+                          "6\t11\t0\t02:00:00:00:00:00\t02:00:00:00:03:00"])
+
+    def test_tags(self):
+        out = self.run_filter("wlan.fc.type_subtype == 8",
+                              ["wlan.tag.number", "wlan.tag.length"])
+        self.assertEqual(out, "0,1,127\t4,2,1\n")
+        out = self.run_filter("wlan.fc.type_subtype <= 8 && wlan.tag.number == 244",
+                              ["frame.number"])
+        self.assertEqual(out, "2\n")
+        # tshark parses elements in Action frames, so this is left to it
+        with self.assertRaises(pcapng.UnsupportedFilter):
+            self.run_filter("wlan.tag.number == 244", ["frame.number"])
+
+    def test_status_code(self):
+        out = self.run_filter("wlan.fixed.status_code == 17",
+                              ["frame.number"])
+        self.assertEqual(out, "2\n")
+        out = self.run_filter("wlan.fixed.status_code == 0",
+                              ["frame.number"])
+        self.assertEqual(out, "6\n")
+
+    def test_not_equal_absent_field(self):
+        # A comparison with an absent field is false like in tshark
+        out = self.run_filter("wlan.fixed.status_code != 0",
+                              ["frame.number"])
+        self.assertEqual(out, "2\n")
+        out = self.run_filter("!(wlan.fixed.status_code == 0)",
+                              ["frame.number"])
+        self.assertEqual(out, "1\n2\n3\n4\n5\n")
+
+    def test_protected_frame(self):
+        out = self.run_filter("wlan.fc.protected == 1",
+                              ["wlan.tag.number", "wlan.fixed.status_code"])
+        self.assertEqual(out, "\t\n")
+
+    def test_action(self):
+        out = self.run_filter("wlan.fixed.category_code == 4 && wlan.fixed.publicact == 10",
+                              ["frame.number"])
+        self.assertEqual(out, "4\n")
+        out = self.run_filter("wlan.fixed.category_code == 10",
+                              ["frame.number"])
+        self.assertEqual(out, "5\n")
+        for subtype in [13, 14]:
+            with self.assertRaises(pcapng.UnsupportedFilter):
+                self.run_filter("wlan.fc.subtype == %d && wlan.tag.number == 221" % subtype,
+                                ["frame.number"])
+
+    def test_unsupported(self):
+        with self.assertRaises(pcapng.UnsupportedFilter):
+            self.run_filter("wlan.fc.type == 0", ["wlan.ssid"])
+        with self.assertRaises(pcapng.UnsupportedFilter):
+            self.run_filter("eapol", ["frame.number"])
+        with self.assertRaises(pcapng.UnsupportedFilter):
+            self.run_filter("wlan.fc.type == 0 &&", ["frame.number"])
+
+    def test_incremental_update(self):
+        self.assertEqual(self.run_filter("wlan.fc.type_subtype == 8",
+                                         ["frame.number"]), "1\n")
+        with open(self.path, 'ab') as f:
+            f.write(struct.pack('<IIII', 0, 0, len(beacon), len(beacon)))
+            f.write(beacon)
+        self.assertEqual(self.run_filter("wlan.fc.type_subtype == 8",
+                                         ["frame.number"]), "1\n7\n")
+
+class TestCaptureCache(unittest.TestCase):
+    def test_eviction(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            paths = []
+            for i in range(pcapng.MAX_CAPTURES + 2):
+                path = os.path.join(tmp, '%d.pcap' % i)
+                write_pcap(path, [beacon])
+                pcapng.get_capture(path)
+                paths.append(path)
+            self.assertEqual(list(pcapng._captures.keys()),
+                             paths[-pcapng.MAX_CAPTURES:])
+            os.unlink(paths[-2])
+            pcapng.get_capture(paths[-1])
+            self.assertNotIn(paths[-2], pcapng._captures)
+        finally:
+            shutil.rmtree(tmp)
+            pcapng._captures.clear()
+
+if __name__ == "__main__":
+    unittest.main()
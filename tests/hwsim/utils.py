@@ -5,16 +5,20 @@
 # See README for more details.
 
 import binascii
+import ctypes
 import os
+import select
 import socket
 import struct
 import subprocess
 import time
 import remotehost
+import frames
 import logging
 import re
 logger = logging.getLogger()
 import hostapd
+import eventbuffer
 
 def get_ifnames():
     ifnames = []
@@ -78,6 +82,142 @@ def wait_fail_trigger(dev, cmd, note="Failure not triggered", max_iter=40,
             raise Exception(note)
         time.sleep(timeout)
 
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+
+class _Inotify:
+    """Wakeups for modifications of files (the watches are on the parent
+    directories so that files that do not exist yet can be waited for)"""
+
+    def __init__(self, paths):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for d in set([os.path.dirname(os.path.abspath(p)) for p in paths]):
+            if libc.inotify_add_watch(self.fd, d.encode(), mask) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def fileno(self):
+        return self.fd
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+class _NetlinkWakeup:
+    def __init__(self, groups):
+        self.s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                               socket.NETLINK_ROUTE)
+        self.s.setblocking(False)
+        self.s.bind((0, groups))
+
+    def fileno(self):
+        return self.s.fileno()
+
+    def drain(self):
+        try:
+            while self.s.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        self.s.close()
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+def wait_until(predicate=None, timeout=10, interval=0.1, dev=None,
+               events=None, paths=None, netlink_groups=0, wakeups=None):
+    """Wait until predicate() returns a true value or one of events is
+    received from dev
+
+    Instead of sleeping a fixed time between the checks, the wait is woken
+    up by control interface events from dev (WpaSupplicant or Hostapd),
+    modifications of the files in paths (inotify), rtnetlink
+    notifications in netlink_groups (RTMGRP_*), and the caller's own
+    wakeups (objects with fileno() and drain(), e.g., nl80211.ScanMonitor).
+    predicate() is also checked every interval seconds. Returns the
+    predicate() value or the matching event, or None on timeout."""
+    end = time.time() + timeout
+    mon = dev.mon if dev else None
+    dbg = dev.dbg + ": " if dev else ""
+    since = eventbuffer.read_pending(mon, dbg) if mon else None
+    own_wakeups = []
+    try:
+        if paths:
+            try:
+                own_wakeups.append(_Inotify(paths))
+            except OSError as e:
+                logger.debug("wait_until: no inotify: " + str(e))
+        if netlink_groups:
+            own_wakeups.append(_NetlinkWakeup(netlink_groups))
+        wakeups = own_wakeups + (wakeups or [])
+        mon_sock = getattr(mon, 's', None) if mon else None
+        while True:
+            if mon:
+                eventbuffer.read_pending(mon, dbg)
+                if events:
+                    buf = eventbuffer.monitor_events(mon)
+                    ev = buf.find(events, since)
+                    if ev:
+                        buf.consume(ev.seq)
+                        return ev.msg
+            if predicate:
+                res = predicate()
+                if res:
+                    return res
+            remaining = end - time.time()
+            if remaining <= 0:
+                return None
+            wait = min(remaining, interval)
+            if mon and mon_sock is None:
+                # No socket to select on (e.g., RemoteCtrl)
+                mon.pending(timeout=wait)
+                continue
+            fds = wakeups + ([mon_sock] if mon_sock else [])
+            if not fds:
+                time.sleep(wait)
+                continue
+            r, _, _ = select.select(fds, [], [], wait)
+            for wakeup in wakeups:
+                if wakeup in r:
+                    wakeup.drain()
+    finally:
+        for wakeup in own_wakeups:
+            wakeup.close()
+
+def wait_file_idle(path, min_wait=0, idle=0.03, timeout=0.1):
+    """Wait at least min_wait seconds and until a file (e.g., a capture
+    file) exists and has not changed for idle seconds"""
+    start = time.time()
+    state = {'size': None, 'time': start}
+    def is_idle():
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            size = None
+        now = time.time()
+        if size != state['size']:
+            state['size'] = size
+            state['time'] = now
+            return False
+        return size is not None and now - state['time'] >= idle and \
+            now - start >= min_wait
+    return wait_until(is_idle, timeout=timeout, interval=idle, paths=[path])
+
 def require_under_vm():
     if os.getenv('VM') != 'VM':
         raise HwsimSkip("Not running under VM")
@@ -214,16 +354,7 @@ def get_phy(ap, ifname=None):
     return phy
 
 def parse_ie(buf):
-    ret = {}
-    data = binascii.unhexlify(buf)
-    while len(data) >= 2:
-        ie, elen = struct.unpack('BB', data[0:2])
-        data = data[2:]
-        if elen > len(data):
-            break
-        ret[ie] = data[0:elen]
-        data = data[elen:]
-    return ret
+    return frames.Elements(binascii.unhexlify(buf)).to_dict()
 
 def wait_regdom_changes(dev):
     for i in range(10):
@@ -0,0 +1,91 @@
+# Test case flakiness model based on historical results
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import json
+import math
+import os
+
+class FlakinessModel(object):
+    """Per test case failure history and the retry policy derived from it
+
+    The history is a list of PASS/FAIL results per test case, oldest first,
+    either from a results database written by run-tests.py -S or from a
+    JSON file maintained by parallel-vm.py. A test case that both passes
+    and fails is flaky; one that failed in each of its recent runs is
+    considered to fail deterministically and is not retried."""
+
+    def __init__(self, max_retries=3, history_len=50, target=0.05):
+        self.max_retries = max_retries
+        self.history_len = history_len
+        self.target = target
+        self.history = {}
+
+    def load(self, fname):
+        with open(fname, 'rb') as f:
+            sqlite = f.read(16) == b'SQLite format 3\x00'
+        if sqlite:
+            import sqlite3
+            conn = sqlite3.connect(fname)
+            sql = "SELECT test,result FROM results WHERE result IN ('PASS','FAIL') ORDER BY run,time"
+            for test, result in conn.execute(sql):
+                self.add(test, result)
+            conn.close()
+        else:
+            with open(fname, 'r') as f:
+                for test, results in json.load(f).items():
+                    for result in results:
+                        self.add(test, result)
+
+    def save(self, fname):
+        tmp = fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.history, f, indent=0, sort_keys=True)
+        os.rename(tmp, fname)
+
+    def add(self, test, result):
+        if result not in ('PASS', 'FAIL'):
+            return
+        res = self.history.setdefault(test, [])
+        res.append(result)
+        if len(res) > self.history_len:
+            del res[0:len(res) - self.history_len]
+
+    def failure_rate(self, test):
+        res = self.history.get(test)
+        if not res:
+            return None
+        return (res.count('FAIL') + 0.5) / (len(res) + 1)
+
+    def score(self, test):
+        """Return the flakiness score (0..1; 1 = fails half of the runs) or
+        None if there is no history for the test case"""
+        res = self.history.get(test)
+        if not res:
+            return None
+        if 'PASS' not in res or 'FAIL' not in res:
+            return 0.0
+        p = res.count('FAIL') / len(res)
+        return 4 * p * (1 - p)
+
+    def is_flaky(self, test, threshold=0.1):
+        score = self.score(test)
+        return score is not None and score >= threshold and \
+            not self.is_deterministic_failure(test)
+
+    def is_deterministic_failure(self, test):
+        res = self.history.get(test, [])
+        return len(res) >= 3 and 'PASS' not in res[-3:]
+
+    def retries(self, test):
+        """Number of times to retry a failed test case"""
+        if self.is_deterministic_failure(test):
+            return 0
+        p = self.failure_rate(test)
+        if p is None or p >= 1:
+            return 1
+        # Enough retries to make the probability of a flaky test case
+        # failing on each of them less than the target
+        n = math.ceil(math.log(self.target) / math.log(p))
+        return max(1, min(n, self.max_retries))
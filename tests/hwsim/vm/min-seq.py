@@ -6,8 +6,12 @@
 # This software may be distributed under the terms of the BSD license.
 # See README for more details.
 
+import argparse
+import json
+import os
 import subprocess
-import sys
+import threading
+import time
 from colorama import Fore, Style
 
 def red(s, bright=False):
@@ -21,63 +25,162 @@ def yellow(s, bright=False):
 def bright(s):
     return Style.BRIGHT + s + Style.RESET_ALL
 
-def run_tests(tests):
-    print(yellow("Run test sequence: ") + ' '.join(tests))
-    arg = ['./vm-run.sh'] + tests
-    cmd = subprocess.Popen(arg, stdout=subprocess.PIPE)
-    out = cmd.stdout.read().decode()
-    found = False
-    for i in out.splitlines():
-        if i.startswith('FAIL '):
-            t = i.split(' ')[1]
-            if t == tests[-1]:
-                found = True
+class SequenceRunner(object):
+    """Run candidate test sequences in concurrent VMs
+
+    Each sequence is run in a freshly started VM with vm-run.sh; the VMs use
+    the same --timestamp/--ext log directory naming as parallel-vm.py so
+    that concurrent runs do not share a log directory. Results are cached
+    (optionally in a file) so that a sequence is never run twice."""
+
+    def __init__(self, jobs=1, cache_file=None, extra_args=None):
+        self.jobs = jobs
+        self.cache_file = cache_file
+        self.extra_args = extra_args or []
+        self.timestamp = int(time.time())
+        self.count = 0
+        self.runs = 0
+        self.lock = threading.Lock()
+        self.cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                for seq, res in json.load(f):
+                    self.cache[tuple(seq)] = res
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        with open(self.cache_file, 'w') as f:
+            json.dump([[list(seq), res] for seq, res in self.cache.items()],
+                      f)
+
+    def run_vm(self, tests):
+        with self.lock:
+            self.count += 1
+            ext = 'minseq.%d' % self.count
+        print(yellow("Run test sequence: ") + ' '.join(tests))
+        arg = ['./vm-run.sh', '--timestamp', str(self.timestamp),
+               '--ext', ext] + self.extra_args + tests
+        cmd = subprocess.Popen(arg, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+        out = cmd.stdout.read().decode()
+        cmd.wait()
+        found = False
+        for i in out.splitlines():
+            if i.startswith('FAIL '):
+                t = i.split(' ')[1]
+                if t == tests[-1]:
+                    found = True
+                else:
+                    print(red("Unexpected FAIL: ", bright=True) + t)
+                    return None
+        return found
+
+    def run(self, sequences):
+        """Return the results (True = the last test case failed, False = no
+        failure, None = some other test case failed) for the sequences"""
+        sequences = [tuple(seq) for seq in sequences]
+        todo = []
+        for seq in sequences:
+            if seq not in self.cache and seq not in todo:
+                todo.append(seq)
+        results = {}
+
+        def worker():
+            while True:
+                with self.lock:
+                    if not todo:
+                        return
+                    seq = todo.pop(0)
+                results[seq] = self.run_vm(list(seq))
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.jobs, len(todo)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.runs += len(results)
+        self.cache.update(results)
+        self.save_cache()
+        return [self.cache[seq] for seq in sequences]
+
+def split(items, n):
+    res = []
+    start = 0
+    for i in range(n):
+        end = start + (len(items) - start) // (n - i)
+        res.append(items[start:end])
+        start = end
+    return res
+
+def ddmin(runner, tests):
+    """Delta debugging (ddmin) on the test cases before the last one
+
+    The failing test case is always kept as the last entry. At each
+    granularity the subsets and their complements are evaluated
+    concurrently (up to the number of jobs at a time) and the first
+    candidate in order that still reproduces the failure is used."""
+    target = tests[-1]
+    prefix = tests[:-1]
+    if prefix and runner.run([[target]])[0]:
+        print(yellow("The failing test case fails alone", bright=True))
+        return [target]
+    n = 2
+    while len(prefix) > 1:
+        n = min(n, len(prefix))
+        chunks = split(prefix, n)
+        candidates = [c for c in chunks]
+        if n > 2:
+            for i in range(n):
+                candidates.append([t for j, c in enumerate(chunks) if j != i
+                                   for t in c])
+        reduced = None
+        for i in range(0, len(candidates), runner.jobs):
+            batch = candidates[i:i + runner.jobs]
+            results = runner.run([c + [target] for c in batch])
+            for c, res in zip(batch, results):
+                if res and len(c) < len(prefix):
+                    reduced = c
+                    break
+            if reduced is not None:
+                break
+        if reduced is not None:
+            print(yellow("Found a shorter sequence: ", bright=True) + ' '.join(reduced + [target]))
+            if reduced in chunks:
+                n = 2
             else:
-                print(red("Unexpected FAIL: ", bright=True) + t)
-                return None
-    return found
-
-def reduce(tests):
-    if len(tests) < 2:
-        return None
-
-    # Try to remove first half of the test cases to speed up the initial process
-    if len(tests) > 10:
-        a = list(tests[int(len(tests) / 2):])
-        res = run_tests(a)
-        if res is None:
-            return None
-        if res:
-            return a
-
-    # Try to remove test cases one-by-one (starting with larger groups to speed
-    # up)
-    for count in [27, 9, 6, 3, 1]:
-        for i in range(0, len(tests) - count, count):
-            b = list(tests)
-            del b[i:i + count]
-            if len(b) < 2:
-                continue
-            res = run_tests(b)
-            if res is None:
-                return None
-            if res:
-                return b
-
-    return None
+                n = max(n - 1, 2)
+            prefix = reduced
+            continue
+        if n >= len(prefix):
+            break
+        n = min(2 * n, len(prefix))
+    return prefix + [target]
 
 def main():
-    tests = sys.argv[1:]
+    parser = argparse.ArgumentParser(description='Find a minimal test case sequence that reproduces the failure of the last test case')
+    parser.add_argument('-j', metavar='<num>', type=int, default=1,
+                        dest='jobs',
+                        help='number of VMs to run concurrently')
+    parser.add_argument('--cache', metavar='<file>',
+                        help='file for caching the results of test sequences')
+    parser.add_argument('--vm-arg', metavar='<arg>', action='append',
+                        dest='vm_args', default=[],
+                        help='additional argument for vm-run.sh')
+    parser.add_argument('tests', metavar='<test>', nargs='+',
+                        help='test case sequence ending with the failing test case')
+    args = parser.parse_args()
+
+    tests = args.tests
     num_tests = len(tests)
-    if not run_tests(tests):
+    runner = SequenceRunner(jobs=max(args.jobs, 1), cache_file=args.cache,
+                            extra_args=args.vm_args)
+    if not runner.run([tests])[0]:
         print(red("Full test sequence did not result in an error", bright=True))
         return
-    while True:
-        new_tests = reduce(tests)
-        if (not new_tests) or len(new_tests) == len(tests):
-            break
-        tests = new_tests
-        print(yellow("Found a shorter sequence: ", bright=True) + ' '.join(tests))
+    tests = ddmin(runner, tests)
+    print("%d test sequence(s) run" % runner.runs)
     if len(tests) < num_tests:
         print(bright("Minimal sequence:"))
         print(' '.join(tests))
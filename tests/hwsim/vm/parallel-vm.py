@@ -7,8 +7,10 @@
 # See README for more details.
 
 from __future__ import print_function
+import contextlib
 import curses
 import fcntl
+import json
 import logging
 import multiprocessing
 import os
@@ -19,9 +21,17 @@ import subprocess
 import sys
 import time
 import errno
+from shared_queue import QueueCoordinator, RemoteTestQueue
+from flakiness import FlakinessModel
 
 logger = logging.getLogger()
 
+coordinator = None
+remote_queue = None
+flakiness = None
+flaky_vms = 0
+run_results = []
+
 # Test cases that take significantly longer time to execute than average.
 long_tests = ["ap_roam_open",
               "hostapd_oom_wpa2_eap_connect_1",
@@ -128,17 +138,186 @@ memory_read_tests = ["ap_wpa2_eap_fast_pac_lifetime",
                      "wpas_ap_lifetime_in_memory",
                      "wpas_ap_lifetime_in_memory2"]
 
+def load_durations(fname):
+    durations = {}
+    with open(fname, 'rb') as f:
+        sqlite = f.read(16) == b'SQLite format 3\x00'
+    if sqlite:
+        # Results database from run-tests.py -S
+        import sqlite3
+        conn = sqlite3.connect(fname)
+        sql = "SELECT test,AVG(duration) FROM results WHERE result='PASS' GROUP BY test"
+        for test, duration in conn.execute(sql):
+            if duration is not None:
+                durations[test] = float(duration)
+        conn.close()
+    else:
+        with open(fname, 'r') as f:
+            durations = json.load(f)
+    return durations
+
+def save_durations(fname, durations):
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(durations, f, indent=0, sort_keys=True)
+    os.rename(tmp, fname)
+
+def schedule_tests(tests, durations):
+    # Longest processing time first: each VM picks the next test case from
+    # the beginning of the queue when it completes the previous one, so
+    # sorting by decreasing expected duration minimizes the time the last
+    # VMs spend on a long test case after the others have completed.
+    known = sorted([durations[t] for t in tests if t in durations])
+    if known:
+        default = known[len(known) // 2]
+    else:
+        default = 0
+    order = {t: i for i, t in enumerate(tests)}
+    return sorted(tests, key=lambda t: (-durations.get(t, default), order[t]))
+
+def retries_for(name):
+    if flakiness:
+        return flakiness.retries(name)
+    return 1
+
+def queue_lock():
+    # With --serve, the handler threads of the coordinator modify the same
+    # list as the local VMs.
+    if coordinator:
+        return coordinator.cond
+    return contextlib.nullcontext()
+
+def requeue_test(test_queue, name, count):
+    logger.debug("Requeue test case %s" % name)
+    with queue_lock():
+        test_queue.append((name, count))
+
+def pop_test(vm, test_queue):
+    # With dedicated VMs for flaky test cases, those VMs take the first
+    # flaky test case in the queue and the other VMs the first other one.
+    with queue_lock():
+        if flaky_vms and flakiness and isinstance(test_queue, list):
+            want_flaky = vm['idx'] < flaky_vms
+            for i, (name, count) in enumerate(test_queue):
+                if flakiness.is_flaky(name) == want_flaky:
+                    return test_queue.pop(i)
+        return test_queue.pop(0)
+
+def test_completed(vm, name, result, duration):
+    # For a failed test case, this is called only after the retry has been
+    # queued. Otherwise the coordinator could see no outstanding test cases
+    # between the result and the retry and complete the run.
+    run_results.append((name, result, vm['current_count']))
+    if duration is not None:
+        test_durations[name] = duration
+    if remote_queue:
+        remote_queue.result(name, result, duration, vm['current_count'])
+
+def record_result(vm, line):
+    vals = line.split(' ')
+    if len(vals) < 2:
+        return
+    duration = None
+    if len(vals) >= 3:
+        try:
+            duration = float(vals[2])
+        except ValueError:
+            pass
+    test_completed(vm, vals[1], vals[0], duration)
+
 def get_failed(vm):
     failed = []
     for i in range(num_servers):
         failed += vm[i]['failed']
     return failed
 
+def vm_test_failed(vm, name, test_queue):
+    global total_failed, all_failed, first_run_failures
+
+    total_failed += 1
+    logger.debug("VM[%d] test case failed: %s" % (vm['idx'], name))
+    vm['failed'].append(name)
+    all_failed.append(name)
+    if name != vm['current_name']:
+        logger.info("VM[%d] test result mismatch: %s (expected %s)" % (vm['idx'], name, vm['current_name']))
+    else:
+        vm['current_name'] = None
+        count = vm['current_count']
+        if count == 0:
+            first_run_failures.append(name)
+        if rerun_failures and count < retries_for(name):
+            requeue_test(test_queue, name, count + 1)
+
+def vm_test_started(vm, name):
+    global total_started
+
+    total_started += 1
+    if len(vm['failed']) == 0 and name:
+        vm['fail_seq'].append(name)
+
+def run_tests_supports(option):
+    """Check whether the run-tests.py that the VMs run accepts an option"""
+    scriptsdir = os.path.dirname(os.path.realpath(sys.argv[0]))
+    testdir = os.environ.get('TESTDIR', os.path.dirname(scriptsdir))
+    cmd = [os.path.join(testdir, 'run-tests.py'), '--help']
+    try:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    return option in res.stdout.decode(errors='replace')
+
+def vm_progress(vm, msg, test_queue):
+    """Process a progress message from run-tests.py --progress-json
+
+    Returns (ready, line) where line is the equivalent of the message in the
+    text output format for the VM output log."""
+    global total_passed, total_failed, total_skipped
+
+    mtype = msg.get('type')
+    name = msg.get('name')
+    if mtype == 'ready':
+        vm['starting'] = False
+        vm['started'] = True
+        return True, "READY"
+    if mtype == 'start':
+        vm_test_started(vm, name)
+        return False, "START %s %s/%s" % (name, msg.get('count'),
+                                         msg.get('total'))
+    if mtype == 'not-found':
+        total_failed += 1
+        logger.info("VM[%d] test case not found: %s" % (vm['idx'], name))
+        return True, "NOT-FOUND"
+    if mtype == 'warning':
+        logger.info("VM[%d] %s: %s" % (vm['idx'], name, msg.get('text')))
+        return False, None
+    if mtype != 'result':
+        logger.info("VM[%d] unknown progress message: %s" % (vm['idx'],
+                                                             str(msg)))
+        return False, None
+    result = msg.get('result')
+    duration = msg.get('duration')
+    logger.debug("VM[%d] result %s %s duration=%s rusage=%s logs=%s" % (
+        vm['idx'], name, result, duration, msg.get('rusage'), msg.get('logs')))
+    if result == 'PASS':
+        total_passed += 1
+        vm['current_name'] = None
+    elif result == 'SKIP':
+        total_skipped += 1
+        vm['current_name'] = None
+        if msg.get('reason'):
+            vm['skip_reason'].append(msg['reason'])
+    else:
+        vm_test_failed(vm, name, test_queue)
+    test_completed(vm, name, result,
+                   float(duration) if duration is not None else None)
+    line = "%s %s %s %s" % (result, name, duration, msg.get('end', ''))
+    if result == 'FAIL' and msg.get('reason'):
+        line += " - " + msg['reason']
+    return True, line.rstrip()
+
 def vm_read_stdout(vm, test_queue):
-    global total_started, total_passed, total_failed, total_skipped
-    global rerun_failures
-    global first_run_failures
-    global all_failed
+    global total_passed, total_failed, total_skipped
 
     ready = False
     try:
@@ -161,17 +340,34 @@ def vm_read_stdout(vm, test_queue):
         line = pending[0:pos].rstrip()
         pending = pending[(pos + 1):]
         logger.debug("VM[%d] stdout full line[%s]" % (vm['idx'], line))
-        if line.startswith("READY"):
+        if '\x1e' in line:
+            # Framed JSON progress message; anything before the RS
+            # character is unrelated output that was not terminated with
+            # a newline.
+            pos = line.index('\x1e')
+            if pos > 0:
+                vm['out'] += line[0:pos] + '\n'
+            try:
+                msg = json.loads(line[pos + 1:])
+            except ValueError:
+                logger.info("VM[%d] invalid progress message: %s" % (vm['idx'], line[pos + 1:]))
+                continue
+            msg_ready, line = vm_progress(vm, msg, test_queue)
+            if msg_ready:
+                ready = True
+            if line is None:
+                continue
+        elif line.startswith("READY"):
             vm['starting'] = False
             vm['started'] = True
             ready = True
         elif line.startswith("PASS"):
             ready = True
             total_passed += 1
+            record_result(vm, line)
             vm['current_name'] = None
         elif line.startswith("FAIL"):
             ready = True
-            total_failed += 1
             vals = line.split(' ')
             if len(vals) < 2:
                 logger.info("VM[%d] incomplete FAIL line: %s" % (vm['idx'],
@@ -179,19 +375,8 @@ def vm_read_stdout(vm, test_queue):
                 name = line
             else:
                 name = vals[1]
-            logger.debug("VM[%d] test case failed: %s" % (vm['idx'], name))
-            vm['failed'].append(name)
-            all_failed.append(name)
-            if name != vm['current_name']:
-                logger.info("VM[%d] test result mismatch: %s (expected %s)" % (vm['idx'], name, vm['current_name']))
-            else:
-                vm['current_name'] = None
-                count = vm['current_count']
-                if count == 0:
-                    first_run_failures.append(name)
-                if rerun_failures and count < 1:
-                    logger.debug("Requeue test case %s" % name)
-                    test_queue.append((name, vm['current_count'] + 1))
+            vm_test_failed(vm, name, test_queue)
+            record_result(vm, line)
         elif line.startswith("NOT-FOUND"):
             ready = True
             total_failed += 1
@@ -199,15 +384,13 @@ def vm_read_stdout(vm, test_queue):
         elif line.startswith("SKIP"):
             ready = True
             total_skipped += 1
+            record_result(vm, line)
             vm['current_name'] = None
         elif line.startswith("REASON"):
             vm['skip_reason'].append(line[7:])
         elif line.startswith("START"):
-            total_started += 1
-            if len(vm['failed']) == 0:
-                vals = line.split(' ')
-                if len(vals) >= 2:
-                    vm['fail_seq'].append(vals[1])
+            vals = line.split(' ')
+            vm_test_started(vm, vals[1] if len(vals) >= 2 else None)
         vm['out'] += line + '\n'
         lines.append(line)
     vm['pending'] = pending
@@ -246,20 +429,32 @@ def vm_read_stderr(vm):
         if e.errno != errno.EAGAIN:
             raise
 
+def num_vm_busy():
+    count = 0
+    for i in range(num_servers):
+        if vm[i]['busy']:
+            count += 1
+    return count
+
+def vm_shutdown(_vm, scr, status_line):
+    _vm['proc'].stdin.write(b'\n')
+    _vm['proc'].stdin.flush()
+    if _vm['idx'] < status_line:
+        scr.addstr("shutting down")
+    logger.info("VM[%d] shutting down" % _vm['idx'])
+
 def vm_next_step(_vm, scr, test_queue):
     max_y, max_x = scr.getmaxyx()
     status_line = num_servers
     if status_line >= max_y:
         status_line = max_y - 1
+    _vm['busy'] = False
+    _vm['idle'] = False
     if _vm['idx'] < status_line:
         scr.move(_vm['idx'], 10)
         scr.clrtoeol()
     if not test_queue:
-        _vm['proc'].stdin.write(b'\n')
-        _vm['proc'].stdin.flush()
-        if _vm['idx'] < status_line:
-            scr.addstr("shutting down")
-        logger.info("VM[%d] shutting down" % _vm['idx'])
+        vm_shutdown(_vm, scr, status_line)
         return
     if _vm['max_tests'] and _vm['started_tests'] >= _vm['max_tests']:
         _vm['proc'].stdin.write(b'\n')
@@ -269,16 +464,39 @@ def vm_next_step(_vm, scr, test_queue):
         logger.info("VM[%d] shutting down for VM restart" % _vm['idx'])
         _vm['restart'] = True
         return
-    (name, count) = test_queue.pop(0)
+    if num_vm_busy() >= max_active:
+        # Keep this VM booted and ready as a warm spare until one of the
+        # active VMs completes or shuts down for a restart.
+        _vm['idle'] = True
+        if _vm['idx'] < status_line:
+            scr.addstr("ready (warm spare)")
+        logger.debug("VM[%d] ready as a warm spare" % _vm['idx'])
+        return
+    try:
+        (name, count) = pop_test(_vm, test_queue)
+    except IndexError:
+        # The shared test queue was emptied by other workers
+        vm_shutdown(_vm, scr, status_line)
+        return
     _vm['current_name'] = name
     _vm['current_count'] = count
     _vm['proc'].stdin.write(name.encode() + b'\n')
     _vm['proc'].stdin.flush()
+    _vm['busy'] = True
     _vm['started_tests'] += 1
     if _vm['idx'] < status_line:
         scr.addstr(name)
     logger.debug("VM[%d] start test %s" % (_vm['idx'], name))
 
+def dispatch_warm_spares(scr, test_queue):
+    for i in range(num_servers):
+        _vm = vm[i]
+        if not _vm['idle'] or not _vm['proc']:
+            continue
+        if test_queue and num_vm_busy() >= max_active:
+            break
+        vm_next_step(_vm, scr, test_queue)
+
 def check_vm_start(scr, sel, test_queue):
     running = False
     max_y, max_x = scr.getmaxyx()
@@ -312,6 +530,8 @@ def vm_terminated(_vm, scr, sel, test_queue):
     for stream in [_vm['proc'].stdout, _vm['proc'].stderr]:
         sel.unregister(stream)
     _vm['proc'] = None
+    _vm['busy'] = False
+    _vm['idle'] = False
     max_y, max_x = scr.getmaxyx()
     status_line = num_servers
     if status_line >= max_y:
@@ -359,9 +579,9 @@ def vm_terminated(_vm, scr, sel, test_queue):
         count = _vm['current_count']
         if count == 0:
             first_run_failures.append(name)
-        if rerun_failures and count < 1:
-            logger.debug("Requeue test case %s" % name)
-            test_queue.append((name, count + 1))
+        if rerun_failures and count < retries_for(name):
+            requeue_test(test_queue, name, count + 1)
+        test_completed(_vm, name, "FAIL", None)
         updated = True
 
     return updated
@@ -430,7 +650,12 @@ def show_progress(scr):
     sel = selectors.DefaultSelector()
     total_tests = len(tests)
     logger.info("Total tests: %d" % total_tests)
-    test_queue = [(t, 0) for t in tests]
+    if remote_queue:
+        test_queue = remote_queue
+    else:
+        test_queue = [(t, 0) for t in tests]
+        if coordinator:
+            coordinator.start(test_queue)
     start_vm(vm[0], sel)
 
     scr.leaveok(1)
@@ -462,6 +687,7 @@ def show_progress(scr):
             if _vm['proc'].poll() is not None:
                 vm_terminated(_vm, scr, sel, test_queue)
                 updated = True
+        dispatch_warm_spares(scr, test_queue)
 
         running, run_update = check_vm_start(scr, sel, test_queue)
         if updated or run_update:
@@ -533,6 +759,7 @@ def main():
     import argparse
     import os
     global num_servers
+    global max_active
     global vm
     global all_failed
     global dir
@@ -541,6 +768,9 @@ def main():
     global first_run_failures
     global total_started, total_passed, total_failed, total_skipped
     global rerun_failures
+    global test_durations
+    global coordinator, remote_queue
+    global flakiness, flaky_vms
 
     total_started = 0
     total_passed = 0
@@ -584,6 +814,23 @@ def main():
     p.add_argument('--max-tests', dest='maxtests',
                    metavar='<maximum number of tests per VM>', type=int,
                    help="limit the number of test cases to be executed per a VM instance")
+    p.add_argument('--warm-spares', dest='warm_spares', metavar='<num>',
+                   type=int, default=0,
+                   help="number of additional VMs to keep booted and ready to take over from VMs that complete or restart")
+    p.add_argument('--history', dest='history', metavar='<file>',
+                   help="test case result history for the retry policy (results database from run-tests.py -S or JSON file; default: test-history.json in the log directory)")
+    p.add_argument('--max-retries', dest='max_retries', metavar='<num>',
+                   type=int, default=3,
+                   help="maximum number of retries for a failed test case that has been flaky (default: 3)")
+    p.add_argument('--flaky-vms', dest='flaky_vms', metavar='<num>',
+                   type=int, default=0,
+                   help="number of VMs dedicated for test cases that have been flaky")
+    p.add_argument('--serve', dest='serve', metavar='<address>',
+                   help="serve the test queue to parallel-vm.py --connect instances on other hosts (<host>:<port> or UNIX socket path)")
+    p.add_argument('--connect', dest='connect', metavar='<address>',
+                   help="take test cases from the queue of a parallel-vm.py --serve instance instead of selecting them locally")
+    p.add_argument('--durations', dest='durations', metavar='<file>',
+                   help="test case durations for scheduling (results database from run-tests.py -S or JSON file; default: test-durations.json in the log directory)")
     p.add_argument('params', nargs='*')
     args = p.parse_args()
 
@@ -594,7 +841,8 @@ def main():
         if e.errno != errno.EEXIST:
             raise
 
-    num_servers = args.num_servers
+    num_servers = args.num_servers + max(args.warm_spares, 0)
+    max_active = args.num_servers
     rerun_failures = not args.no_retry
     if args.debug:
         debug_level = logging.DEBUG
@@ -616,7 +864,14 @@ def main():
         codecov = False
 
     first_run_failures = []
-    if args.params:
+    coordinator = None
+    remote_queue = None
+    if args.serve and args.connect:
+        sys.exit("Only one of --serve and --connect can be used")
+    if args.connect:
+        remote_queue = RemoteTestQueue(args.connect)
+        tests = []
+    elif args.params:
         tests = args.params
     else:
         tests = []
@@ -628,19 +883,53 @@ def main():
         for l in lst.stdout.readlines():
             name = l.decode().split(' ')[0]
             tests.append(name)
-    if len(tests) == 0:
+    if len(tests) == 0 and not remote_queue:
         sys.exit("No test cases selected")
+    if args.serve:
+        coordinator = QueueCoordinator(args.serve)
+
+    durations_file = os.path.join(dir, 'test-durations.json')
+    durations = {}
+    try:
+        durations = load_durations(args.durations or durations_file)
+    except FileNotFoundError:
+        if args.durations:
+            sys.exit("Durations file not found: " + args.durations)
+    except Exception as e:
+        print("Could not load test case durations: " + str(e))
+    test_durations = {}
+
+    history_file = os.path.join(dir, 'test-history.json')
+    flakiness = FlakinessModel(max_retries=args.max_retries)
+    try:
+        flakiness.load(args.history or history_file)
+    except FileNotFoundError:
+        if args.history:
+            sys.exit("History file not found: " + args.history)
+    except Exception as e:
+        print("Could not load test case history: " + str(e))
+    flaky_vms = args.flaky_vms
 
     if args.shuffle:
         from random import shuffle
         shuffle(tests)
     elif num_servers > 2 and len(tests) > 100:
-        # Move test cases with long duration to the beginning as an
-        # optimization to avoid last part of the test execution running a long
-        # duration test case on a single VM while all other VMs have already
-        # completed their work.
-        for l in long_tests:
-            if l in tests:
+        if durations:
+            tests = schedule_tests(tests, durations)
+        else:
+            # Move test cases with long duration to the beginning as an
+            # optimization to avoid last part of the test execution running
+            # a long duration test case on a single VM while all other VMs
+            # have already completed their work.
+            for l in long_tests:
+                if l in tests:
+                    tests.remove(l)
+                    tests.insert(0, l)
+
+        # Move test cases that have been flaky in the earlier runs to the
+        # beginning to leave time for retrying them.
+        if flakiness:
+            for l in [t for t in tests if flakiness.is_flaky(t)]:
                 tests.remove(l)
                 tests.insert(0, l)
 
@@ -673,13 +962,21 @@ def main():
     log_handler.setFormatter(log_formatter)
     logger.addHandler(log_handler)
 
+    # Older run-tests.py versions do not know --progress-json and report
+    # the progress only in the text format.
+    progress_args = []
+    if run_tests_supports('--progress-json'):
+        progress_args = ['--progress-json']
+    else:
+        logger.info("run-tests.py does not support --progress-json; using the text progress format")
+
     all_failed = []
     vm = {}
     for i in range(0, num_servers):
         cmd = [os.path.join(scriptsdir, 'vm-run.sh'),
                '--timestamp', str(timestamp),
                '--ext', 'srv.%d' % (i + 1),
-               '-i'] + codecov_args + extra_args
+               '-i'] + progress_args + codecov_args + extra_args
         if args.telnet:
             cmd += ['--telnet', str(args.telnet + i)]
         vm[i] = {}
@@ -702,6 +999,8 @@ def main():
         vm[i]['max_tests'] = args.maxtests if args.maxtests else None
         vm[i]['started_tests'] = 0
         vm[i]['restart'] = False
+        vm[i]['busy'] = False
+        vm[i]['idle'] = False
 
     print('')
 
@@ -724,6 +1023,38 @@ def main():
 
         show_progress(FakeScreen())
 
+    remote_failed = []
+    if coordinator:
+        def waiting(outstanding, queued):
+            print("Waiting for workers: %d test case(s) running, %d queued" % (outstanding, queued))
+        coordinator.wait(report=waiting)
+        coordinator.close()
+        for worker, name, result, duration, count in coordinator.results:
+            total_started += 1
+            if duration is not None:
+                test_durations[name] = duration
+            if result == 'PASS':
+                total_passed += 1
+            elif result == 'SKIP':
+                total_skipped += 1
+            else:
+                total_failed += 1
+                remote_failed.append(name)
+                all_failed.append(name)
+                if count == 0:
+                    first_run_failures.append(name)
+                logger.info("Test case %s failed on worker %s" % (name, worker))
+        for name, count in coordinator.queue:
+            print("Test case not run: " + name)
+            logger.info("Test case not run: " + name)
+            total_failed += 1
+            remote_failed.append(name)
+            all_failed.append(name)
+            if count == 0:
+                first_run_failures.append(name)
+    if remote_queue:
+        remote_queue.close()
+
     with open('{}/{}-parallel.log'.format(dir, timestamp), 'w') as f:
         for i in range(0, num_servers):
             f.write('VM {}\n{}\n{}\n'.format(i + 1, vm[i]['out'], vm[i]['err']))
@@ -740,7 +1071,53 @@ def main():
                     print(fname)
                     f.write("%s\n" % fname)
 
-    failed = get_failed(vm)
+    failed = get_failed(vm) + remote_failed
+
+    retried_pass = set()
+    for name, result, count in run_results:
+        if result == 'PASS' and count > 0:
+            retried_pass.add(name)
+    if coordinator:
+        for worker, name, result, duration, count in coordinator.results:
+            run_results.append((name, result, count))
+            if result == 'PASS' and count > 0:
+                retried_pass.add(name)
+    not_retried = [name for name in first_run_failures
+                   if rerun_failures and retries_for(name) == 0]
+    scores = []
+    for name in sorted(set(first_run_failures)):
+        score = flakiness.score(name)
+        score = "%.2f" % score if score is not None else "unknown"
+        logger.info("Flakiness: %s score=%s retries=%d" % (name, score, retries_for(name)))
+        scores.append("%s=%s" % (name, score))
+    if scores:
+        print("Flakiness score of failed test cases (from earlier runs):")
+        print(' '.join(scores))
+    if args.history and args.history != history_file:
+        try:
+            flakiness = FlakinessModel(max_retries=args.max_retries)
+            flakiness.load(history_file)
+        except Exception:
+            pass
+    for name, result, count in run_results:
+        flakiness.add(name, result)
+    if run_results:
+        try:
+            flakiness.save(history_file)
+        except Exception as e:
+            logger.info("Could not save test case history: " + str(e))
+
+    if test_durations:
+        if args.durations and args.durations != durations_file:
+            try:
+                durations = load_durations(durations_file)
+            except Exception:
+                durations = {}
+        durations.update(test_durations)
+        try:
+            save_durations(durations_file, durations)
+        except Exception as e:
+            logger.info("Could not save test case durations: " + str(e))
 
     if first_run_failures:
         print("To re-run same failure sequence(s):")
@@ -769,6 +1146,15 @@ def main():
         double_failed.append(name)
     for test in first_run_failures:
         double_failed.remove(test)
+    # A test case that passed on a later retry is not counted as failed
+    # even if it failed on more than one attempt.
+    double_failed = [name for name in double_failed
+                     if name not in retried_pass]
+    if not_retried:
+        print("Not retried (failed in each recent run):")
+        print(' '.join(not_retried))
+        logger.info("Not retried: " + ' '.join(not_retried))
+        double_failed += not_retried
     if not rerun_failures:
         pass
     elif failed and not double_failed:
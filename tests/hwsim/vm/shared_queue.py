@@ -0,0 +1,204 @@
+# Test case queue shared between parallel-vm.py instances on multiple hosts
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+#
+# The coordinator (parallel-vm.py --serve <address>) holds the test queue
+# and the worker instances (parallel-vm.py --connect <address>) pull test
+# cases from it one at a time whenever one of their VMs is ready for the
+# next test case. The protocol uses one JSON object per line in both
+# directions. An address with a '/' in it is a UNIX domain socket path,
+# anything else is <host>:<port> for TCP.
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger()
+
+def parse_address(addr):
+    if '/' in addr:
+        return socket.AF_UNIX, addr
+    host, port = addr.rsplit(':', 1)
+    return socket.AF_INET, (host, int(port))
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coord = self.server.coordinator
+        worker = "%s#%d" % (str(self.client_address) or 'unix',
+                            coord.new_worker())
+        logger.info("Test queue worker connected: " + worker)
+        try:
+            for line in self.rfile:
+                msg = json.loads(line.decode())
+                reply = coord.handle(worker, msg)
+                self.wfile.write(json.dumps(reply).encode() + b'\n')
+                self.wfile.flush()
+        except (OSError, ValueError) as e:
+            logger.info("Test queue worker %s failed: %s" % (worker, str(e)))
+        finally:
+            coord.disconnected(worker)
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _UnixServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class QueueCoordinator(object):
+    """Serves the test queue of this parallel-vm.py instance to workers
+
+    The queue is the same list that the local VMs take their test cases
+    from. Test cases handed to a worker are tracked until the worker
+    reports a result for them and they are put back to the queue if the
+    worker disconnects before that."""
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.queue = []
+        self.cond = threading.Condition()
+        self.leases = {}
+        self.results = []
+        self.num_workers = 0
+        self.connected = 0
+        self.server = None
+
+    def start(self, queue):
+        self.queue = queue
+        family, address = parse_address(self.addr)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixServer(address, _Handler)
+        else:
+            self.server = _TCPServer(address, _Handler)
+        self.server.coordinator = self
+        t = threading.Thread(target=self.server.serve_forever,
+                             name="test-queue-server")
+        t.daemon = True
+        t.start()
+        logger.info("Serving test queue at " + self.addr)
+
+    def new_worker(self):
+        with self.cond:
+            self.num_workers += 1
+            self.connected += 1
+            return self.num_workers
+
+    def handle(self, worker, msg):
+        op = msg.get('op')
+        with self.cond:
+            if op == 'len':
+                return {'len': len(self.queue)}
+            if op == 'get':
+                try:
+                    item = self.queue.pop(0)
+                except IndexError:
+                    return {'test': None}
+                self.leases.setdefault(worker, []).append(tuple(item))
+                return {'test': list(item)}
+            if op == 'put':
+                self.queue.append(tuple(msg['test']))
+                self.cond.notify_all()
+                return {}
+            if op == 'result':
+                name = msg['name']
+                for item in self.leases.get(worker, []):
+                    if item[0] == name:
+                        self.leases[worker].remove(item)
+                        break
+                self.results.append((worker, name, msg['result'],
+                                     msg.get('duration'), msg.get('count', 0)))
+                self.cond.notify_all()
+                return {}
+        return {'error': 'unknown operation'}
+
+    def disconnected(self, worker):
+        with self.cond:
+            self.connected -= 1
+            for item in self.leases.pop(worker, []):
+                logger.info("Requeue test case %s from disconnected worker %s" % (item[0], worker))
+                self.queue.append(item)
+            self.cond.notify_all()
+
+    def outstanding(self):
+        return sum([len(l) for l in self.leases.values()])
+
+    def wait(self, report=None):
+        """Wait until the workers have completed the test cases they have
+        taken and no connected worker is left to run the remaining ones"""
+        with self.cond:
+            while self.outstanding() or (self.queue and self.connected):
+                if report:
+                    report(self.outstanding(), len(self.queue))
+                self.cond.wait(10)
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            family, address = parse_address(self.addr)
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.unlink(address)
+            self.server = None
+
+class RemoteTestQueue(object):
+    """Test queue of a coordinator as seen by a worker
+
+    This provides the subset of list operations that parallel-vm.py uses
+    for its local test queue. pop() raises IndexError if the queue became
+    empty after the length was checked."""
+
+    def __init__(self, addr, len_cache_time=0.5):
+        family, address = parse_address(addr)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.f = self.sock.makefile('rwb')
+        self.lock = threading.Lock()
+        self.len_cache_time = len_cache_time
+        self.len_cache = None
+        self.len_time = 0
+
+    def _call(self, msg):
+        with self.lock:
+            self.f.write(json.dumps(msg).encode() + b'\n')
+            self.f.flush()
+            line = self.f.readline()
+        if not line:
+            raise Exception("Test queue coordinator closed the connection")
+        return json.loads(line.decode())
+
+    def __len__(self):
+        now = time.time()
+        if self.len_cache is None or now - self.len_time > self.len_cache_time:
+            self.len_cache = self._call({'op': 'len'})['len']
+            self.len_time = now
+        return self.len_cache
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def pop(self, index=0):
+        res = self._call({'op': 'get'})
+        self.len_cache = None
+        if res['test'] is None:
+            raise IndexError("pop from empty test queue")
+        return tuple(res['test'])
+
+    def append(self, item):
+        self._call({'op': 'put', 'test': list(item)})
+        self.len_cache = None
+
+    def result(self, name, result, duration, count):
+        self._call({'op': 'result', 'name': name, 'result': result,
+                    'duration': duration, 'count': count})
+
+    def close(self):
+        self.f.close()
+        self.sock.close()
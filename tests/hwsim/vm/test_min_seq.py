@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Unit tests for the delta debugging in min-seq.py
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import importlib.util
+import os
+import unittest
+
+def load_min_seq():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'min-seq.py')
+    spec = importlib.util.spec_from_file_location('min_seq', path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+min_seq = load_min_seq()
+
+class FakeRunner(object):
+    """Sequence runner that reports a failure when the sequence contains
+    all the culprit test cases"""
+
+    def __init__(self, culprits, jobs=1):
+        self.culprits = culprits
+        self.jobs = jobs
+        self.runs = []
+
+    def run(self, sequences):
+        res = []
+        for seq in sequences:
+            seq = list(seq)
+            self.runs.append(seq)
+            if len(self.runs) > 1000:
+                raise Exception("ddmin did not terminate")
+            res.append(all([t in seq for t in self.culprits]))
+        return res
+
+class TestDdmin(unittest.TestCase):
+    tests = ['t%d' % i for i in range(8)] + ['X']
+
+    def test_single_culprit(self):
+        for jobs in [1, 4]:
+            runner = FakeRunner(['t3'], jobs=jobs)
+            self.assertEqual(min_seq.ddmin(runner, self.tests), ['t3', 'X'])
+
+    def test_interaction(self):
+        for jobs in [1, 4]:
+            runner = FakeRunner(['t1', 't6'], jobs=jobs)
+            self.assertEqual(min_seq.ddmin(runner, self.tests),
+                             ['t1', 't6', 'X'])
+
+    def test_fails_alone(self):
+        runner = FakeRunner([])
+        self.assertEqual(min_seq.ddmin(runner, self.tests), ['X'])
+
+    def test_nothing_removable(self):
+        runner = FakeRunner(['t0', 't1'])
+        self.assertEqual(min_seq.ddmin(runner, ['t0', 't1', 'X']),
+                         ['t0', 't1', 'X'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,13 +7,304 @@
 import re
 import os
 import posixpath
+import socket
+import struct
 import time
 import subprocess
 import logging
 import wpaspy
+import utils
 
 logger = logging.getLogger()
 
+# wlantest control interface (wlantest/wlantest_ctrl.h)
+WLANTEST_SOCK_NAME = "w1.fi.wlantest"
+WLANTEST_CTRL_MAX_RESP_LEN = 1000
+
+WLANTEST_CTRL_SUCCESS = 0
+WLANTEST_CTRL_FAILURE = 1
+WLANTEST_CTRL_PING = 4
+WLANTEST_CTRL_FLUSH = 8
+WLANTEST_CTRL_CLEAR_STA_COUNTERS = 9
+WLANTEST_CTRL_CLEAR_BSS_COUNTERS = 10
+WLANTEST_CTRL_GET_STA_COUNTER = 11
+WLANTEST_CTRL_GET_BSS_COUNTER = 12
+WLANTEST_CTRL_ADD_PASSPHRASE = 15
+WLANTEST_CTRL_INFO_STA = 16
+WLANTEST_CTRL_INFO_BSS = 17
+WLANTEST_CTRL_CLEAR_TDLS_COUNTERS = 19
+WLANTEST_CTRL_GET_TDLS_COUNTER = 20
+WLANTEST_CTRL_RELOG = 21
+WLANTEST_CTRL_GET_TX_TID = 22
+WLANTEST_CTRL_GET_RX_TID = 23
+
+WLANTEST_ATTR_BSSID = 0
+WLANTEST_ATTR_STA_ADDR = 1
+WLANTEST_ATTR_STA_COUNTER = 2
+WLANTEST_ATTR_BSS_COUNTER = 3
+WLANTEST_ATTR_COUNTER = 4
+WLANTEST_ATTR_PASSPHRASE = 9
+WLANTEST_ATTR_STA_INFO = 10
+WLANTEST_ATTR_BSS_INFO = 11
+WLANTEST_ATTR_INFO = 12
+WLANTEST_ATTR_TDLS_COUNTER = 14
+WLANTEST_ATTR_STA2_ADDR = 15
+WLANTEST_ATTR_WEPKEY = 16
+WLANTEST_ATTR_TID = 17
+
+# Counter and info names as used by wlantest_cli, in enum order
+bss_counters = ["valid_bip_mmie", "invalid_bip_mmie", "missing_bip_mmie",
+                "bip_deauth", "bip_disassoc", "probe_response"]
+sta_counters = ["auth_tx", "auth_rx", "assocreq_tx", "reassocreq_tx",
+                "ptk_learned", "valid_deauth_tx", "valid_deauth_rx",
+                "invalid_deauth_tx", "invalid_deauth_rx",
+                "valid_disassoc_tx", "valid_disassoc_rx",
+                "invalid_disassoc_tx", "invalid_disassoc_rx",
+                "valid_saqueryreq_tx", "valid_saqueryreq_rx",
+                "invalid_saqueryreq_tx", "invalid_saqueryreq_rx",
+                "valid_saqueryresp_tx", "valid_saqueryresp_rx",
+                "invalid_saqueryresp_tx", "invalid_saqueryresp_rx",
+                "ping_ok", "assocresp_comeback", "reassocresp_comeback",
+                "ping_ok_first_assoc", "valid_deauth_rx_ack",
+                "valid_disassoc_rx_ack", "invalid_deauth_rx_ack",
+                "invalid_disassoc_rx_ack", "deauth_rx_asleep",
+                "deauth_rx_awake", "disassoc_rx_asleep", "disassoc_rx_awake",
+                "prot_data_tx", "deauth_rx_rc6", "deauth_rx_rc7",
+                "disassoc_rx_rc6", "disassoc_rx_rc7"]
+tdls_counters = ["valid_direct_link", "invalid_direct_link", "valid_ap_path",
+                 "invalid_ap_path", "setup_req", "setup_resp_ok",
+                 "setup_resp_fail", "setup_conf_ok", "setup_conf_fail",
+                 "teardown"]
+sta_infos = ["proto", "pairwise", "key_mgmt", "rsn_capab", "state", "gtk"]
+bss_infos = ["proto", "pairwise", "group", "group_mgmt", "key_mgmt",
+             "rsn_capab"]
+
+def _attr(attr, data):
+    return struct.pack('>II', attr, len(data)) + data
+
+def _attr_be32(attr, val):
+    return _attr(attr, struct.pack('>I', val))
+
+def _attr_addr(attr, addr):
+    val = bytes.fromhex(addr.replace(':', ''))
+    if len(val) != 6:
+        raise ValueError("Invalid address '%s'" % addr)
+    return _attr(attr, val)
+
+def _index(names, name):
+    try:
+        return names.index(name.lower())
+    except ValueError:
+        raise ValueError("Unknown name '%s'" % name)
+
+class WlantestCtrl:
+    """Client for the wlantest control socket
+
+    This talks the same binary protocol as wlantest_cli over a single
+    connection that is kept open between the requests. The methods return
+    None if wlantest reports a failure (e.g., unknown BSS or STA)."""
+
+    def __init__(self, timeout=5):
+        self.s = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.s.settimeout(timeout)
+        try:
+            self.s.connect('\0' + WLANTEST_SOCK_NAME)
+        except OSError:
+            self.s.close()
+            raise
+
+    def close(self):
+        self.s.close()
+
+    def _recv(self):
+        resp = self.s.recv(WLANTEST_CTRL_MAX_RESP_LEN)
+        if len(resp) < 4:
+            raise OSError("wlantest closed the control connection")
+        return struct.unpack('>I', resp[:4])[0], resp[4:]
+
+    def _resync(self):
+        # Some of the wlantest handlers send a second failure response
+        # when the BSS is not found, so discard responses until the reply
+        # to a PING shows up.
+        self.s.send(struct.pack('>I', WLANTEST_CTRL_PING))
+        while self._recv()[0] != WLANTEST_CTRL_SUCCESS:
+            pass
+
+    def request(self, cmd, attrs=[]):
+        """Send a command and return the attributes of the response as a
+        dict or None on failure"""
+        self.s.send(struct.pack('>I', cmd) + b''.join(attrs))
+        status, data = self._recv()
+        if status != WLANTEST_CTRL_SUCCESS:
+            self._resync()
+            return None
+        res = {}
+        while len(data) >= 8:
+            attr, alen = struct.unpack('>II', data[:8])
+            res[attr] = data[8:8 + alen]
+            data = data[8 + alen:]
+        return res
+
+    def _counter(self, cmd, attrs):
+        res = self.request(cmd, attrs)
+        if res is None or len(res.get(WLANTEST_ATTR_COUNTER, b'')) != 4:
+            return None
+        return struct.unpack('>I', res[WLANTEST_ATTR_COUNTER])[0]
+
+    def _info(self, cmd, attrs):
+        res = self.request(cmd, attrs)
+        if res is None or WLANTEST_ATTR_INFO not in res:
+            return None
+        return res[WLANTEST_ATTR_INFO].decode(errors='replace')
+
+    def simple(self, cmd, attrs=[]):
+        return self.request(cmd, attrs) is not None
+
+    def get_bss_counter(self, field, bssid):
+        return self._counter(WLANTEST_CTRL_GET_BSS_COUNTER,
+                             [_attr_be32(WLANTEST_ATTR_BSS_COUNTER,
+                                         _index(bss_counters, field)),
+                              _attr_addr(WLANTEST_ATTR_BSSID, bssid)])
+
+    def get_sta_counter(self, field, bssid, addr):
+        return self._counter(WLANTEST_CTRL_GET_STA_COUNTER,
+                             [_attr_be32(WLANTEST_ATTR_STA_COUNTER,
+                                         _index(sta_counters, field)),
+                              _attr_addr(WLANTEST_ATTR_BSSID, bssid),
+                              _attr_addr(WLANTEST_ATTR_STA_ADDR, addr)])
+
+    def get_tdls_counter(self, field, bssid, addr1, addr2):
+        return self._counter(WLANTEST_CTRL_GET_TDLS_COUNTER,
+                             [_attr_be32(WLANTEST_ATTR_TDLS_COUNTER,
+                                         _index(tdls_counters, field)),
+                              _attr_addr(WLANTEST_ATTR_BSSID, bssid),
+                              _attr_addr(WLANTEST_ATTR_STA_ADDR, addr1),
+                              _attr_addr(WLANTEST_ATTR_STA2_ADDR, addr2)])
+
+    def get_tid(self, cmd, bssid, addr, tid):
+        return self._counter(cmd,
+                             [_attr_addr(WLANTEST_ATTR_BSSID, bssid),
+                              _attr_addr(WLANTEST_ATTR_STA_ADDR, addr),
+                              _attr_be32(WLANTEST_ATTR_TID, int(tid))])
+
+    def info_bss(self, field, bssid):
+        return self._info(WLANTEST_CTRL_INFO_BSS,
+                          [_attr_be32(WLANTEST_ATTR_BSS_INFO,
+                                      _index(bss_infos, field)),
+                           _attr_addr(WLANTEST_ATTR_BSSID, bssid)])
+
+    def info_sta(self, field, bssid, addr):
+        return self._info(WLANTEST_CTRL_INFO_STA,
+                          [_attr_be32(WLANTEST_ATTR_STA_INFO,
+                                      _index(sta_infos, field)),
+                           _attr_addr(WLANTEST_ATTR_BSSID, bssid),
+                           _attr_addr(WLANTEST_ATTR_STA_ADDR, addr)])
+
+    def get_bss_counters(self, bssid):
+        """Return all the BSS counters as a dict or None if the BSS is not
+        known"""
+        res = {}
+        for field in bss_counters:
+            val = self.get_bss_counter(field, bssid)
+            if val is None:
+                return None
+            res[field] = val
+        return res
+
+    def get_sta_counters(self, bssid, addr):
+        """Return all the STA counters as a dict or None if the STA is not
+        known"""
+        res = {}
+        for field in sta_counters:
+            val = self.get_sta_counter(field, bssid, addr)
+            if val is None:
+                return None
+            res[field] = val
+        return res
+
+    def get_tid_counters(self, bssid, addr):
+        tx = {}
+        rx = {}
+        for tid in range(0, 17):
+            tx[tid] = self.get_tid(WLANTEST_CTRL_GET_TX_TID, bssid, addr, tid)
+            rx[tid] = self.get_tid(WLANTEST_CTRL_GET_RX_TID, bssid, addr, tid)
+            if tx[tid] is None or rx[tid] is None:
+                return None
+        return [tx, rx]
+
+    def cli_cmd(self, params):
+        """Run a wlantest_cli command and return its output in the same
+        format as wlantest_cli would print it"""
+        cmd = params[0]
+        args = params[1:]
+        try:
+            if cmd in ("get_bss_counter", "get_sta_counter",
+                       "get_tdls_counter"):
+                res = getattr(self, cmd)(*args)
+            elif cmd in ("get_tx_tid", "get_rx_tid"):
+                res = self.get_tid(WLANTEST_CTRL_GET_TX_TID
+                                   if cmd == "get_tx_tid" else
+                                   WLANTEST_CTRL_GET_RX_TID, *args)
+            elif cmd in ("info_bss", "info_sta"):
+                res = getattr(self, cmd)(*args)
+            elif cmd in ("flush", "relog"):
+                res = self.simple(WLANTEST_CTRL_FLUSH if cmd == "flush" else
+                                  WLANTEST_CTRL_RELOG)
+            elif cmd == "add_passphrase":
+                if len(args[0]) < 8 or len(args[0]) > 63:
+                    raise ValueError("Invalid passphrase")
+                attrs = [_attr(WLANTEST_ATTR_PASSPHRASE, args[0].encode())]
+                if len(args) > 1:
+                    attrs.append(_attr_addr(WLANTEST_ATTR_BSSID, args[1]))
+                res = self.simple(WLANTEST_CTRL_ADD_PASSPHRASE, attrs)
+            elif cmd == "add_wepkey":
+                res = self.simple(WLANTEST_CTRL_ADD_PASSPHRASE,
+                                  [_attr(WLANTEST_ATTR_WEPKEY,
+                                         args[0].encode())])
+            elif cmd == "clear_bss_counters":
+                res = self.simple(WLANTEST_CTRL_CLEAR_BSS_COUNTERS,
+                                  [_attr_addr(WLANTEST_ATTR_BSSID, args[0])])
+            elif cmd == "clear_sta_counters":
+                res = self.simple(WLANTEST_CTRL_CLEAR_STA_COUNTERS,
+                                  [_attr_addr(WLANTEST_ATTR_BSSID, args[0]),
+                                   _attr_addr(WLANTEST_ATTR_STA_ADDR,
+                                              args[1])])
+            elif cmd == "clear_tdls_counters":
+                res = self.simple(WLANTEST_CTRL_CLEAR_TDLS_COUNTERS,
+                                  [_attr_addr(WLANTEST_ATTR_BSSID, args[0]),
+                                   _attr_addr(WLANTEST_ATTR_STA_ADDR,
+                                              args[1]),
+                                   _attr_addr(WLANTEST_ATTR_STA2_ADDR,
+                                              args[2])])
+            else:
+                raise ValueError("Unsupported command " + cmd)
+        except (ValueError, IndexError, TypeError):
+            return "FAIL\n"
+        if res is None or res is False:
+            return "FAIL\n"
+        if res is True:
+            return "OK\n"
+        return "%s\n" % res
+
+_ctrl = None
+
+def get_ctrl():
+    """Return the shared control connection to the local wlantest or None
+    if wlantest is not running"""
+    global _ctrl
+    if _ctrl is None:
+        try:
+            _ctrl = WlantestCtrl()
+        except OSError:
+            return None
+    return _ctrl
+
+def close_ctrl():
+    global _ctrl
+    if _ctrl is not None:
+        _ctrl.close()
+        _ctrl = None
+
 class Wlantest:
     remote_host = None
     setup_params = None
@@ -111,8 +402,16 @@ class Wlantest:
             if ret[0] != 0:
                 raise Exception("wlantest_cli failed")
             return ret[1]
-        else:
-            return subprocess.check_output([self.wlantest_cli] + params).decode()
+        ctrl = get_ctrl()
+        if ctrl is not None:
+            try:
+                return ctrl.cli_cmd(params)
+            except OSError as e:
+                # wlantest was restarted or stopped; try to reconnect on the
+                # next command and use wlantest_cli for this one.
+                logger.debug("wlantest control connection failed: " + str(e))
+                close_ctrl()
+        return subprocess.check_output([self.wlantest_cli] + params).decode()
 
     def flush(self):
         res = self.cli_cmd(["flush"])
@@ -236,7 +535,50 @@ class Wlantest:
             raise Exception("wlantest_cli command failed")
         return int(res)
 
+    def _local_ctrl(self):
+        if self.remote_host is not None:
+            return None
+        return get_ctrl()
+
+    def get_bss_counters(self, bssid):
+        """Return a snapshot of all the BSS counters as a dict"""
+        ctrl = self._local_ctrl()
+        if ctrl is not None:
+            try:
+                res = ctrl.get_bss_counters(bssid)
+                if res is None:
+                    # Same as get_bss_counter() for an unknown BSS
+                    return {field: 0 for field in bss_counters}
+                return res
+            except OSError:
+                close_ctrl()
+        return {field: self.get_bss_counter(field, bssid)
+                for field in bss_counters}
+
+    def get_sta_counters(self, bssid, addr):
+        """Return a snapshot of all the STA counters as a dict"""
+        ctrl = self._local_ctrl()
+        if ctrl is not None:
+            try:
+                res = ctrl.get_sta_counters(bssid, addr)
+                if res is None:
+                    raise Exception("wlantest did not know STA " + addr)
+                return res
+            except OSError:
+                close_ctrl()
+        return {field: self.get_sta_counter(field, bssid, addr)
+                for field in sta_counters}
+
     def get_tid_counters(self, bssid, addr):
+        ctrl = self._local_ctrl()
+        if ctrl is not None:
+            try:
+                res = ctrl.get_tid_counters(bssid, addr)
+                if res is None:
+                    raise Exception("wlantest_cli command failed")
+                return res
+            except OSError:
+                close_ctrl()
         tx = {}
         rx = {}
         for tid in range(0, 17):
@@ -244,10 +586,29 @@ class Wlantest:
             rx[tid] = self.get_rx_tid(bssid, addr, tid)
         return [tx, rx]
 
+def capture_started(pid):
+    """Check whether a process has opened its packet socket for capturing"""
+    try:
+        with open('/proc/%d/net/packet' % pid, 'r') as f:
+            inodes = set([l.split()[-1] for l in f.readlines()[1:]])
+        fds = os.listdir('/proc/%d/fd' % pid)
+    except FileNotFoundError:
+        # The process is gone, so there is nothing to wait for
+        return True
+    for fd in fds:
+        try:
+            link = os.readlink('/proc/%d/fd/%s' % (pid, fd))
+        except FileNotFoundError:
+            continue
+        if link.startswith('socket:[') and link[8:-1] in inodes:
+            return True
+    return False
+
 class WlantestCapture:
     def __init__(self, ifname, output, netns=None):
         self.cmd = None
         self.ifname = ifname
+        self.output = output
         if os.path.isfile('../../wlantest/wlantest'):
             bin = '../../wlantest/wlantest'
         else:
@@ -259,15 +620,17 @@ class WlantestCapture:
         self.cmd = subprocess.Popen(args,
                                     stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE)
-        time.sleep(1)
+        utils.wait_until(lambda: capture_started(self.cmd.pid), timeout=1,
+                         interval=0.01)
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
-        time.sleep(0.5)
+        # Let the last frames get captured before stopping wlantest; wait
+        # longer if wlantest is still writing the file
+        utils.wait_file_idle(self.output, min_wait=0.5, idle=0.1, timeout=1)
         self.close()
-        time.sleep(0.5)
 
     def __del__(self):
         if self.cmd:
@@ -9,10 +9,14 @@ import time
 import logging
 import binascii
 import re
-import struct
 import wpaspy
 import remotehost
 import subprocess
+import eventbuffer
+import frames
+import instrument
+import utils
+import nl80211
 from remotectrl import RemoteCtrl
 
 logger = logging.getLogger()
@@ -270,6 +274,11 @@ class WpaSupplicant:
         logger.debug(self.dbg + ": CTRL: " + cmd)
         return self.ctrl.request(cmd, timeout=timeout)
 
+    def pipeline(self, cmds, timeout=10):
+        for cmd in cmds:
+            logger.debug(self.dbg + ": CTRL: " + cmd)
+        return self.ctrl.pipeline(cmds, timeout=timeout)
+
     def global_request(self, cmd):
         if self.global_iface is None:
             return self.request(cmd)
@@ -278,6 +287,14 @@ class WpaSupplicant:
             logger.debug(self.global_dbg + ifname + ": CTRL(global): " + cmd)
             return self.global_ctrl.request(cmd)
 
+    def global_pipeline(self, cmds):
+        if self.global_iface is None:
+            return self.pipeline(cmds)
+        ifname = self.ifname or self.global_iface
+        for cmd in cmds:
+            logger.debug(self.global_dbg + ifname + ": CTRL(global): " + cmd)
+        return self.global_ctrl.pipeline(cmds)
+
     @property
     def group_dbg(self):
         if self._group_dbg is not None:
@@ -312,26 +329,26 @@ class WpaSupplicant:
         res = self.request("FLUSH")
         if "OK" not in res:
             logger.info("FLUSH to " + self.ifname + " failed: " + res)
-        self.global_request("REMOVE_NETWORK all")
-        self.global_request("SET p2p_no_group_iface 1")
-        self.global_request("P2P_FLUSH")
+        self.global_pipeline(["REMOVE_NETWORK all",
+                              "SET p2p_no_group_iface 1",
+                              "P2P_FLUSH"])
         self.close_monitor_group()
         self.group_ifname = None
         self.dump_monitor()
 
-        iter = 0
-        while iter < 60:
+        def scan_idle():
             state1 = self.get_driver_status_field("scan_state")
             p2pdev = "p2p-dev-" + self.ifname
             state2 = self.get_driver_status_field("scan_state", ifname=p2pdev)
             states = str(state1) + " " + str(state2)
-            if "SCAN_STARTED" in states or "SCAN_REQUESTED" in states:
-                logger.info(self.ifname + ": Waiting for scan operation to complete before continuing")
-                time.sleep(1)
-            else:
-                break
-            iter = iter + 1
-        if iter == 60:
+            return "SCAN_STARTED" not in states and \
+                "SCAN_REQUESTED" not in states
+
+        scan_in_progress = not scan_idle()
+        if scan_in_progress:
+            logger.info(self.ifname + ": Waiting for scan operation to complete before continuing")
+            idle = self.wait_scan_idle(scan_idle)
+        if scan_in_progress and not idle:
             logger.error(self.ifname + ": Driver scan state did not clear")
             print("Trying to clear cfg80211/mac80211 scan state")
             status, buf = self.host.execute(["ifconfig", self.ifname, "down"])
@@ -342,7 +359,7 @@ class WpaSupplicant:
             if status != 0:
                 logger.info("ifconfig failed: " + buf)
                 logger.info(status)
-        if iter > 0:
+        if scan_in_progress:
             # The ongoing scan could have discovered BSSes or P2P peers
             logger.info("Run FLUSH again since scan was in progress")
             self.request("FLUSH")
@@ -351,6 +368,25 @@ class WpaSupplicant:
         if not self.ping():
             logger.info("No PING response from " + self.ifname + " after reset")
 
+    def wait_scan_idle(self, scan_idle, timeout=60):
+        monitor = None
+        if self.hostname is None:
+            try:
+                monitor = nl80211.ScanMonitor()
+            except Exception as e:
+                logger.debug("No nl80211 scan events: " + str(e))
+        try:
+            # Woken up by the nl80211 scan events (including the ones for
+            # the P2P Device interface) and by the control interface scan
+            # events that wpa_supplicant sends after having updated its scan
+            # state. The state is still polled in case an event is missed.
+            return utils.wait_until(scan_idle, timeout=timeout, interval=0.5,
+                                    dev=self,
+                                    wakeups=[monitor] if monitor else None)
+        finally:
+            if monitor:
+                monitor.close()
+
     def set(self, field, value, allow_fail=False):
         if "OK" not in self.request("SET " + field + " " + value):
             if allow_fail:
@@ -880,27 +916,20 @@ class WpaSupplicant:
             return self.group_form_result(ev, expect_failure, go_neg_res)
         raise Exception("P2P_CONNECT failed")
 
-    def _wait_event(self, mon, pfx, events, timeout):
+    def _wait_event(self, mon, pfx, events, timeout, since=None):
         if not isinstance(events, list):
             raise Exception("WpaSupplicant._wait_event() called with incorrect events argument type")
-        start = os.times()[4]
-        while True:
-            while mon.pending():
-                ev = mon.recv()
-                logger.debug(self.dbg + pfx + ev)
-                for event in events:
-                    if event in ev:
-                        return ev
-            now = os.times()[4]
-            remaining = start + timeout - now
-            if remaining <= 0:
-                break
-            if not mon.pending(timeout=remaining):
-                break
-        return None
+        if not instrument.enabled:
+            return eventbuffer.wait_event(mon, self.dbg + pfx, events,
+                                          timeout, since=since)
+        start = time.perf_counter()
+        ev = eventbuffer.wait_event(mon, self.dbg + pfx, events, timeout,
+                                    since=since)
+        instrument.wait_done(events, start, timeout, ev)
+        return ev
 
-    def wait_event(self, events, timeout=10):
-        return self._wait_event(self.mon, ": ", events, timeout)
+    def wait_event(self, events, timeout=10, since=None):
+        return self._wait_event(self.mon, ": ", events, timeout, since=since)
 
     def wait_global_event(self, events, timeout):
         if self.global_iface is None:
@@ -914,24 +943,15 @@ class WpaSupplicant:
         if self.group_ifname and self.group_ifname != self.ifname:
             if self.gctrl_mon is None:
                 return None
-            start = os.times()[4]
-            while True:
-                while self.gctrl_mon.pending():
-                    ev = self.gctrl_mon.recv()
-                    logger.debug(self.group_dbg + "(group): " + ev)
-                    for event in events:
-                        if event in ev:
-                            return ev
-                now = os.times()[4]
-                remaining = start + timeout - now
-                if remaining <= 0:
-                    break
-                if not self.gctrl_mon.pending(timeout=remaining):
-                    break
-            return None
+            return eventbuffer.wait_event(self.gctrl_mon,
+                                          self.group_dbg + "(group): ",
+                                          events, timeout)
 
         return self.wait_event(events, timeout)
 
+    def mark_events(self):
+        return eventbuffer.read_pending(self.mon, self.dbg + ": ")
+
     def wait_go_ending_session(self):
         self.close_monitor_group()
         timeout = 3 if self.hostname is None else 10
@@ -944,14 +964,11 @@ class WpaSupplicant:
     def dump_monitor(self, mon=True, global_mon=True):
         count_iface = 0
         count_global = 0
-        while mon and self.monitor and self.mon.pending():
-            ev = self.mon.recv()
-            logger.debug(self.dbg + ": " + ev)
-            count_iface += 1
-        while global_mon and self.monitor and self.global_mon and self.global_mon.pending():
-            ev = self.global_mon.recv()
-            logger.debug(self.global_dbg + self.ifname + "(global): " + ev)
-            count_global += 1
+        if mon and self.monitor:
+            count_iface = eventbuffer.dump_events(self.mon, self.dbg + ": ")
+        if global_mon and self.monitor and self.global_mon:
+            count_global = eventbuffer.dump_events(self.global_mon,
+                                                   self.global_dbg + self.ifname + "(global): ")
         return (count_iface, count_global)
 
     def remove_group(self, ifname=None):
@@ -1099,10 +1116,15 @@ class WpaSupplicant:
     def connect(self, ssid=None, ssid2=None, timeout=None, **kwargs):
         logger.info("Connect STA " + self.ifname + " to AP")
         id = self.add_network()
+        cmds = []
+        def set_network(field, value):
+            cmds.append("SET_NETWORK " + str(id) + " " + field + " " + value)
+        def set_network_quoted(field, value):
+            cmds.append("SET_NETWORK " + str(id) + " " + field + ' "' + value + '"')
         if ssid:
-            self.set_network_quoted(id, "ssid", ssid)
+            set_network_quoted("ssid", ssid)
         elif ssid2:
-            self.set_network(id, "ssid", ssid2)
+            set_network("ssid", ssid2)
 
         quoted = ["psk", "identity", "anonymous_identity", "password",
                   "machine_identity", "machine_password",
@@ -1118,7 +1140,7 @@ class WpaSupplicant:
                   "imsi_identity", "imsi_privacy_cert", "imsi_privacy_attr"]
         for field in quoted:
             if field in kwargs and kwargs[field]:
-                self.set_network_quoted(id, field, kwargs[field])
+                set_network_quoted(field, kwargs[field])
 
         not_quoted = ["proto", "key_mgmt", "ieee80211w", "pairwise",
                       "group", "wep_key0", "wep_key1", "wep_key2", "wep_key3",
@@ -1152,7 +1174,7 @@ class WpaSupplicant:
                       "eap_over_auth_frame"]
         for field in not_quoted:
             if field in kwargs and kwargs[field]:
-                self.set_network(id, field, kwargs[field])
+                set_network(field, kwargs[field])
 
         if timeout is None:
             if "eap" in kwargs:
@@ -1170,17 +1192,20 @@ class WpaSupplicant:
             raise Exception("Unknown WpaSupplicant::connect() arguments: " + str(unknown))
 
         if "raw_identity" in kwargs and kwargs['raw_identity']:
-            self.set_network(id, "identity", kwargs['raw_identity'])
+            set_network("identity", kwargs['raw_identity'])
         if "raw_psk" in kwargs and kwargs['raw_psk']:
-            self.set_network(id, "psk", kwargs['raw_psk'])
+            set_network("psk", kwargs['raw_psk'])
         if "password_hex" in kwargs and kwargs['password_hex']:
-            self.set_network(id, "password", kwargs['password_hex'])
+            set_network("password", kwargs['password_hex'])
         if "peerkey" in kwargs and kwargs['peerkey']:
-            self.set_network(id, "peerkey", "1")
+            set_network("peerkey", "1")
         if "okc" in kwargs and kwargs['okc']:
-            self.set_network(id, "proactive_key_caching", "1")
+            set_network("proactive_key_caching", "1")
         if "ocsp" in kwargs and kwargs['ocsp']:
-            self.set_network(id, "ocsp", str(kwargs['ocsp']))
+            set_network("ocsp", str(kwargs['ocsp']))
+        for res in self.pipeline(cmds):
+            if "FAIL" in res:
+                raise Exception("SET_NETWORK failed")
         if "only_add_network" in kwargs and kwargs['only_add_network']:
             return id
         if "wait_connect" not in kwargs or kwargs['wait_connect']:
@@ -1446,20 +1471,7 @@ class WpaSupplicant:
         frame = binascii.unhexlify(items[4])
         msg['frame'] = frame
 
-        hdr = struct.unpack('<HH6B6B6BH', frame[0:24])
-        msg['fc'] = hdr[0]
-        msg['subtype'] = (hdr[0] >> 4) & 0xf
-        hdr = hdr[1:]
-        msg['duration'] = hdr[0]
-        hdr = hdr[1:]
-        msg['da'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['sa'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['bssid'] = "%02x:%02x:%02x:%02x:%02x:%02x" % hdr[0:6]
-        hdr = hdr[6:]
-        msg['seq_ctrl'] = hdr[0]
-        msg['payload'] = frame[24:]
+        frames.parse_mgmt_header(frame, msg)
 
         return msg
 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Unit tests for wpaspy.AsyncCtrl reply matching
+#
+# This software may be distributed under the terms of the BSD license.
+# See README for more details.
+
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+
+import wpaspy
+
+class TestAsyncCtrl(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'ctrl')
+        self.srv = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.srv.bind(self.path)
+        self.srv.setblocking(False)
+
+    def tearDown(self):
+        self.srv.close()
+        os.unlink(self.path)
+        os.rmdir(self.dir)
+
+    async def recv_request(self):
+        loop = asyncio.get_running_loop()
+        return await loop.sock_recvfrom(self.srv, 4096)
+
+    def run_test(self, coro):
+        asyncio.run(asyncio.wait_for(coro, 5))
+
+    def test_reply_order(self):
+        async def run():
+            async with wpaspy.AsyncCtrl(self.path) as ctrl:
+                task = asyncio.ensure_future(
+                    ctrl.pipeline(["CMD%d" % i for i in range(5)]))
+                reqs = [await self.recv_request() for i in range(5)]
+                for cmd, addr in reqs:
+                    self.srv.sendto(b"REPLY-" + cmd, addr)
+                replies = await task
+                self.assertEqual(replies,
+                                 ["REPLY-CMD%d" % i for i in range(5)])
+        self.run_test(run())
+
+    def test_event_between_replies(self):
+        async def run():
+            events = []
+            async with wpaspy.AsyncCtrl(self.path,
+                                        event_cb=events.append) as ctrl:
+                task = asyncio.ensure_future(ctrl.request("PING"))
+                cmd, addr = await self.recv_request()
+                self.srv.sendto(b"<3>CTRL-EVENT-TEST", addr)
+                self.srv.sendto(b"PONG", addr)
+                self.assertEqual(await task, "PONG")
+                self.assertEqual(events, ["<3>CTRL-EVENT-TEST"])
+        self.run_test(run())
+
+    def test_late_reply_after_timeout(self):
+        async def run():
+            async with wpaspy.AsyncCtrl(self.path) as ctrl:
+                with self.assertRaises(Exception):
+                    await ctrl.request("SLOW", timeout=0.1)
+                slow, addr = await self.recv_request()
+                task = asyncio.ensure_future(ctrl.request("PING"))
+                ping, addr = await self.recv_request()
+                self.assertEqual(ping, b"PING")
+                self.srv.sendto(b"LATE", addr)
+                self.srv.sendto(b"PONG", addr)
+                self.assertEqual(await task, "PONG")
+        self.run_test(run())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,9 +10,21 @@ import os
 import stat
 import socket
 import select
+import time
+import asyncio
+import collections
 
 counter = 0
 
+# Optional function that is called with the command and the time it took
+# (in seconds) after each Ctrl.request() and for each command of
+# Ctrl.pipeline(), including the ones that timed out
+request_hook = None
+
+# Largest possible UDP payload; also more than any control interface reply
+# or event message is expected to be.
+RECV_BUF_SIZE = 65536
+
 class Ctrl:
     def __init__(self, path, port=9877):
         global counter
@@ -20,6 +32,8 @@ class Ctrl:
         self.attached = False
         self.path = path
         self.port = port
+        self.buf = bytearray(RECV_BUF_SIZE)
+        self.bufview = memoryview(self.buf)
 
         self.udp = False
         if not path.startswith('/'):
@@ -80,7 +94,7 @@ class Ctrl:
                 os.unlink(self.local)
             self.started = False
 
-    def request(self, cmd, timeout=10):
+    def _send(self, cmd):
         if type(cmd) == str:
             try:
                 cmd2 = cmd.encode()
@@ -91,15 +105,54 @@ class Ctrl:
             self.s.sendto(self.cookie + cmd, self.sockaddr)
         else:
             self.s.send(cmd)
-        [r, w, e] = select.select([self.s], [], [], timeout)
-        if r:
-            res = self.s.recv(4096).decode()
-            try:
-                r = str(res)
-            except UnicodeDecodeError as e:
-                r = res
-            return r
-        raise Exception("Timeout on waiting response")
+
+    def request(self, cmd, timeout=10):
+        hook = request_hook
+        if hook:
+            start = time.perf_counter()
+        try:
+            self._send(cmd)
+            [r, w, e] = select.select([self.s], [], [], timeout)
+            if r:
+                return self.recv()
+            raise Exception("Timeout on waiting response")
+        finally:
+            if hook:
+                hook(cmd, time.perf_counter() - start)
+
+    def pipeline(self, cmds, timeout=10, window=8):
+        # Send the commands back to back and collect the replies in order.
+        # The number of outstanding requests is limited since the receive
+        # queue of a UNIX domain datagram socket is short.
+        replies = []
+        sent = 0
+        # Each command is timed from its transmission to its reply
+        hook = request_hook
+        start = []
+        try:
+            while len(replies) < len(cmds):
+                while sent < len(cmds) and sent - len(replies) < window:
+                    if hook:
+                        start.append(time.perf_counter())
+                    self._send(cmds[sent])
+                    sent += 1
+                [r, w, e] = select.select([self.s], [], [], timeout)
+                if not r:
+                    raise Exception("Timeout on waiting response")
+                res = self.recv()
+                if self.attached and is_event(res):
+                    continue
+                if hook:
+                    hook(cmds[len(replies)],
+                         time.perf_counter() - start[len(replies)])
+                replies.append(res)
+        finally:
+            if hook:
+                # Commands that did not get a reply
+                now = time.perf_counter()
+                for i in range(len(replies), sent):
+                    hook(cmds[i], now - start[i])
+        return replies
 
     def attach(self):
         if self.attached:
@@ -140,10 +193,216 @@ class Ctrl:
             return True
         return False
 
+    def recv_raw(self):
+        # Receive the next message into the reusable buffer. The returned
+        # memoryview is valid only until the next call.
+        n = self.s.recv_into(self.buf, 0, getattr(socket, 'MSG_TRUNC', 0))
+        if n > len(self.buf):
+            # MSG_TRUNC returns the full length of the datagram even if it
+            # did not fit into the buffer. The rest of it was discarded, so
+            # make the buffer large enough for the next one and report this.
+            self.buf = bytearray(n)
+            self.bufview = memoryview(self.buf)
+            raise Exception("Truncated control interface message (%d bytes)" % n)
+        return self.bufview[:n]
+
     def recv(self):
-        res = self.s.recv(4096).decode()
+        return str(self.recv_raw(), 'utf-8')
+
+def is_event(msg):
+    # Unsolicited messages from an attached control interface use the same
+    # socket as request replies; tell them apart the same way wpa_ctrl does.
+    return msg.startswith('<') or msg.startswith('IFNAME=')
+
+class _AsyncCtrlProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ctrl):
+        self.ctrl = ctrl
+
+    def datagram_received(self, data, addr):
+        self.ctrl._received(data)
+
+    def error_received(self, exc):
+        self.ctrl._failed(exc)
+
+    def connection_lost(self, exc):
+        if exc:
+            self.ctrl._failed(exc)
+
+class AsyncCtrl:
+    def __init__(self, path, port=9877, event_cb=None):
+        self.started = False
+        self.attached = False
+        self.path = path
+        self.port = port
+        self.event_cb = event_cb
+        self.transport = None
+        self.local = None
+        self.cookie = None
+        self._replies = collections.deque()
+        self._events = asyncio.Queue()
+
+        self.udp = False
+        if not path.startswith('/'):
+            try:
+                mode = os.stat(path).st_mode
+                if not stat.S_ISSOCK(mode):
+                    self.udp = True
+            except:
+                self.udp = True
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        self.close()
+
+    async def open(self, timeout=5):
+        global counter
+        loop = asyncio.get_running_loop()
+        if not self.udp:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.local = "/tmp/wpa_ctrl_" + str(os.getpid()) + '-' + str(counter)
+            counter += 1
+            try:
+                s.bind(self.local)
+                s.connect(self.path)
+                s.setblocking(False)
+                self.transport, proto = await loop.create_datagram_endpoint(
+                    lambda: _AsyncCtrlProtocol(self), sock=s)
+            except:
+                s.close()
+                os.unlink(self.local)
+                raise
+            self.started = True
+            return
+
+        ai_list = socket.getaddrinfo(self.path, self.port, socket.AF_INET,
+                                     socket.SOCK_DGRAM)
+        for af, socktype, proto, cn, sockaddr in ai_list:
+            break
+        self.transport, proto = await loop.create_datagram_endpoint(
+            lambda: _AsyncCtrlProtocol(self), remote_addr=sockaddr)
+        self.started = True
         try:
-            r = str(res)
-        except UnicodeDecodeError as e:
-            r = res
-        return r
+            # The cookie reply is the first datagram and does not need the
+            # cookie prefix itself.
+            self.cookie = b''
+            self.cookie = (await self.request(b"GET_COOKIE",
+                                              timeout=timeout)).encode()
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if not self.started:
+            return
+        self.started = False
+        self.attached = False
+        self.transport.close()
+        self.transport = None
+        if not self.udp:
+            os.unlink(self.local)
+        while self._replies:
+            fut = self._replies.popleft()
+            if not fut.done():
+                fut.set_exception(Exception("Control interface closed"))
+
+    def _received(self, data):
+        msg = data.decode()
+        if is_event(msg):
+            if self.event_cb:
+                self.event_cb(msg)
+            else:
+                self._events.put_nowait(msg)
+            return
+        # Replies arrive in the order the requests were sent. A request that
+        # timed out keeps its (cancelled) slot so that a late reply to it is
+        # dropped here instead of being returned for the next request.
+        if not self._replies:
+            return
+        fut = self._replies.popleft()
+        if not fut.done():
+            fut.set_result(msg)
+
+    def _failed(self, exc):
+        while self._replies:
+            fut = self._replies.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+
+    def _send(self, cmd):
+        if type(cmd) == str:
+            try:
+                cmd2 = cmd.encode()
+                cmd = cmd2
+            except UnicodeDecodeError as e:
+                pass
+        if not self.started:
+            raise Exception("Control interface not open")
+        fut = asyncio.get_running_loop().create_future()
+        self._replies.append(fut)
+        if self.udp:
+            self.transport.sendto(self.cookie + cmd)
+        else:
+            self.transport.sendto(cmd)
+        return fut
+
+    async def _reply(self, fut, timeout):
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            raise Exception("Timeout on waiting response")
+
+    async def request(self, cmd, timeout=10):
+        return await self._reply(self._send(cmd), timeout)
+
+    async def pipeline(self, cmds, timeout=10, window=8):
+        replies = []
+        futs = collections.deque()
+        for cmd in cmds:
+            if len(futs) >= window:
+                replies.append(await self._reply(futs.popleft(), timeout))
+            futs.append(self._send(cmd))
+        while futs:
+            replies.append(await self._reply(futs.popleft(), timeout))
+        return replies
+
+    async def attach(self):
+        if self.attached:
+            return None
+        res = await self.request("ATTACH")
+        if "OK" in res:
+            self.attached = True
+            return None
+        raise Exception("ATTACH failed")
+
+    async def detach(self):
+        if not self.attached:
+            return None
+        while self.pending():
+            self._events.get_nowait()
+        res = await self.request("DETACH")
+        if "FAIL" not in res:
+            self.attached = False
+            return None
+        raise Exception("DETACH failed")
+
+    async def terminate(self):
+        if self.attached:
+            try:
+                await self.detach()
+            except Exception as e:
+                # Need to ignore this to allow the socket to be closed
+                self.attached = False
+        await self.request("TERMINATE")
+        self.close()
+
+    def pending(self):
+        return not self._events.empty()
+
+    async def recv(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self._events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None